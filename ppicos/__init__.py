@@ -0,0 +1,8 @@
+"""
+ppicos: convert source files of the ICOS station CH-Dav to ICOS files
+
+The modules import each other by their module name (e.g. import runner) and are
+run from this folder (python cli.py ...), or with the installed command ppicos
+(pyproject.toml), see cli.py.
+
+"""
@@ -0,0 +1,120 @@
+"""
+Process historical data over an explicit date range
+
+The daily runs search the last max_age_days before today. To process a longer,
+older period (e.g. a year after a logger was added to ppicos), the date range is
+split into partitions of one month or one week:
+
+    python cli.py backfill 10_meteo --start 2023-01-01 --end 2023-12-31 [--partition week]
+                           [--workers 4] [--memory-mb 4000] [--overwrite]
+
+- Each partition is run with IcosFormat(search_window=(first, last)). Partitions
+  overlap at the boundaries: files of the day before and after the partition are
+  also read (e.g. the record at midnight of the last day and data of the previous
+  date for DATA_COMPLEMENT_WITH_PREVIOUS_DATE), but only the days of the partition
+  are exported. The daily files are the same as the files created by daily runs.
+- Partitions are processed in parallel in worker processes (runner.py), each
+  partition in a fresh process. The memory cap (memory_mb) is shared by the
+  workers: each worker gets memory_mb / workers as READ_MEMORY_BUDGET_MB, i.e.
+  partitions that need more memory are processed one day after the other.
+- Partitions of the same filetype share the database of already-processed files
+  (statestore.py). It is locked while a partition updates it, therefore the
+  database must be on local disk: backfill refuses to run partitions at the same
+  time if the state folder (PPICOS_STATE_DIR) is on a network share.
+- Days that are listed in the filetype logfile are skipped, with overwrite they
+  are exported again (files are replaced and listed again in the filetype logfile).
+- Parsed files are not cached (cache.py), historical files are read only once.
+
+"""
+import datetime as dt
+import os
+
+import runner
+import statestore
+
+PARTITIONS = ['month', 'week']
+MEMORY_MB = 4000  # Memory cap for all workers together
+MIN_WORKER_MEMORY_MB = 250  # Fewer workers are used if a worker would get less memory
+
+
+def get_partitions(first_date: dt.date, last_date: dt.date, partition: str = 'month') -> list:
+    """First and last day of the calendar months or weeks (Monday to Sunday) between first and last date (incl.)"""
+    if partition not in PARTITIONS:
+        raise ValueError(f"Unknown partition {partition!r}, must be one of {PARTITIONS}")
+    partitions = []
+    start = first_date
+    while start <= last_date:
+        if partition == 'month':
+            next_start = (start.replace(day=1) + dt.timedelta(days=32)).replace(day=1)
+        else:
+            next_start = start + dt.timedelta(days=7 - start.weekday())
+        end = min(next_start - dt.timedelta(days=1), last_date)
+        partitions.append((start, end))
+        start = next_start
+    return partitions
+
+
+def get_worker_memory(memory_mb: float, max_workers: int, n_tasks: int) -> tuple:
+    """Number of workers and memory budget (MB) of each worker"""
+    if not max_workers:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, n_tasks, int(memory_mb // MIN_WORKER_MEMORY_MB)))
+    return max_workers, memory_mb / max_workers
+
+
+def run_partition(filetype: str, filetypesettings: dict, search_window: tuple, memory_budget_mb: float,
+                  overwrite: bool) -> dict:
+    """Run one partition of one filetype, see runner.run_filetype"""
+    filetypesettings = dict(filetypesettings)
+    filetypesettings['READ_MEMORY_BUDGET_MB'] = memory_budget_mb
+    first, last = search_window
+    result = runner.run_filetype(filetype=filetype, filetypesettings=filetypesettings,
+                                 max_age_days=(last - first).days + 1, search_window=search_window,
+                                 overwrite=overwrite, use_cache=False)
+    result['filetype'] = f"{filetype} {first}..{last}"
+    return result
+
+
+def run_backfill(loop_settings: dict, first_date: dt.date, last_date: dt.date, partition: str = 'month',
+                 max_workers: int = 1, memory_mb: float = MEMORY_MB, overwrite: bool = False) -> list:
+    """Run all partitions of all filetypes in loop_settings
+
+    Args:
+        loop_settings: filetype names (keys) and their filesettings (values)
+        first_date: first day that is exported
+        last_date: last day that is exported, must be before today
+        partition: 'month' or 'week'
+        max_workers: number of worker processes, if 0 or None the number of CPUs is used,
+            if 1 all partitions are processed one after another in this process; partitions
+            can only run at the same time if the state folder is on local disk, see statestore
+        memory_mb: memory cap for all workers together
+        overwrite: export days again even if they are listed in the filetype logfile
+
+    Returns:
+        list of dicts (one per filetype and partition, in the order of filetypes and
+        partitions), see runner.run_filetype
+    """
+    if last_date >= dt.date.today():
+        raise ValueError(f"Last date {last_date} must be before today, today's data are always ignored")
+    if max_workers != 1 and statestore.is_network_path(statestore.get_state_dir()):
+        raise ValueError(f"State folder {statestore.get_state_dir()} is on a network share, where database "
+                         f"locking is not reliable, partitions cannot run at the same time (use max_workers=1 "
+                         f"or set {statestore.ENV_STATE_DIR} to a local folder)")
+    partitions = get_partitions(first_date=first_date, last_date=last_date, partition=partition)
+    n_tasks = len(loop_settings) * len(partitions)
+    max_workers, memory_budget_mb = get_worker_memory(memory_mb=memory_mb, max_workers=max_workers, n_tasks=n_tasks)
+    print(f"Backfill {first_date} to {last_date}: {len(partitions)} partitions ({partition}) "
+          f"of {len(loop_settings)} filetypes using {max_workers} workers "
+          f"({memory_budget_mb:.0f} MB memory budget per worker)")
+
+    tasks = [(filetype, filetypesettings, search_window, memory_budget_mb, overwrite)
+             for filetype, filetypesettings in loop_settings.items()
+             for search_window in partitions]
+
+    if max_workers == 1:
+        return [run_partition(*task) for task in tasks]
+
+    # Each partition gets a fresh process, partitions whose process dies are reported as failed
+    return runner.run_in_processes(func=run_partition, tasks=tasks, max_workers=max_workers,
+                                   names=[f"{filetype} {first}..{last}"
+                                          for filetype, _, (first, last), _, _ in tasks])
@@ -0,0 +1,97 @@
+"""
+Compare readers for source files
+
+Creates files with the same structure as 10_meteo files (TOA5 header,
+10S data, one file per day) in a temporary folder and measures how long
+it takes to read them with each reader:
+
+    detect dtypes:  pandas reader without known data types, followed by
+                    the conversion of each column to float64 (first file
+                    of each filetype is read like this)
+    pandas:         pandas reader with known data types
+    pyarrow:        pyarrow reader with known data types (if installed)
+
+"""
+import datetime as dt
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import filesettings
+import readers
+
+N_FILES = 5
+N_COLUMNS = 60  # Number of data columns (without TIMESTAMP and RECORD)
+N_REPEATS = 3
+
+
+def make_10_meteo_file(filepath: Path, date: dt.date, n_columns: int, rng) -> None:
+    """Write one day of 10S data in TOA5 format"""
+    varnames = [f'VAR_{i}_Avg' for i in range(n_columns)]
+    lines = ['"TOA5","CR1000","CR1000","1234","CR1000.Std.32","CPU:meteo.CR1","12345","TBL1"',
+             ','.join(['"TIMESTAMP"', '"RECORD"'] + [f'"{v}"' for v in varnames]),
+             ','.join(['"TS"', '"RN"'] + ['"degC"'] * n_columns),
+             ','.join(['""', '""'] + ['"Avg"'] * n_columns)]
+    timestamps = np.arange(np.datetime64(date), np.datetime64(date + dt.timedelta(days=1)), np.timedelta64(10, 's'))
+    values = rng.normal(loc=10, scale=5, size=(len(timestamps), n_columns)).round(5)
+    for record, (ts, row) in enumerate(zip(timestamps, values)):
+        ts = str(ts).replace('T', ' ')
+        lines.append(','.join([f'"{ts}"', str(record)] + [f'{v:g}' for v in row]))
+    filepath.write_text('\n'.join(lines) + '\n')
+
+
+def time_reader(name, read, filepaths) -> float:
+    """Best time of N_REPEATS for reading all files"""
+    runtimes = []
+    for _ in range(N_REPEATS):
+        tic = time.perf_counter()
+        for filepath in filepaths:
+            read(filepath)
+        runtimes.append(time.perf_counter() - tic)
+    best = min(runtimes)
+    print(f"{name:<16} {best:8.3f}s  ({best / len(filepaths):.3f}s per file)")
+    return best
+
+
+def read_detect_dtypes(reader, filepath):
+    df = reader.read(filepath=filepath, dtypes=None)
+    for col in df.columns:
+        try:
+            df[col] = df[col].astype(np.float64)
+        except ValueError:
+            df[col] = df[col].astype(str)
+    return df
+
+
+def main():
+    settings = filesettings.f_10_meteo()
+    rng = np.random.default_rng(42)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepaths = []
+        for ix in range(N_FILES):
+            date = dt.date(2023, 1, 1) + dt.timedelta(days=ix)
+            filepath = Path(tmpdir) / f"CH-DAV_iDL_T1_35_1_TBL1_{date:%Y_%m_%d}_0000.dat"
+            make_10_meteo_file(filepath=filepath, date=date, n_columns=N_COLUMNS, rng=rng)
+            filepaths.append(filepath)
+        print(f"Reading {N_FILES} files with {N_COLUMNS + 1} numeric columns and 8640 rows each\n")
+
+        pandas_reader = readers.PandasCsvReader(filesettings=settings)
+        reference_df = read_detect_dtypes(reader=pandas_reader, filepath=filepaths[0])
+        dtypes = readers.infer_dtypes(df=reference_df, filesettings=settings)
+
+        time_reader('detect dtypes', lambda fp: read_detect_dtypes(reader=pandas_reader, filepath=fp), filepaths)
+        time_reader('pandas', lambda fp: pandas_reader.read(filepath=fp, dtypes=dtypes), filepaths)
+        if readers.pacsv:
+            pyarrow_reader = readers.PyarrowCsvReader(filesettings=settings)
+            check_df = pyarrow_reader.read(filepath=filepaths[0], dtypes=dtypes)
+            print(f"{'':<16} (pyarrow data equal to pandas data: {check_df.equals(reference_df)})")
+            time_reader('pyarrow', lambda fp: pyarrow_reader.read(filepath=fp, dtypes=dtypes), filepaths)
+        else:
+            print("pyarrow          not installed")
+
+
+if __name__ == '__main__':
+    main()
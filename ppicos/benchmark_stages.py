@@ -0,0 +1,118 @@
+"""
+Measure runtime and memory of the processing stages of ppicos
+
+Creates synthetic source files (synthdata.py) in a temporary folder and runs
+ppicos for each filetype and search window (max_age_days). The runtime and
+the peak memory of each stage of IcosFormat.run are measured:
+
+    _generate_file_list:            search source files
+    _plan_files_for_target_days:    days that were not processed yet, files needed
+    _readfiles:                     read and merge source files
+    _format_data:                   format merged data
+    _export_data:                   write daily ICOS files
+
+Each case is run twice, each time with a new output folder: first to measure
+the runtime, then with tracemalloc to measure the peak memory (tracemalloc slows
+down the run). Source files are always read (no cache) and all days are processed
+at once (no streaming mode).
+
+    python benchmark_stages.py [--filetypes 10_meteo 17_meteo_profile] [--days 1 28 365] [--columns 20]
+
+By default, all filetypes in start_ALL.py are run with search windows of 1, 28 and
+365 days. Creating and processing one year of 1S data (30_profile_ghg) takes long.
+
+"""
+import argparse
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import synthdata
+from main import IcosFormat
+
+STAGES = ['_generate_file_list', '_plan_files_for_target_days', '_readfiles', '_format_data', '_export_data']
+WINDOW_DAYS = [1, 28, 365]
+
+
+def measure(method, stage: str, results: dict, trace_memory: bool):
+    """Wrap method of IcosFormat, runtime (s) and peak memory (MB) are stored to results[stage]"""
+
+    def measured(*args, **kwargs):
+        if trace_memory:
+            tracemalloc.reset_peak()
+        tic = time.perf_counter()
+        result = method(*args, **kwargs)
+        results[stage] = dict(runtime=time.perf_counter() - tic)
+        if trace_memory:
+            results[stage]['peak_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+        return result
+
+    return measured
+
+
+def run_case(filesettings: dict, n_days: int, trace_memory: bool) -> dict:
+    """Run ppicos once with a new output folder, returns runtime and peak memory of each stage"""
+    shutil.rmtree(filesettings['DIR_OUT_ICOS'], ignore_errors=True)
+    filesettings['DIR_OUT_ICOS'].mkdir(parents=True)
+    results = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        icosformat = IcosFormat(filesettings=filesettings, max_age_days=n_days, use_cache=False)
+        for stage in STAGES:
+            setattr(icosformat, stage, measure(method=getattr(icosformat, stage), stage=stage,
+                                               results=results, trace_memory=trace_memory))
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            icosformat.run()
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+            icosformat.close()
+    return results
+
+
+def print_results(runtimes: dict, memory: dict) -> None:
+    print(f"    {'stage':<32}{'runtime':>10}{'peak memory':>16}")
+    for stage in STAGES:
+        if stage not in runtimes:
+            print(f"    {stage:<32}{'-':>10}{'-':>16}")
+            continue
+        peak = f"{memory[stage]['peak_mb']:.1f} MB" if stage in memory else '-'
+        print(f"    {stage:<32}{runtimes[stage]['runtime']:>9.3f}s{peak:>16}")
+    print(f"    {'total':<32}{sum(r['runtime'] for r in runtimes.values()):>9.3f}s\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runtime and memory of the processing stages of ppicos")
+    parser.add_argument('--filetypes', nargs='+', default=list(synthdata.get_filetypes()),
+                        help="filetypes in start_ALL.py (default: all)")
+    parser.add_argument('--days', nargs='+', type=int, default=WINDOW_DAYS,
+                        help=f"search windows in days (default: {WINDOW_DAYS})")
+    parser.add_argument('--columns', type=int, default=synthdata.N_COLUMNS,
+                        help=f"number of variables in source files (default: {synthdata.N_COLUMNS})")
+    args = parser.parse_args()
+    filetypes = synthdata.get_filetypes()
+
+    for filetype in args.filetypes:
+        for n_days in args.days:
+            with tempfile.TemporaryDirectory(prefix='ppicos_benchmark_') as tmpdir:
+                tic = time.perf_counter()
+                filesettings = synthdata.make_filetype(filesettings=filetypes[filetype], rootdir=Path(tmpdir),
+                                                       n_days=n_days, n_columns=args.columns)
+                filesettings['READ_MEMORY_BUDGET_MB'] = None  # All days at once
+                source_files = [f for f in filesettings['DIR_SOURCE_FILES'].rglob('*') if f.is_file()]
+                size_mb = sum(f.stat().st_size for f in source_files) / 1e6
+                print(f"{filetype}, {n_days} days: {len(source_files)} source files, {size_mb:.1f} MB "
+                      f"(created in {time.perf_counter() - tic:.1f}s)")
+
+                runtimes = run_case(filesettings=filesettings, n_days=n_days, trace_memory=False)
+                memory = run_case(filesettings=filesettings, n_days=n_days, trace_memory=True)
+                print_results(runtimes=runtimes, memory=memory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Cache for parsed source files
+
+Source files usually do not change after they were written by the logger,
+but they are read again in each run. Parsed data of each file are therefore
+stored in a local cache directory and are re-used as long as the file did not
+change. The cache key is built from the path, size and modification time of
+the source file, from the filesettings that are relevant for reading the file
+and from the data types given to the reader (readers.infer_dtypes), i.e. if one
+of these changes the file is parsed again.
+
+Files are stored in Feather format (needs pyarrow), if pyarrow is not
+installed pickle is used instead. When the cache exceeds the max size,
+the least recently used files are deleted.
+
+Long-running processes (daemon.py) can also keep recently parsed files in
+memory (set_memory_size), they are then not read again from the cache
+directory when the next run of the same filetype needs them.
+
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
+
+# Default location and max size of the cache
+CACHE_DIR = Path(tempfile.gettempdir()) / 'ppicos_cache'
+CACHE_MAX_SIZE_MB = 2000
+
+# Max size of parsed data kept in memory, switched off by default, see set_memory_size
+MEMORY_MAX_SIZE_MB = 0
+
+# Parsed data in memory, least recently used first, shared by all filetypes in this process
+_memory = OrderedDict()  # Name of cache file: (data, size in bytes)
+_memory_lock = threading.Lock()
+
+# Increase this number when the way files are parsed is changed,
+# this invalidates all files in the cache
+CACHE_VERSION = 2
+
+# Filesettings that are used when parsing files
+FILESETTINGS_READ_KEYS = ['DATA_HEADER_ROWS', 'DATA_SEPARATOR', 'DATA_SKIP_ROWS',
+                          'DATA_TIMESTAMP_COL', 'DATA_TIMESTAMP_FORMAT', 'READ_BACKEND', 'READ_COMPACT_DTYPES']
+
+
+class ParsedFileCache:
+    """Store and load parsed source files"""
+
+    def __init__(self, filesettings: dict, cachedir: Path = CACHE_DIR, max_size_mb: float = CACHE_MAX_SIZE_MB):
+        self.cachedir = Path(cachedir)
+        self.max_size_bytes = max_size_mb * 1024 ** 2
+        self.settings_hash = self._hash_filesettings(filesettings=filesettings)
+        self.suffix = '.feather' if feather else '.pkl'
+        self.n_hits = 0
+        self.n_misses = 0
+        self.cachedir.mkdir(parents=True, exist_ok=True)
+
+    def _hash_filesettings(self, filesettings: dict) -> str:
+        relevant = {k: filesettings[k] for k in FILESETTINGS_READ_KEYS}
+        relevant['CACHE_VERSION'] = CACHE_VERSION
+        relevant['PANDAS_VERSION'] = pd.__version__
+        return hashlib.sha1(json.dumps(relevant, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _hash_dtypes(self, dtypes: dict = None) -> str:
+        if not dtypes:
+            return ''
+        relevant = dict(columns=dtypes['columns'],
+                        dtypes={pos: getattr(dtype, '__name__', str(dtype)) for pos, dtype in dtypes['dtypes'].items()})
+        return hashlib.sha1(json.dumps(relevant, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _cachefilepath(self, filepath: Path, dtypes: dict = None) -> Path:
+        stat = os.stat(filepath)
+        key = f"{Path(filepath).resolve()}|{stat.st_size}|{stat.st_mtime_ns}|{self.settings_hash}|" \
+              f"{self._hash_dtypes(dtypes=dtypes)}"
+        return self.cachedir / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}{self.suffix}"
+
+    def load(self, filepath: Path, dtypes: dict = None):
+        """Return cached data for filepath parsed with dtypes (readers.infer_dtypes), None if file is not in cache"""
+        cachefilepath = self._cachefilepath(filepath=filepath, dtypes=dtypes)
+        df = _memory_get(key=cachefilepath.name)
+        if df is not None:
+            self.n_hits += 1
+            return df
+        if not cachefilepath.is_file():
+            self.n_misses += 1
+            return None
+        try:
+            df = self._read(cachefilepath=cachefilepath)
+        except Exception:
+            # Broken cache file, e.g. from an interrupted run
+            self.n_misses += 1
+            return None
+        os.utime(cachefilepath)  # Mark as recently used
+        _memory_put(key=cachefilepath.name, df=df)
+        self.n_hits += 1
+        return df
+
+    def store(self, filepath: Path, df: pd.DataFrame, dtypes: dict = None) -> None:
+        """Store data of filepath that was parsed with dtypes to cache"""
+        cachefilepath = self._cachefilepath(filepath=filepath, dtypes=dtypes)
+        # Write to temporary file first, other runs might read the same cache
+        tmpfilepath = cachefilepath.with_suffix(f'.{os.getpid()}.tmp')
+        self._write(df=df, cachefilepath=tmpfilepath)
+        os.replace(tmpfilepath, cachefilepath)
+        _memory_put(key=cachefilepath.name, df=df)
+
+    def evict(self) -> int:
+        """Delete least recently used files until cache is smaller than max size
+
+        Returns:
+            number of deleted files
+        """
+        cachefiles = []
+        for entry in os.scandir(self.cachedir):
+            if entry.is_file():
+                stat = entry.stat()
+                cachefiles.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in cachefiles)
+        n_deleted = 0
+        for _, size, path in sorted(cachefiles):
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            n_deleted += 1
+        return n_deleted
+
+    def _write(self, df: pd.DataFrame, cachefilepath: Path) -> None:
+        if not feather:
+            df.to_pickle(cachefilepath)
+            return
+
+        # Feather needs string column names, original column names
+        # (can be tuples) and index name are stored as metadata
+        meta = dict(columns=[list(c) if isinstance(c, tuple) else c for c in df.columns],
+                    index_name=list(df.index.name) if isinstance(df.index.name, tuple) else df.index.name)
+        flat_df = df.copy(deep=False)
+        flat_df.columns = [str(i) for i in range(len(df.columns))]
+        flat_df.index = flat_df.index.rename('__index__')
+        table = pa.Table.from_pandas(flat_df, preserve_index=True)
+        table = table.replace_schema_metadata({**table.schema.metadata, b'ppicos': json.dumps(meta).encode('utf-8')})
+        feather.write_feather(table, cachefilepath)
+
+    def _read(self, cachefilepath: Path) -> pd.DataFrame:
+        if not feather:
+            return pd.read_pickle(cachefilepath)
+
+        table = feather.read_table(cachefilepath)
+        meta = json.loads(table.schema.metadata[b'ppicos'])
+        df = table.to_pandas()
+        columns = [tuple(c) if isinstance(c, list) else c for c in meta['columns']]
+        df.columns = pd.MultiIndex.from_tuples(columns) if columns and isinstance(columns[0], tuple) else columns
+        index_name = meta['index_name']
+        df.index.name = tuple(index_name) if isinstance(index_name, list) else index_name
+        return df
+
+
+def set_memory_size(max_size_mb: float) -> None:
+    """Keep up to max_size_mb of recently parsed data in memory, 0 switches the memory cache off"""
+    global MEMORY_MAX_SIZE_MB
+    with _memory_lock:
+        MEMORY_MAX_SIZE_MB = max_size_mb
+        _trim_memory()
+
+
+def _memory_get(key: str):
+    with _memory_lock:
+        if key not in _memory:
+            return None
+        _memory.move_to_end(key)  # Mark as recently used
+        return _memory[key][0]
+
+
+def _memory_put(key: str, df: pd.DataFrame) -> None:
+    if not MEMORY_MAX_SIZE_MB:
+        return
+    size = int(df.memory_usage(index=True).sum())
+    with _memory_lock:
+        _memory[key] = (df, size)
+        _memory.move_to_end(key)
+        _trim_memory()
+
+
+def _trim_memory() -> None:
+    """Remove least recently used data until memory cache is smaller than max size, needs _memory_lock"""
+    total_size = sum(size for _, size in _memory.values())
+    while _memory and (total_size > MEMORY_MAX_SIZE_MB * 1024 ** 2):
+        _, (_, size) = _memory.popitem(last=False)
+        total_size -= size
@@ -0,0 +1,210 @@
+"""
+Command line interface of ppicos
+
+Runs one or more filetypes in one call, filetypes are selected by their name
+in filesettings.FILETYPES or by a group name in filesettings.FILETYPE_GROUPS
+(e.g. 12_meteo_forest_floor for forest floors 1-5, all for all filetypes):
+
+    python cli.py run 10_meteo 12_meteo_forest_floor --max-age-days 28
+    python cli.py run all --workers 4 --log-level DEBUG [--no-cache]
+    python cli.py watch 10_meteo 13_meteo_nabel --poll
+    python cli.py backfill 10_meteo --start 2023-01-01 --end 2023-12-31 --workers 4
+    python cli.py verify 10_meteo 13_meteo_nabel [--checksums]
+    python cli.py list
+
+When ppicos is installed (pip install .), the same commands are available as
+`ppicos run ...`, `ppicos watch ...` etc. (entry point in pyproject.toml).
+
+By default, the filetypes are processed one after another in this process,
+i.e. pandas, numpy and the other modules needed for processing are imported
+only once. With --workers, several filetypes are processed in parallel, each
+in its own worker process (runner.py).
+
+These modules are imported only when the first filetype is processed, i.e.
+`list` and `--help` do not import pandas and start in a fraction of the time
+needed to import main.py.
+
+`watch` keeps running and exports days as soon as they are complete, see
+daemon.py. `backfill` processes an explicit date range in monthly or weekly
+partitions, see backfill.py. `verify` checks the created files against the
+checksum manifests in the output folders, see manifest.py. The exit code of
+`run`, `backfill` and `verify` is 1 if at least one filetype (or partition)
+failed or at least one file is missing or changed.
+
+"""
+import argparse
+import datetime
+import os
+import sys
+
+if __package__:
+    # Installed command ppicos (ppicos.cli:main), the modules import each other by their module name
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import filesettings
+
+MAX_AGE_DAYS = 28
+
+
+def cmd_list(args) -> int:
+    """Print names of filetypes and groups"""
+    for name in filesettings.FILETYPES:
+        print(name)
+    for group, names in filesettings.FILETYPE_GROUPS.items():
+        print(f"{group}: {', '.join(names)}")
+    return 0
+
+
+def cmd_run(args) -> int:
+    """Run selected filetypes, returns exit code"""
+    import runner  # Imports main.py (pandas) only when a filetype is run
+
+    # Environment variables are also used in worker processes
+    if args.log_level:
+        os.environ['PPICOS_LOG_LEVEL'] = args.log_level
+    if args.profile:
+        os.environ['PPICOS_PROFILE'] = args.profile
+
+    script_start = datetime.datetime.now()
+    loop_settings = filesettings.get_filetypes(names=args.filetypes)
+    results = runner.run_filetypes(loop_settings=loop_settings, max_age_days=args.max_age_days,
+                                   max_workers=args.workers, use_cache=not args.no_cache)
+    runner.print_summary(results=results, total_runtime=datetime.datetime.now() - script_start)
+    return 0 if all(r['ok'] for r in results) else 1
+
+
+def cmd_watch(args) -> int:
+    """Watch source folders of selected filetypes until stopped"""
+    import daemon  # Imports main.py (pandas)
+
+    if args.log_level:
+        os.environ['PPICOS_LOG_LEVEL'] = args.log_level
+    daemon.Daemon(loop_settings=filesettings.get_filetypes(names=args.filetypes), max_age_days=args.max_age_days,
+                  poll=args.poll, poll_seconds=args.poll_seconds, settle_seconds=args.settle_seconds,
+                  memory_cache_mb=args.memory_cache_mb, use_cache=not args.no_cache).run()
+    return 0
+
+
+def cmd_backfill(args) -> int:
+    """Run selected filetypes for the date range between start and end, returns exit code"""
+    import backfill
+    import runner
+
+    if args.log_level:
+        os.environ['PPICOS_LOG_LEVEL'] = args.log_level
+
+    script_start = datetime.datetime.now()
+    results = backfill.run_backfill(loop_settings=filesettings.get_filetypes(names=args.filetypes),
+                                    first_date=args.start, last_date=args.end, partition=args.partition,
+                                    max_workers=args.workers, memory_mb=args.memory_mb, overwrite=args.overwrite)
+    runner.print_summary(results=results, total_runtime=datetime.datetime.now() - script_start)
+    return 0 if all(r['ok'] for r in results) else 1
+
+
+def cmd_verify(args) -> int:
+    """Check files in the output folders of selected filetypes against their manifests, returns exit code"""
+    import manifest
+
+    n_errors = 0
+    for name, filetypesettings in filesettings.get_filetypes(names=args.filetypes).items():
+        result = manifest.verify(outdir=filetypesettings['DIR_OUT_ICOS'], checksums=args.checksums)
+        errors = [(problem, filepath) for problem in ('missing', 'wrong_size', 'wrong_checksum')
+                  for filepath in result[problem]]
+        n_errors += len(errors)
+        print(f"{name}: {result['n_checked']} files checked ({'size and checksum' if args.checksums else 'size'}), "
+              f"{len(errors)} errors, {len(result['unlisted'])} files not in manifest")
+        for problem, filepath in errors:
+            print(f"    {problem.upper()}: {filepath}")
+        for filepath in result['unlisted'] if args.list_unlisted else []:
+            print(f"    NOT IN MANIFEST: {filepath}")
+    return 0 if n_errors == 0 else 1
+
+
+def parse_date(value: str) -> datetime.date:
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date {value!r}, expected YYYY-MM-DD")
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='ppicos', description="Format raw data files to ICOS-compliant files")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="run filetypes")
+    run_parser.add_argument('filetypes', nargs='+', help="filetype or group names, see 'list'")
+    run_parser.add_argument('--max-age-days', type=int, default=MAX_AGE_DAYS,
+                            help=f"search window in days (default: {MAX_AGE_DAYS})")
+    run_parser.add_argument('--workers', type=int, default=1,
+                            help="number of filetypes processed in parallel in worker processes, "
+                                 "0: number of CPUs (default: 1, all filetypes in this process)")
+    run_parser.add_argument('--no-cache', action='store_true',
+                            help="always read source files, do not use or store parsed files (cache.py)")
+    run_parser.add_argument('--log-level', help="e.g. DEBUG, default: PPICOS_LOG_LEVEL or INFO")
+    run_parser.add_argument('--profile', help="e.g. all or cprofile,memory, see profiling.py")
+    run_parser.set_defaults(func=cmd_run)
+
+    watch_parser = subparsers.add_parser('watch', help="export days as soon as they are complete (daemon.py)")
+    watch_parser.add_argument('filetypes', nargs='+', help="filetype or group names, see 'list'")
+    watch_parser.add_argument('--max-age-days', type=int, default=MAX_AGE_DAYS,
+                              help=f"search window in days (default: {MAX_AGE_DAYS})")
+    watch_parser.add_argument('--poll', action='store_true',
+                              help="list folders instead of inotify, e.g. for SMB mounts (always used "
+                                   "if watchdog is not installed)")
+    watch_parser.add_argument('--poll-seconds', type=float, default=60,
+                              help="interval for listing folders (default: 60)")
+    watch_parser.add_argument('--settle-seconds', type=float, default=30,
+                              help="process a filetype when its files did not change for this time (default: 30)")
+    watch_parser.add_argument('--memory-cache-mb', type=float, default=500,
+                              help="parsed files kept in memory (default: 500)")
+    watch_parser.add_argument('--no-cache', action='store_true',
+                              help="always read source files, do not use or store parsed files (cache.py)")
+    watch_parser.add_argument('--log-level', help="e.g. DEBUG, default: PPICOS_LOG_LEVEL or INFO")
+    watch_parser.set_defaults(func=cmd_watch)
+
+    backfill_parser = subparsers.add_parser('backfill', help="process an explicit date range (backfill.py)")
+    backfill_parser.add_argument('filetypes', nargs='+', help="filetype or group names, see 'list'")
+    backfill_parser.add_argument('--start', type=parse_date, required=True, help="first day, YYYY-MM-DD")
+    backfill_parser.add_argument('--end', type=parse_date, required=True, help="last day (before today), YYYY-MM-DD")
+    backfill_parser.add_argument('--partition', choices=['month', 'week'], default='month',
+                                 help="days processed together in one worker (default: month)")
+    backfill_parser.add_argument('--workers', type=int, default=1,
+                                 help="number of partitions processed in parallel, 0: number of CPUs (default: 1)")
+    backfill_parser.add_argument('--memory-mb', type=float, default=4000,
+                                 help="memory cap shared by all workers (default: 4000)")
+    backfill_parser.add_argument('--overwrite', action='store_true',
+                                 help="export days again that are listed in the filetype logfile")
+    backfill_parser.add_argument('--log-level', help="e.g. DEBUG, default: PPICOS_LOG_LEVEL or INFO")
+    backfill_parser.set_defaults(func=cmd_backfill)
+
+    verify_parser = subparsers.add_parser('verify', help="check created files against checksum manifests (manifest.py)")
+    verify_parser.add_argument('filetypes', nargs='+', help="filetype or group names, see 'list'")
+    verify_parser.add_argument('--checksums', action='store_true',
+                               help="also compare SHA-256 checksums (reads all files, default: size only)")
+    verify_parser.add_argument('--list-unlisted', action='store_true', help="print files that are not in a manifest")
+    verify_parser.set_defaults(func=cmd_verify)
+
+    list_parser = subparsers.add_parser('list', help="list filetypes and groups")
+    list_parser.set_defaults(func=cmd_list)
+    return parser
+
+
+def main(argv: list = None) -> int:
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if args.command in ('run', 'watch', 'backfill', 'verify'):
+        unknown = [name for name in args.filetypes
+                   if name not in filesettings.FILETYPES and name not in filesettings.FILETYPE_GROUPS]
+        if unknown:
+            parser.error(f"unknown filetypes {unknown}, see 'list'")
+    if args.command == 'backfill':
+        if args.start > args.end:
+            parser.error(f"start {args.start} is after end {args.end}")
+        if args.end >= datetime.date.today():
+            parser.error(f"end {args.end} must be before today, today's data are always ignored")
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    # Guard is needed b/c worker processes import this script (spawn)
+    sys.exit(main())
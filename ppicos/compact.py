@@ -0,0 +1,92 @@
+"""
+Compact data types for parsed source files
+
+Numeric columns are parsed to float64 and text columns to Python str objects.
+To reduce memory, parsed data can be stored with compact data types:
+
+- float32 for numeric columns if all values can be restored exactly. This is
+  the case for values with at most 6 significant digits (e.g. 1.23456, -587.989
+  or 2.5e-05, as written by most loggers) and for most values with 7 significant
+  digits. The float64 value is restored from the float32 value by rounding it
+  to the smallest number of decimals that gives the same float32 value.
+- category for text columns with many repeated values (e.g. status columns).
+
+Before the data are exported, restore_dtypes converts the columns back to
+float64 and str, i.e. the exported files are the same as without compact
+data types.
+
+"""
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+FLOAT32_MAX_DECIMALS = 15
+POW10 = 10.0 ** np.arange(FLOAT32_MAX_DECIMALS + 1)
+
+# Text columns are stored as category if the number of unique values is
+# at most this fraction of the number of values
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def compact_dtypes(df: DataFrame) -> DataFrame:
+    """Convert columns to float32 or category where this is possible without changing values"""
+    compacted = {}
+    for ix, col in enumerate(df.columns):
+        series = df.iloc[:, ix]
+        if series.dtype == np.float64:
+            values = series.to_numpy()
+            with np.errstate(over='ignore', invalid='ignore'):
+                values_float32 = values.astype(np.float32)  # Values out of range are not equal when restored
+            if _is_equal(restore_float64(values=values_float32), values):
+                compacted[ix] = pd.Series(values_float32, index=series.index)
+        elif series.dtype == object:
+            if series.nunique(dropna=False) <= CATEGORY_MAX_UNIQUE_RATIO * len(series):
+                compacted[ix] = series.astype('category')
+    return _replace_columns(df=df, columns=compacted)
+
+
+def restore_dtypes(df: DataFrame) -> DataFrame:
+    """Convert float32 columns to the original float64 values and category columns to str"""
+    restored = {}
+    for ix, col in enumerate(df.columns):
+        series = df.iloc[:, ix]
+        if series.dtype == np.float32:
+            restored[ix] = pd.Series(restore_float64(values=series.to_numpy()), index=series.index)
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            restored[ix] = series.astype(object)
+    return _replace_columns(df=df, columns=restored)
+
+
+def restore_float64(values: np.ndarray) -> np.ndarray:
+    """Restore float64 values from float32 values
+
+    Each value is rounded to the smallest number of decimals that gives the
+    same float32 value, e.g. 0.1 for the float32 value 0.10000000149011612.
+    """
+    restored = values.astype(np.float64)
+    todo = np.flatnonzero(np.isfinite(restored))
+    for decimals in range(FLOAT32_MAX_DECIMALS + 1):
+        if len(todo) == 0:
+            break
+        rounded = np.rint(restored[todo] * POW10[decimals]) / POW10[decimals]
+        is_same = rounded.astype(np.float32) == values[todo]
+        restored[todo[is_same]] = rounded[is_same]
+        todo = todo[~is_same]
+    return restored
+
+
+def _is_equal(restored: np.ndarray, values: np.ndarray) -> bool:
+    """Check that restored values are the same as the original values, incl. the sign of zero"""
+    is_nan = np.isnan(values)
+    return np.array_equal(is_nan, np.isnan(restored)) and \
+        np.array_equal(values[~is_nan].view(np.int64), restored[~is_nan].view(np.int64))
+
+
+def _replace_columns(df: DataFrame, columns: dict) -> DataFrame:
+    """Return data with the columns at the given positions replaced, in one step"""
+    if not columns:
+        return df
+    new_df = pd.concat([columns.get(ix, df.iloc[:, ix]) for ix in range(len(df.columns))], axis=1)
+    new_df.columns = df.columns
+    new_df.index = df.index
+    return new_df
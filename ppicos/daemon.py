@@ -0,0 +1,327 @@
+"""
+Watch source folders and export complete days shortly after the files arrive
+
+The start scripts run once a day, i.e. a day reaches ICOS up to 24 hours after
+it was complete. The daemon keeps running and watches the source folders
+(DIR_SOURCE_FILES) of the selected filetypes:
+
+    python cli.py watch 10_meteo 13_meteo_nabel [--poll] [--poll-seconds 60] [--settle-seconds 30]
+
+- At the start, all filetypes are run once with the search window max_age_days
+  (same as the daily run), to export days that were missed while the daemon
+  was not running.
+- New and changed source files are detected with inotify (needs the optional
+  package watchdog) or, if watchdog is not installed or with --poll (e.g. for
+  folders on SMB mounts, where inotify does not see changes made by other
+  computers), by listing the monthly folders of yesterday and today every
+  poll_seconds.
+- When no file of a filetype changed for settle_seconds (files are often written
+  in several steps), the last timestamp of the changed files is checked
+  (planner.FileCoverageIndex). A day is complete when the files contain its
+  last record (see WatchedFiletype.pop_days_to_run). Complete days with data in
+  the changed files are processed and exported (IcosFormat with argument days)
+  if they were not exported yet, the other days in the search window are not
+  touched. Days that could not be exported because data were missing (partial
+  days) are tried again when one of their source files changes (e.g. a late file).
+- Exported days are the days listed in the database of already-processed files
+  (statestore.py), read after each run. With OUTFILE_REEXPORT_REVISED_DAYS,
+  changed files of days that were already exported also start a run: these days
+  are exported again if their source files were revised (checksums, see
+  IcosFormat._detect_revised_days).
+
+Modules, filesettings, listings of the source folders (dirindex.py) and recently
+parsed files (cache.set_memory_size) are kept in memory between runs. Stop the
+daemon with Ctrl+C or SIGTERM.
+
+"""
+import datetime as dt
+import os
+import queue
+import signal
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import cache
+import dirindex
+import planner
+import tools
+from main import IcosFormat
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+POLL_SECONDS = 60  # Interval for listing source folders if changes are not detected with inotify
+SETTLE_SECONDS = 30  # A filetype is processed when none of its files changed for this time
+MEMORY_CACHE_MB = 500  # Parsed files kept in memory
+
+
+def log(msg: str) -> None:
+    print(f"{dt.datetime.now():%Y-%m-%d %H:%M:%S} [daemon] {msg}", flush=True)
+
+
+class WatchedFiletype:
+    """Changed source files of one filetype and days that were already exported"""
+
+    def __init__(self, name: str, filesettings: dict):
+        self.name = name
+        self.filesettings = filesettings
+        self.pattern = tools.compile_filename_id(filename_id=filesettings['FILENAME_ID'])
+        self.freq = pd.Timedelta(filesettings['DATA_FREQUENCY']).to_pytimedelta()
+        self.coverage_index = planner.FileCoverageIndex(
+            indexfilepath=Path(filesettings['DIR_OUT_ICOS']) / f"ppicos_{filesettings['FILE_FILEGROUP']}_file-coverage.csv",
+            filesettings=filesettings)
+        self.changed = set()  # Changed files since the last run
+        self.last_change = None  # Time of the last change (monotonic)
+        self.exported_days = set()  # Days listed in the database of already-processed files after the last run
+
+    def add_change(self, filepath: Path) -> bool:
+        """Add changed file if its name matches FILENAME_ID, returns True if it matches"""
+        if not self.pattern.match(filepath.name):
+            return False
+        self.changed.add(filepath)
+        self.last_change = time.monotonic()
+        return True
+
+    def is_settled(self, settle_seconds: float) -> bool:
+        return bool(self.changed) and (time.monotonic() - self.last_change >= settle_seconds)
+
+    def pop_days_to_run(self, max_age_days: int) -> list:
+        """Complete days with data in the changed files that need a run, changed files are reset
+
+        Days that were already exported only need a run if revised days are exported
+        again (OUTFILE_REEXPORT_REVISED_DAYS), the run compares the checksums of their
+        source files.
+
+        The original timestamp shows the END of the averaging interval, i.e. the last
+        record of a day is the record at midnight (or some seconds after midnight, e.g.
+        00:00:04). A day is complete when the last record in the changed files is at
+        or after the last record of the day. Records after midnight of today are always
+        ignored (IcosFormat._remove_today_data), i.e. yesterday is only complete if its
+        last record is exactly at midnight.
+        """
+        coverages = []
+        for filepath in self.changed:
+            try:
+                coverages.append(self.coverage_index.get_coverage(filepath=filepath))
+            except OSError:
+                continue  # File was removed or renamed
+        self.changed = set()
+        # Last record in all files (changed files and files of earlier runs)
+        lasts = [entry['LAST'] for entry in self.coverage_index.entries.values() if entry['LAST'] is not None]
+        if not coverages or not lasts:
+            return []
+        days = []
+        for day in self._get_complete_days(last=max(lasts), max_age_days=max_age_days):
+            if (day in self.exported_days) and not self.filesettings['OUTFILE_REEXPORT_REVISED_DAYS']:
+                continue
+            intervals = planner.get_required_intervals(
+                target_days=[day],
+                complement_with_previous_date=self.filesettings['DATA_COMPLEMENT_WITH_PREVIOUS_DATE'],
+                freq=self.freq)
+            if any(planner.covers_intervals(first=first, last=last, intervals=intervals) for first, last in coverages):
+                days.append(day)
+        return days
+
+    def update_after_run(self, icosformat: IcosFormat, max_age_days: int) -> None:
+        """Read exported days from the database of already-processed files and the file coverage
+        index that was updated by the run"""
+        self.coverage_index = planner.FileCoverageIndex(indexfilepath=self.coverage_index.indexfilepath,
+                                                        filesettings=self.filesettings)
+        today = dt.date.today()
+        self.exported_days = {day for day in (today - dt.timedelta(days=n) for n in range(max_age_days, 0, -1))
+                              if icosformat.is_exported(date=day)}
+
+    def _get_complete_days(self, last: dt.datetime, max_age_days: int) -> list:
+        """Days in the search window with their last record at or before last"""
+        offset = (last - dt.datetime(last.year, last.month, last.day)) % self.freq  # e.g. 4 seconds
+        today = dt.date.today()
+        today_start = dt.datetime(today.year, today.month, today.day)
+        days = []
+        for n in range(max_age_days, 0, -1):
+            day = today - dt.timedelta(days=n)
+            day_last = dt.datetime(day.year, day.month, day.day) + dt.timedelta(days=1) + offset
+            if (day_last <= last) and (day_last <= today_start):
+                days.append(day)
+        return days
+
+
+class _EventHandler(FileSystemEventHandler):
+    """Put paths of created, changed and moved files to the queue (watchdog)"""
+
+    def __init__(self, events: queue.Queue):
+        super().__init__()
+        self.events = events
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.events.put(Path(event.src_path))
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.events.put(Path(event.src_path))
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.events.put(Path(event.dest_path))
+
+
+class PollingWatcher:
+    """Detect created and changed files by listing the monthly folders of yesterday and today"""
+
+    def __init__(self, source_dir: Path):
+        self.source_dir = Path(source_dir)
+        self.stats = self._list()
+
+    def poll(self) -> list:
+        """Paths of files that were created or changed since the last poll"""
+        stats = self._list()
+        changed = [Path(f) for f, stat in stats.items() if self.stats.get(f) != stat]
+        self.stats = stats
+        return changed
+
+    def _list(self) -> dict:
+        today = dt.date.today()
+        search_dirs, _ = tools.set_search_folders(source_dir=self.source_dir,
+                                                  search_firstdate=today - dt.timedelta(days=1),
+                                                  search_lastdate=today)
+        stats = {}
+        for search_dir in search_dirs:
+            for root, _, filenames in os.walk(search_dir):
+                for filename in filenames:
+                    filepath = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(filepath)
+                    except OSError:
+                        continue
+                    stats[filepath] = (stat.st_size, stat.st_mtime_ns)
+        return stats
+
+
+class Daemon:
+    """Watch source folders of several filetypes and export days when they are complete"""
+
+    def __init__(self, loop_settings: dict, max_age_days: int = 5, poll: bool = False,
+                 poll_seconds: float = POLL_SECONDS, settle_seconds: float = SETTLE_SECONDS,
+                 memory_cache_mb: float = MEMORY_CACHE_MB, use_cache: bool = True):
+        self.filetypes = {name: WatchedFiletype(name=name, filesettings=filesettings)
+                          for name, filesettings in loop_settings.items()}
+        self.max_age_days = max_age_days
+        self.use_polling = poll or (Observer is None)
+        self.poll_seconds = poll_seconds
+        self.settle_seconds = settle_seconds
+        self.memory_cache_mb = memory_cache_mb
+        self.use_cache = use_cache
+        self.events = queue.Queue()
+        self.observer = None
+        self.pollers = []
+
+        # Filetypes that use the same source folder are checked together
+        self.source_dirs = {}
+        for filetype in self.filetypes.values():
+            source_dir = str(Path(filetype.filesettings['DIR_SOURCE_FILES']))
+            self.source_dirs.setdefault(source_dir, []).append(filetype)
+
+    def run(self) -> None:
+        """Run until stopped with Ctrl+C or SIGTERM"""
+        cache.set_memory_size(max_size_mb=self.memory_cache_mb)
+        signal.signal(signal.SIGTERM, signal.default_int_handler)  # Stop as with Ctrl+C
+        try:
+            # Days that were missed while the daemon was not running
+            for filetype in self.filetypes.values():
+                self._run_filetype(filetype=filetype, max_age_days=self.max_age_days)
+
+            self._start_watching()
+            next_poll = time.monotonic() + self.poll_seconds
+            while True:
+                for filepath in self._get_events(timeout=1):
+                    self._add_change(filepath=filepath)
+                if self.pollers and (time.monotonic() >= next_poll):
+                    for poller in self.pollers:
+                        for filepath in poller.poll():
+                            self._add_change(filepath=filepath)
+                    next_poll = time.monotonic() + self.poll_seconds
+                for filetype in self.filetypes.values():
+                    if filetype.is_settled(settle_seconds=self.settle_seconds):
+                        self._process_changes(filetype=filetype)
+        except KeyboardInterrupt:
+            log("Stopping")
+        finally:
+            if self.observer:
+                self.observer.stop()
+                self.observer.join()
+
+    def _get_events(self, timeout: float) -> list:
+        """Paths of all queued events, waits up to timeout seconds for the first event"""
+        try:
+            filepaths = [self.events.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                filepaths.append(self.events.get_nowait())
+            except queue.Empty:
+                return filepaths
+
+    def _start_watching(self) -> None:
+        if not self.use_polling:
+            self.observer = Observer()
+        for source_dir in self.source_dirs:
+            if not os.path.isdir(source_dir):
+                log(f"(!) Source folder {source_dir} not found, not watched")
+                continue
+            if self.observer:
+                self.observer.schedule(_EventHandler(events=self.events), source_dir, recursive=True)
+            else:
+                self.pollers.append(PollingWatcher(source_dir=Path(source_dir)))
+        if self.observer:
+            self.observer.start()
+        log(f"Watching {len(self.source_dirs)} source folders of {len(self.filetypes)} filetypes "
+            f"({'inotify' if self.observer else f'listing folders every {self.poll_seconds}s'})")
+
+    def _add_change(self, filepath: Path) -> None:
+        for filetype in self.source_dirs.get(self._get_source_dir(filepath=filepath), []):
+            filetype.add_change(filepath=filepath)
+
+    def _get_source_dir(self, filepath: Path):
+        for source_dir in self.source_dirs:
+            if str(filepath).startswith(source_dir + os.sep):
+                return source_dir
+        return None
+
+    def _process_changes(self, filetype: WatchedFiletype) -> None:
+        n_changed = len(filetype.changed)
+        days = filetype.pop_days_to_run(max_age_days=self.max_age_days)
+        if not days:
+            log(f"{filetype.name}: {n_changed} files changed, no complete days to export")
+            return
+        log(f"{filetype.name}: {n_changed} files changed, complete days {[str(d) for d in days]}")
+        max_age_days = (dt.date.today() - days[0]).days
+        self._run_filetype(filetype=filetype, max_age_days=max_age_days, days=days)
+
+    def _run_filetype(self, filetype: WatchedFiletype, max_age_days: int, days: list = None) -> bool:
+        """Run IcosFormat, errors are logged and do not stop the daemon, returns True if successful
+
+        Exported days are read after the run, also if it failed (days written before the
+        error are recorded).
+        """
+        tic = time.time()
+        dirindex.clear_checked()  # Source folders are checked again for new files
+        try:
+            with IcosFormat(filesettings=filetype.filesettings, max_age_days=max_age_days, days=days,
+                            use_cache=self.use_cache) as icosformat:
+                try:
+                    icosformat.run()
+                finally:
+                    filetype.update_after_run(icosformat=icosformat, max_age_days=self.max_age_days)
+        except (Exception, SystemExit) as e:
+            # SystemExit b/c IcosFormat calls sys.exit() when no files are found
+            log(f"(!) {filetype.name}: run failed ({type(e).__name__}: {e})")
+            return False
+        log(f"{filetype.name}: run finished in {time.time() - tic:.1f}s")
+        return True
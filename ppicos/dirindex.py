@@ -0,0 +1,131 @@
+"""
+Index of files in source folders
+
+Several filetypes search the same source folders (e.g. the five
+12_meteo_forest_floor filetypes or 10_meteo and 10_meteo_heatflag_sonic).
+Listing these folders on the file server is slow, the listing of each
+folder is therefore shared between all filetypes that use the same
+source folder (DIR_SOURCE_FILES):
+
+- Within one Python process, each folder is listed only once (until
+  clear_checked is called, e.g. before each run of the daemon).
+- The listing is stored to a local index file together with the modification
+  time of the listed folders. In later runs (and in other processes), a folder
+  is only listed again if its modification time changed, i.e. if files were
+  added, removed or renamed.
+
+The in-process index only helps if the filetypes run in the same process
+(start scripts with one worker, the daemon, backfill with one worker).
+runner.run_filetypes runs each filetype in its own worker process: these
+processes only share the index file, i.e. a folder that changed since the
+last run is listed once in each process that needs it (the last process
+that finishes stores its listing).
+
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Default location of the index files
+INDEX_DIR = Path(tempfile.gettempdir()) / 'ppicos_dirindex'
+
+# Listings are only re-used if the folder did not change for at least this
+# number of seconds before it was listed, modification times on file servers
+# can have a low resolution
+MTIME_TOLERANCE_SECONDS = 2
+
+# Indexes used in this process, one for each source folder
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class SourceDirIndex:
+    """Listing of folders below one source folder"""
+
+    def __init__(self, source_dir: Path, indexdir: Path = INDEX_DIR):
+        self.source_dir = Path(source_dir)
+        self.indexdir = Path(indexdir)
+        key = hashlib.sha1(str(self.source_dir).encode('utf-8')).hexdigest()
+        self.indexfilepath = self.indexdir / f"dirindex_{key}.json"
+        self.listings = self._load()
+        self.checked = set()  # Folders that are up-to-date in this process
+        self.n_listed = 0
+        self.n_reused = 0
+        self.lock = threading.Lock()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.indexfilepath) as f:
+                return json.load(f)['listings']
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def save(self) -> None:
+        """Store listings to index file"""
+        self.indexdir.mkdir(parents=True, exist_ok=True)
+        tmpfilepath = self.indexfilepath.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmpfilepath, 'w') as f:
+            json.dump(dict(source_dir=str(self.source_dir), listings=self.listings), f)
+        os.replace(tmpfilepath, self.indexfilepath)
+
+    def list_files(self, search_dir: Path) -> list:
+        """Return paths of all files in search_dir and its subfolders"""
+        key = str(search_dir)
+        with self.lock:
+            if (key in self.checked) or self._is_unchanged(listing=self.listings.get(key)):
+                self.n_reused += 1
+            else:
+                self.listings[key] = self._walk(search_dir=search_dir)
+                self.n_listed += 1
+            self.checked.add(key)
+            return [Path(f) for f in self.listings[key]['files']]
+
+    def _is_unchanged(self, listing: dict) -> bool:
+        """Check if none of the listed folders changed since they were listed"""
+        if not listing or not listing['mtimes']:
+            # Not listed yet or folder did not exist
+            return False
+        for dirpath, mtime in listing['mtimes'].items():
+            try:
+                current_mtime = os.stat(dirpath).st_mtime
+            except OSError:
+                return False
+            if current_mtime != mtime:
+                return False
+            if mtime >= listing['listed_at'] - MTIME_TOLERANCE_SECONDS:
+                return False
+        return True
+
+    def _walk(self, search_dir: Path) -> dict:
+        listed_at = time.time()
+        files = []
+        mtimes = {}
+        for root, dirs, filenames in os.walk(search_dir):
+            try:
+                mtimes[root] = os.stat(root).st_mtime
+            except OSError:
+                continue
+            for filename in filenames:
+                files.append(str(Path(root) / filename))
+        return dict(listed_at=listed_at, mtimes=mtimes, files=files)
+
+
+def get_index(source_dir: Path) -> SourceDirIndex:
+    """Return the index for source_dir, the same index is used for all filetypes in this process"""
+    key = str(source_dir)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = SourceDirIndex(source_dir=source_dir)
+        return _indexes[key]
+
+
+def clear_checked() -> None:
+    """Check folders again in the next search, listings are re-used if the folders did not change"""
+    with _indexes_lock:
+        for index in _indexes.values():
+            with index.lock:
+                index.checked.clear()
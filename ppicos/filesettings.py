@@ -22,6 +22,7 @@ Info about the file structure
 
 
 """
+from functools import partial
 from pathlib import Path
 
 
@@ -55,9 +56,17 @@ def f_10_meteo():
         'FILENAME_POSITION_MONTH': [29, 31],
         'FILENAME_POSITION_YEAR': [24, 28],
         'OUTFILE_COMPRESSION': True,
+        'OUTFILE_CSV_WRITER': 'fast',
         'OUTFILE_DELETE_UNCOMPRESSED': True,
         'OUTFILE_ICOS_FILENUMBER_FN': '03',
-        'OUTFILE_ICOS_LOGGERNUMBER_LN': '02'
+        'OUTFILE_ICOS_LOGGERNUMBER_LN': '02',
+        'OUTFILE_MAX_WORKERS': 4,
+        'OUTFILE_REEXPORT_REVISED_DAYS': True,
+        'OUTFILE_ZLIB_LEVEL': 6,
+        'READ_BACKEND': 'pandas',
+        'READ_COMPACT_DTYPES': False,
+        'READ_MAX_WORKERS': 8,
+        'READ_MEMORY_BUDGET_MB': 2000
         # 'DIR_SOURCE_FILES': Path(r'F:\Downloads\_temp\testing_ppicos\input\10_meteo'),  # testing
         # 'DIR_OUT_ICOS': Path(r'F:\Downloads\_temp\testing_ppicos\output\10_meteo')  # testing
     }
@@ -95,9 +104,17 @@ def f_10_meteo_heatflag_sonic():
         'FILENAME_POSITION_MONTH': [29, 31],
         'FILENAME_POSITION_YEAR': [24, 28],
         'OUTFILE_COMPRESSION': False,
+        'OUTFILE_CSV_WRITER': 'fast',
         'OUTFILE_DELETE_UNCOMPRESSED': False,
         'OUTFILE_ICOS_FILENUMBER_FN': '02',
-        'OUTFILE_ICOS_LOGGERNUMBER_LN': '02'
+        'OUTFILE_ICOS_LOGGERNUMBER_LN': '02',
+        'OUTFILE_MAX_WORKERS': 4,
+        'OUTFILE_REEXPORT_REVISED_DAYS': True,
+        'OUTFILE_ZLIB_LEVEL': 6,
+        'READ_BACKEND': 'pandas',
+        'READ_COMPACT_DTYPES': False,
+        'READ_MAX_WORKERS': 4,
+        'READ_MEMORY_BUDGET_MB': 2000
         # 'DIR_SOURCE_FILES': Path(r'F:\Downloads\_temp\testing_ppicos\input\10_meteo'),  # testing
         # 'DIR_OUT_ICOS': Path(r'F:\Downloads\_temp\testing_ppicos\output\10_meteo_heatflag_sonic')  # testing
     }
@@ -137,9 +154,17 @@ def f_11_meteo_hut_prec():
         'FILENAME_POSITION_MONTH': [28, 30],
         'FILENAME_POSITION_YEAR': [23, 27],
         'OUTFILE_COMPRESSION': True,
+        'OUTFILE_CSV_WRITER': 'fast',
         'OUTFILE_DELETE_UNCOMPRESSED': True,
         'OUTFILE_ICOS_FILENUMBER_FN': '03',
-        'OUTFILE_ICOS_LOGGERNUMBER_LN': '03'
+        'OUTFILE_ICOS_LOGGERNUMBER_LN': '03',
+        'OUTFILE_MAX_WORKERS': 4,
+        'OUTFILE_REEXPORT_REVISED_DAYS': True,
+        'OUTFILE_ZLIB_LEVEL': 6,
+        'READ_BACKEND': 'pandas',
+        'READ_COMPACT_DTYPES': False,
+        'READ_MAX_WORKERS': 4,
+        'READ_MEMORY_BUDGET_MB': 2000
         # 'DIR_SOURCE_FILES': Path(r'F:\Downloads\_temp\testing_ppicos\input\11_meteo_hut'),  # testing
         # 'DIR_OUT_ICOS': Path(r'F:\Downloads\_temp\testing_ppicos\output\11_meteo_hut')  # testing
     }
@@ -176,7 +201,15 @@ def f_12_meteo_forest_floor(forest_floor, table):
         'FILENAME_POSITION_MONTH': [29, 31],
         'FILENAME_POSITION_YEAR': [24, 28],
         'OUTFILE_COMPRESSION': True,
-        'OUTFILE_DELETE_UNCOMPRESSED': True
+        'OUTFILE_CSV_WRITER': 'fast',
+        'OUTFILE_DELETE_UNCOMPRESSED': True,
+        'OUTFILE_MAX_WORKERS': 4,
+        'OUTFILE_REEXPORT_REVISED_DAYS': True,
+        'OUTFILE_ZLIB_LEVEL': 6,
+        'READ_BACKEND': 'pandas',
+        'READ_COMPACT_DTYPES': False,
+        'READ_MAX_WORKERS': 4,
+        'READ_MEMORY_BUDGET_MB': 2000
         # 'DIR_SOURCE_FILES': Path(r'F:\Downloads\_temp\testing_ppicos\input\12_meteo_forestfloor'),  # testing
         # 'DIR_OUT_ICOS': Path(r'F:\Downloads\_temp\testing_ppicos\output\12_meteo_forestfloor')  # testing
     }
@@ -264,9 +297,17 @@ def f_13_meteo_meteoswiss():
         'FILENAME_POSITION_MONTH': [11, 13],
         'FILENAME_POSITION_YEAR': [7, 11],
         'OUTFILE_COMPRESSION': True,
+        'OUTFILE_CSV_WRITER': 'fast',
         'OUTFILE_DELETE_UNCOMPRESSED': True,
         'OUTFILE_ICOS_FILENUMBER_FN': '02',
-        'OUTFILE_ICOS_LOGGERNUMBER_LN': '20'
+        'OUTFILE_ICOS_LOGGERNUMBER_LN': '20',
+        'OUTFILE_MAX_WORKERS': 4,
+        'OUTFILE_REEXPORT_REVISED_DAYS': True,
+        'OUTFILE_ZLIB_LEVEL': 6,
+        'READ_BACKEND': 'pandas',
+        'READ_COMPACT_DTYPES': False,
+        'READ_MAX_WORKERS': 4,
+        'READ_MEMORY_BUDGET_MB': 2000
         # 'DIR_SOURCE_FILES': Path(r'F:\Downloads\_temp\testing_ppicos\input\13_meteo_meteoswiss'),  # testing
         # 'DIR_OUT_ICOS': Path(r'F:\Downloads\_temp\testing_ppicos\output\13_meteo_meteoswiss')  # testing
     }
@@ -305,9 +346,17 @@ def f_13_meteo_backup_eth():
         'FILENAME_POSITION_MONTH': [29, 31],
         'FILENAME_POSITION_YEAR': [24, 28],
         'OUTFILE_COMPRESSION': True,
+        'OUTFILE_CSV_WRITER': 'fast',
         'OUTFILE_DELETE_UNCOMPRESSED': True,
         'OUTFILE_ICOS_FILENUMBER_FN': '04',
-        'OUTFILE_ICOS_LOGGERNUMBER_LN': '21'
+        'OUTFILE_ICOS_LOGGERNUMBER_LN': '21',
+        'OUTFILE_MAX_WORKERS': 4,
+        'OUTFILE_REEXPORT_REVISED_DAYS': True,
+        'OUTFILE_ZLIB_LEVEL': 6,
+        'READ_BACKEND': 'pandas',
+        'READ_COMPACT_DTYPES': False,
+        'READ_MAX_WORKERS': 8,
+        'READ_MEMORY_BUDGET_MB': 2000
         # 'DIR_SOURCE_FILES': Path(r'F:\Downloads\_temp\testing_ppicos\input\13_meteo_backup_eth'),  # testing
         # 'DIR_OUT_ICOS': Path(r'F:\Downloads\_temp\testing_ppicos\output\13_meteo_backup_eth')  # testing
     }
@@ -358,9 +407,17 @@ def f_13_meteo_nabel():
         'FILENAME_POSITION_MONTH': [18, 20],
         'FILENAME_POSITION_YEAR': [16, 18],
         'OUTFILE_COMPRESSION': True,
+        'OUTFILE_CSV_WRITER': 'fast',
         'OUTFILE_DELETE_UNCOMPRESSED': True,
         'OUTFILE_ICOS_FILENUMBER_FN': '04',  # Updated F03 --> F04 in v4.1
-        'OUTFILE_ICOS_LOGGERNUMBER_LN': '22'
+        'OUTFILE_ICOS_LOGGERNUMBER_LN': '22',
+        'OUTFILE_MAX_WORKERS': 4,
+        'OUTFILE_REEXPORT_REVISED_DAYS': True,
+        'OUTFILE_ZLIB_LEVEL': 6,
+        'READ_BACKEND': 'pandas',
+        'READ_COMPACT_DTYPES': False,
+        'READ_MAX_WORKERS': 4,
+        'READ_MEMORY_BUDGET_MB': 2000
         # 'DIR_SOURCE_FILES': Path(r'F:\Downloads\_temp\testing_ppicos\input\13_meteo_nabel'),  # testing
         # 'DIR_OUT_ICOS': Path(r'F:\Downloads\_temp\testing_ppicos\output\13_meteo_nabel')  # testing
     }
@@ -412,9 +469,17 @@ def f_15_meteo_snowheight():
         'FILENAME_POSITION_MONTH': [22, 24],
         'FILENAME_POSITION_YEAR': [18, 22],
         'OUTFILE_COMPRESSION': True,
+        'OUTFILE_CSV_WRITER': 'fast',
         'OUTFILE_DELETE_UNCOMPRESSED': True,
         'OUTFILE_ICOS_FILENUMBER_FN': '08',
-        'OUTFILE_ICOS_LOGGERNUMBER_LN': '01'
+        'OUTFILE_ICOS_LOGGERNUMBER_LN': '01',
+        'OUTFILE_MAX_WORKERS': 4,
+        'OUTFILE_REEXPORT_REVISED_DAYS': True,
+        'OUTFILE_ZLIB_LEVEL': 6,
+        'READ_BACKEND': 'pandas',
+        'READ_COMPACT_DTYPES': False,
+        'READ_MAX_WORKERS': 4,
+        'READ_MEMORY_BUDGET_MB': 2000
         # 'DIR_SOURCE_FILES': Path(r'L:\Sync\luhk_work\20 - CODING\24 - ICOS\ppicos\example_input_output\input'),  # testing
         # 'DIR_OUT_ICOS': Path(r'L:\Sync\luhk_work\20 - CODING\24 - ICOS\ppicos\example_input_output\output')  # testing
     }
@@ -465,9 +530,17 @@ def f_17_meteo_profile():
         'FILENAME_POSITION_MONTH': [14, 16],
         'FILENAME_POSITION_YEAR': [10, 14],
         'OUTFILE_COMPRESSION': True,
+        'OUTFILE_CSV_WRITER': 'fast',
         'OUTFILE_DELETE_UNCOMPRESSED': True,
         'OUTFILE_ICOS_FILENUMBER_FN': '02',
-        'OUTFILE_ICOS_LOGGERNUMBER_LN': '01'
+        'OUTFILE_ICOS_LOGGERNUMBER_LN': '01',
+        'OUTFILE_MAX_WORKERS': 4,
+        'OUTFILE_REEXPORT_REVISED_DAYS': True,
+        'OUTFILE_ZLIB_LEVEL': 6,
+        'READ_BACKEND': 'pandas',
+        'READ_COMPACT_DTYPES': False,
+        'READ_MAX_WORKERS': 4,
+        'READ_MEMORY_BUDGET_MB': 2000
         # 'DIR_SOURCE_FILES': Path(r'F:\Downloads\_temp\testing_ppicos\input\17_meteo_profile'),  # testing
         # 'DIR_OUT_ICOS': Path(r'F:\Downloads\_temp\testing_ppicos\output\17_meteo_profile')  # testing
     }
@@ -503,11 +576,58 @@ def f_30_profile_ghg():
         'FILENAME_POSITION_HOUR': [],
         'FILENAME_POSITION_MINUTE': [],
         'OUTFILE_COMPRESSION': True,
+        'OUTFILE_CSV_WRITER': 'fast',
         'OUTFILE_DELETE_UNCOMPRESSED': True,
         'OUTFILE_ICOS_FILENUMBER_FN': '02',  # renamed to correct ICOS file number
-        'OUTFILE_ICOS_LOGGERNUMBER_LN': '10'
+        'OUTFILE_ICOS_LOGGERNUMBER_LN': '10',
+        'OUTFILE_MAX_WORKERS': 4,
+        'OUTFILE_REEXPORT_REVISED_DAYS': True,
+        'OUTFILE_ZLIB_LEVEL': 6,
+        'READ_BACKEND': 'pandas',
+        'READ_COMPACT_DTYPES': False,
+        'READ_MAX_WORKERS': 8,
+        'READ_MEMORY_BUDGET_MB': 2000
         # 'DIR_SOURCE_FILES': Path(r'F:\Downloads\_temp\testing_ppicos\input\30_profile_ghg'),  # testing
         # 'DIR_OUT_ICOS': Path(r'F:\Downloads\_temp\testing_ppicos\output\30_profile_ghg')  # testing
     }
 
     return file_info
+
+
+# Filetypes by name, used by cli.py and start_ALL.py
+FILETYPES = {
+    '10_meteo': f_10_meteo,
+    '10_meteo_heatflag_sonic': f_10_meteo_heatflag_sonic,
+    '11_meteo_hut_prec': f_11_meteo_hut_prec,
+    '12_meteo_forest_floor_1': partial(f_12_meteo_forest_floor, forest_floor=1, table=1),
+    '12_meteo_forest_floor_2': partial(f_12_meteo_forest_floor, forest_floor=2, table=1),
+    '12_meteo_forest_floor_3': partial(f_12_meteo_forest_floor, forest_floor=3, table=1),
+    '12_meteo_forest_floor_4': partial(f_12_meteo_forest_floor, forest_floor=4, table=1),
+    '12_meteo_forest_floor_5': partial(f_12_meteo_forest_floor, forest_floor=5, table=1),
+    '13_meteo_backup_eth': f_13_meteo_backup_eth,
+    '13_meteo_meteoswiss': f_13_meteo_meteoswiss,
+    '13_meteo_nabel': f_13_meteo_nabel,
+    '15_meteo_snowheight': f_15_meteo_snowheight,
+    '17_meteo_profile': f_17_meteo_profile,
+    '30_profile_ghg': f_30_profile_ghg
+}
+
+# Names that select several filetypes
+FILETYPE_GROUPS = {
+    'all': list(FILETYPES),
+    '12_meteo_forest_floor': [f'12_meteo_forest_floor_{ff}' for ff in range(1, 6)]
+}
+
+
+def get_filetypes(names: list = None) -> dict:
+    """Filesettings of filetypes (keys: names) selected by filetype or group names, all filetypes if None"""
+    selected = []
+    for name in names or ['all']:
+        if name in FILETYPES:
+            selected.append(name)
+        elif name in FILETYPE_GROUPS:
+            selected += FILETYPE_GROUPS[name]
+        else:
+            raise ValueError(f"Unknown filetype {name}, must be one of "
+                             f"{list(FILETYPES) + list(FILETYPE_GROUPS)}")
+    return {name: FILETYPES[name]() for name in dict.fromkeys(selected)}
@@ -0,0 +1,336 @@
+"""
+Fast writer for ICOS CSV files
+
+ICOS files are written with
+
+    df.to_csv(quoting=csv.QUOTE_NONNUMERIC, index=False, na_rep='NaN', lineterminator='\\r\\n')
+
+For this combination, pandas converts each value to a Python object and writes
+the file row by row. The writer in this module gives byte-identical output, but
+formats whole columns at once:
+
+- Numbers are written as digits into a matrix of characters, with one row for
+  each character position and one column for each record. Floats get the same
+  shortest round-trip representation as repr(), e.g. 1.0, -0.587989 or 1e-05.
+  Floats that cannot be written with the fast method (too many digits, exponent
+  notation, inf) are formatted by numpy, which gives the same result.
+- Text is quoted, missing values are written as "NaN".
+- The header rows (column names, units) are rendered once by pandas and re-used.
+- The data of several days are serialized in one step (at most SERIALIZE_MAX_ROWS
+  records, to limit the memory needed), the CSV of each day is then cut from the
+  serialized data.
+
+Data that are not supported (e.g. timestamps with fractional seconds or text
+with unusual objects) raise NotSupportedError, the pandas writer can then be
+used instead. check_conformance compares the output to the pandas writer.
+
+"""
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+QUOTECHAR = '"'
+NA_REP = 'NaN'
+LINETERMINATOR = '\r\n'
+ENCODING = 'utf-8'
+
+# Number of cells pandas writes in one go, the format of datetime columns
+# (with or without time) is detected separately for each chunk of rows
+PANDAS_CHUNKSIZE_CELLS = 100000
+
+# Max number of records serialized in one step, the characters of all cells
+# need about 20 bytes per cell
+SERIALIZE_MAX_ROWS = 20000
+
+# Floats are written with the fast method if they have at most MAX_DIGITS significant
+# digits, with more digits the shortest representation is not unique
+MAX_DIGITS = 15
+MAX_DECIMALS = 15
+POW10 = 10.0 ** np.arange(MAX_DIGITS + 2)
+
+
+class NotSupportedError(ValueError):
+    """Data cannot be written by the fast writer"""
+
+
+def to_csv_pandas(df: DataFrame, path_or_buf=None, header: bool = True):
+    """Write ICOS CSV with pandas, the reference for the fast writer"""
+    # - note the quote arguments: these make sure that the header, row indices and also NANs
+    #   are output with double quotes. also, index=False b/c timestamp was inserted as regular column
+    # - na_rep is used to fix representation for NaNs in output csv file
+    #   for the ICOS files, NaN is used, in combination with the quote args NaN is output as "NaN"
+    #   we need it like this b/c we defined missing values for the files as "NaN"
+    return df.to_csv(path_or_buf,
+                     quotechar=QUOTECHAR,
+                     quoting=csv.QUOTE_NONNUMERIC,
+                     index=False,
+                     header=header,
+                     na_rep=NA_REP,
+                     lineterminator=LINETERMINATOR)
+
+
+class IcosCsvWriter:
+    """Serialize data to ICOS CSV, with the same output as to_csv_pandas"""
+
+    def __init__(self, header: bool = True):
+        self.header = header
+        self._header_columns = None
+        self._header_bytes = b''
+
+    def get_header(self, df: DataFrame) -> bytes:
+        """Header rows, rendered once for the columns of the filetype"""
+        if not self.header:
+            return b''
+        if (self._header_columns is None) or (not self._header_columns.equals(df.columns)):
+            self._header_bytes = to_csv_pandas(df=df.iloc[:0], header=True).encode(ENCODING)
+            self._header_columns = df.columns
+        return self._header_bytes
+
+    def to_bytes(self, df: DataFrame) -> bytes:
+        """Serialize data to one CSV file"""
+        return self.serialize(df=df, bounds=[(0, len(df))])[0]
+
+    def serialize(self, df: DataFrame, bounds: list) -> list:
+        """Serialize data once and return the CSV for each part of the data
+
+        Args:
+            df: data with the columns of the ICOS file
+            bounds: list of (start, end) row positions, each part is one file
+
+        Returns:
+            list with the content of each file (bytes), incl. header
+
+        Raises:
+            NotSupportedError: if the data cannot be written by the fast writer
+        """
+        header = self.get_header(df=df)
+        contents = []
+        for batch in _get_batches(bounds=bounds, max_rows=SERIALIZE_MAX_ROWS):
+            offset = batch[0][0]
+            batch = [(start - offset, end - offset) for start, end in batch]
+            data, positions = self._serialize_rows(df=df.iloc[offset:offset + batch[-1][1]], bounds=batch)
+            contents += [header + data[positions[start]:positions[end]] for start, end in batch]
+        return contents
+
+    def _serialize_rows(self, df: DataFrame, bounds: list) -> tuple:
+        """Serialize all records of df, returns the data and the byte position of each record"""
+        n = len(df)
+        chunks = _get_pandas_chunks(n_columns=len(df.columns), bounds=bounds)
+
+        # Characters of all cells, one row for each character position, padded with zeros
+        columns = [_format_column(series=df.iloc[:, ix], chunks=chunks) for ix in range(len(df.columns))]
+
+        # Characters of each record in one row, columns are copied one after the other
+        lineterminator = np.frombuffer(LINETERMINATOR.encode(ENCODING), dtype=np.uint8)
+        width = sum(len(chars) for chars in columns) + len(columns) - 1 + len(lineterminator)
+        matrix = np.zeros((n, width), dtype=np.uint8)
+        pos = 0
+        for ix in range(len(columns)):
+            if ix > 0:
+                matrix[:, pos] = ord(',')
+                pos += 1
+            chars, columns[ix] = columns[ix], None
+            matrix[:, pos:pos + len(chars)] = chars.T
+            pos += len(chars)
+        matrix[:, pos:] = lineterminator
+
+        # Remove padding, records are joined in their order
+        positions = np.concatenate([[0], np.cumsum(np.count_nonzero(matrix, axis=1))])
+        return matrix.tobytes().translate(None, b'\x00'), positions
+
+
+def _get_batches(bounds: list, max_rows: int) -> list:
+    """Group consecutive parts of the data, each group has at most max_rows records (or one part)"""
+    batches = []
+    for start, end in bounds:
+        if batches and (end - batches[-1][0][0] <= max_rows):
+            batches[-1].append((start, end))
+        else:
+            batches.append([(start, end)])
+    return batches
+
+
+def _get_pandas_chunks(n_columns: int, bounds: list) -> list:
+    """Row positions (start, end) of the chunks pandas would write for each file"""
+    chunksize = (PANDAS_CHUNKSIZE_CELLS // (n_columns or 1)) or 1
+    chunks = []
+    for start, end in bounds:
+        for chunk_start in range(start, end, chunksize):
+            chunks.append((chunk_start, min(chunk_start + chunksize, end)))
+    return chunks
+
+
+def _fill(n: int, chars: bytes) -> np.ndarray:
+    """Same characters for n records, one row for each character"""
+    chars = np.frombuffer(chars, dtype=np.uint8)
+    return np.repeat(chars[:, None], n, axis=1)
+
+
+def _fill_where(where: np.ndarray, chars: bytes) -> np.ndarray:
+    """Characters for records where True, one row for each character"""
+    chars = np.frombuffer(chars, dtype=np.uint8)
+    return np.where(where[None, ...], chars.reshape((-1,) + (1,) * where.ndim), 0).astype(np.uint8)
+
+
+def _overlay(parts: list) -> np.ndarray:
+    """Combine characters of different records (each record is not zero in only one part)"""
+    if len(parts) == 1:
+        return parts[0]
+    combined = np.zeros((max(len(chars) for chars in parts),) + parts[0].shape[1:], dtype=np.uint8)
+    for chars in parts:
+        combined[:len(chars)] |= chars
+    return combined
+
+
+def _to_rows(strings: np.ndarray) -> np.ndarray:
+    """Characters of bytes (dtype S), one row for each character, padded with zeros"""
+    width = max(strings.dtype.itemsize, 1)
+    strings = np.ascontiguousarray(strings, dtype=f'S{width}')
+    chars = strings.view(np.uint8).reshape(strings.shape + (width,))
+    return np.ascontiguousarray(np.moveaxis(chars, -1, 0))
+
+
+def _format_column(series: pd.Series, chunks: list) -> np.ndarray:
+    """Format values of one column"""
+    dtype = series.dtype
+    if not isinstance(dtype, np.dtype):
+        raise NotSupportedError(f"data type {dtype} is not supported")
+    values = series.to_numpy()
+    if dtype == np.dtype('datetime64[ns]'):
+        return _format_datetimes(values=values.view(np.int64), chunks=chunks)
+    if dtype.kind == 'f':
+        return _format_floats(values=values.astype(np.float64))
+    if dtype.kind in 'iub':
+        return _to_rows(values.astype('S'))
+    if dtype.kind == 'O':
+        return _format_objects(values=values)
+    raise NotSupportedError(f"data type {dtype} is not supported")
+
+
+def _format_floats(values: np.ndarray) -> np.ndarray:
+    """Format floats like repr(), e.g. 1.0, -0.587989, 1e-05, missing values as "NaN"
+
+    Floats are written as digits if the shortest representation has at most
+    MAX_DIGITS digits and no exponent, i.e. if value * 10 ** n_decimals
+    is an integer that gives back the same value when divided by 10 ** n_decimals.
+    """
+    shape = values.shape
+    absvalues = np.abs(values)
+    is_nan = np.isnan(values)
+
+    # Smallest number of decimals that gives back the value
+    # - a trailing zero is not possible, it would have given back the value with one decimal less
+    # - all calculations are done with floats, integers up to 10 ** MAX_DIGITS are exact
+    n_decimals = np.full(shape, -1, dtype=np.int64)
+    digits = np.zeros(shape, dtype=np.float64)
+    todo = np.isfinite(values) & ((absvalues >= 1e-4) | (absvalues == 0))  # Otherwise repr() uses an exponent
+    for decimals in range(MAX_DECIMALS + 1):
+        if not todo.any():
+            break
+        with np.errstate(invalid='ignore', over='ignore'):
+            scaled = np.rint(absvalues * 10.0 ** decimals)
+            ok = todo & (scaled < 10.0 ** MAX_DIGITS) & (scaled / 10.0 ** decimals == absvalues)
+        np.copyto(n_decimals, decimals, where=ok)
+        np.copyto(digits, scaled, where=ok)
+        todo &= ~ok
+    is_fast = n_decimals >= 0
+    n_decimals[~is_fast] = 0
+
+    # Sign, integer part without leading zeros, decimals without trailing zeros
+    # - digits are calculated with floor(), the values are not negative and smaller
+    #   than 10 ** MAX_DIGITS, i.e. the division by powers of 10 is exact enough
+    int_part = np.floor(digits / POW10[n_decimals])
+    frac_part = (digits - int_part * POW10[n_decimals])
+    int_width = len(str(int(int_part.max()))) if values.size else 1
+    frac_width = max(int(n_decimals.max()) if values.size else 0, 1)
+    frac_part *= POW10[frac_width - n_decimals]  # Decimals left-aligned
+
+    # Characters are written directly as uint8, one row for each character position
+    chars = np.zeros((1 + int_width + 1 + frac_width,) + shape, dtype=np.uint8)
+    chars[0] = np.where(is_fast & np.signbit(values), ord('-'), 0)
+    higher = np.zeros(shape)
+    for row, power in enumerate(range(int_width - 1, -1, -1), start=1):
+        shifted = np.floor(int_part / POW10[power])
+        show = is_fast & ((shifted > 0) | (power == 0))
+        chars[row] = np.where(show, ord('0') + shifted - 10 * higher, 0)
+        higher = shifted
+    chars[1 + int_width] = np.where(is_fast, ord('.'), 0)
+    higher = np.zeros(shape)
+    for pos in range(frac_width):
+        shifted = np.floor(frac_part / POW10[frac_width - 1 - pos])
+        show = is_fast & ((pos < n_decimals) | (pos == 0))  # e.g. 1.0
+        chars[2 + int_width + pos] = np.where(show, ord('0') + shifted - 10 * higher, 0)
+        higher = shifted
+    rows = [chars]
+
+    # Other values
+    is_other = ~is_fast & ~is_nan
+    if is_other.any():
+        other = np.zeros(shape, dtype=object)
+        other[is_other] = values[is_other].astype('S')  # Same as repr() for float64
+        rows.append(_to_rows(np.where(is_other, other, b'').astype('S')))
+    if is_nan.any():
+        rows.append(_fill_where(where=is_nan, chars=_quoted_na()))
+    return _overlay(rows)
+
+
+def _quoted_na() -> bytes:
+    return f'{QUOTECHAR}{NA_REP}{QUOTECHAR}'.encode(ENCODING)
+
+
+def _format_objects(values: np.ndarray) -> np.ndarray:
+    """Format text, quoted, missing values as "NaN" """
+    is_na = pd.isna(values)
+    na = _quoted_na()
+    doubled = QUOTECHAR * 2
+    formatted = []
+    for value, value_is_na in zip(values, is_na):
+        if value_is_na:
+            formatted.append(na)
+        elif isinstance(value, str) and ('\x00' not in value):
+            formatted.append(f'{QUOTECHAR}{value.replace(QUOTECHAR, doubled)}{QUOTECHAR}'.encode(ENCODING))
+        else:
+            raise NotSupportedError(f"value {value!r} of type {type(value)} is not supported")
+    return _to_rows(np.array(formatted, dtype='S'))
+
+
+def _format_datetimes(values: np.ndarray, chunks: list) -> np.ndarray:
+    """Format timestamps (int64 nanoseconds) like pandas, quoted, NaT as "NaN"
+
+    pandas writes only the date if all timestamps in a chunk are at midnight,
+    otherwise date and time.
+    """
+    is_nat = values == pd.NaT.value
+    if (values[~is_nat] % 1_000_000_000 != 0).any():
+        raise NotSupportedError("timestamps with fractional seconds are not supported")
+    n = len(values)
+    seconds = np.where(is_nat, 0, values).astype('datetime64[ns]').astype('datetime64[s]')
+    chars = _to_rows(np.datetime_as_string(seconds, unit='s').astype('S'))  # e.g. 2018-10-23T00:30:00
+    chars[10] = ord(' ')
+
+    # Date only in chunks with all timestamps at midnight
+    is_midnight = (values % (86400 * 1_000_000_000) == 0) | is_nat
+    for start, end in chunks:
+        if is_midnight[start:end].all():
+            chars[10:, start:end] = 0
+
+    quote = _fill(n, QUOTECHAR.encode(ENCODING))
+    rows = np.vstack([quote, chars, quote])
+    rows[:, is_nat] = 0
+    return _overlay([rows, _fill_where(where=is_nat, chars=_quoted_na())])
+
+
+def check_conformance(df: DataFrame, header: bool = True, bounds: list = None) -> bool:
+    """Check that the fast writer gives the same output as the pandas writer"""
+    if bounds is None:
+        bounds = [(0, len(df))]
+    writer = IcosCsvWriter(header=header)
+    for (start, end), content in zip(bounds, writer.serialize(df=df, bounds=bounds)):
+        buf = io.StringIO()
+        to_csv_pandas(df=df.iloc[start:end], path_or_buf=buf, header=header)
+        if buf.getvalue().encode(ENCODING) != content:
+            return False
+    return True
@@ -1,41 +1,124 @@
+"""
+Text output to console and log file
+
+Messages are handed to a queue and written to the log file and the console
+by a background thread, i.e. writing does not slow down processing. The log
+level is INFO by default and can be changed with the environment variable
+PPICOS_LOG_LEVEL (e.g. PPICOS_LOG_LEVEL=DEBUG). At level DEBUG, details for
+each item are logged, e.g. each file that is found, read or skipped and each
+timestamp that is removed, at level INFO these are summarised.
+
+Call Logger.close at the end of the run to write the remaining messages and
+close the log file, otherwise this is done when Python exits.
+
+"""
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import sys
 import time
 
+ENV_LOG_LEVEL = 'PPICOS_LOG_LEVEL'
+DEFAULT_LOG_LEVEL = 'INFO'
+
+# Number of items shown in summarised lists, see format_list
+MAX_LIST_ITEMS = 6
+
 
 class Logger(object):
-    def __init__(self, run_id, logdir, filetype):
+    def __init__(self, run_id, logdir, filetype, level=None):
         super(Logger, self).__init__()
 
+        # Log level from argument or environment variable
+        level = level or os.environ.get(ENV_LOG_LEVEL) or DEFAULT_LOG_LEVEL
+        level = level.upper() if isinstance(level, str) else level
+
         # create logger
         outfile = os.path.join(logdir, run_id)
         logfile = '{}_{}.log'.format(outfile, filetype)
         logger = logging.getLogger(logfile)
-        logger.setLevel(logging.INFO)
+        logger.setLevel(level)
+        logger.propagate = False  # Messages are not passed to handlers of the root logger
         formatter = logging.Formatter('%(message)s')  # create formatter for handlers
         # formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        # create file handler
-        fh = logging.FileHandler(logfile, mode='w')  # create file handler
-        fh.setLevel(logging.INFO)  # logs info messages and above
-        fh.setFormatter(formatter)  # add formatter to the handler
-        logger.addHandler(fh)  # add the handler to logger
+
+        # create file and console handler, both are run by a background thread
+        fh = logging.FileHandler(logfile, mode='w')
+        fh.setFormatter(formatter)
+        sh = logging.StreamHandler(sys.stdout)
+        sh.setFormatter(formatter)
+        self._queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        self._listener = logging.handlers.QueueListener(self._queue_handler.queue, fh, sh)
+        self._listener.start()
+        logger.addHandler(self._queue_handler)
+        atexit.register(self.close)
+
         self.logger = logger
+        self.logfilepath = logfile
+        self.profiler = None  # Profiling of sections (profiling.py), switched off if None
+
+    def log_debug(self, record):
+        # details, only output if log level is DEBUG
+        self.logger.debug(record)
+        return None
 
     def log_info(self, record):
         # outputs to console and log file
         self.logger.info(record)
-        print(record)
+        return None
 
+    def log_warning(self, record):
+        self.logger.warning(record)
         return None
 
+    def is_debug(self) -> bool:
+        """Check if details are logged, avoids building messages that are not output"""
+        return self.logger.isEnabledFor(logging.DEBUG)
+
+    def close(self):
+        """Write remaining messages, close log file and remove handlers"""
+        if self._listener is None:
+            return None
+        self._listener.stop()
+        self.logger.removeHandler(self._queue_handler)
+        for handler in self._listener.handlers:
+            handler.close()
+        self._listener = None
+        atexit.unregister(self.close)
+        logging.Logger.manager.loggerDict.pop(self.logger.name, None)  # Each run has its own logger
+        return None
+
+
+def format_list(items, max_items: int = MAX_LIST_ITEMS) -> str:
+    """Short text for long lists in log messages, e.g. ['a', 'b', 'c', ..., 'x', 'y', 'z'] (26 items)"""
+    items = [str(x) for x in items]
+    if len(items) <= max_items:
+        return str(items)
+    n_head = max_items // 2
+    shown = items[:n_head] + ['...'] + items[-(max_items - n_head):]
+    return '[{}] ({} items)'.format(', '.join(x if x == '...' else repr(x) for x in shown), len(items))
+
 
 def section_start(logger, section_name):
     tic = time.time()
     logger.log_info("\n\n\n{}\n{} SECTION START".format('-' * 80, section_name))
+    if logger.profiler:
+        logger.profiler.start(section_name=section_name)
     return tic
 
 
 def section_end(logger, section_name, tic):
     section_runtime = time.time() - tic
+    if logger.profiler:
+        logger.profiler.stop(section_name=section_name, runtime=section_runtime)
     logger.log_info('{} SECTION END. Runtime: {:.4f}s'.format(section_name, section_runtime))
     return None
+
+
+def section_count(logger, section_name, **counters):
+    """Add counters to the section if it is profiled, e.g. rows=100"""
+    if logger.profiler:
+        logger.profiler.count(section_name=section_name, **counters)
+    return None
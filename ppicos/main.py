@@ -8,25 +8,30 @@ Post-processing of raw data files:
 Format original raw data files to ICOS-compliant format.
 
 """
-import csv
 import datetime
-import fnmatch
+import hashlib
+import io
 import os
 import sys
 import zipfile as zf
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
 
-import html
-
-pd.options.display.width = None
-pd.options.display.max_columns = None
-# pd.set_option('display.max_rows', 3000)
-pd.set_option('display.max_columns', 3000)
+import cache
+import compact
+import dirindex
+import icoscsv
 import logger
+import manifest
+import planner
+import profiling
+import readers
+import statestore
 import tools
 from logger import Logger
 
@@ -38,20 +43,79 @@ class IcosFormat:
 
     def __init__(self,
                  filesettings: dict,
-                 max_age_days: int = 5):
+                 max_age_days: int = 5,
+                 use_cache: bool = True,
+                 profile: str = None,
+                 profile_sections: str = None,
+                 days: list = None,
+                 search_window: tuple = None,
+                 overwrite: bool = False):
+        """
+        Args:
+            days: only these days are exported (if they were not processed yet), e.g. complete
+                days detected by daemon.py, if None all days in the search window are exported
+            search_window: first and last day (datetime.date) of the search window, e.g. a
+                partition of backfill.py, if None the search window ends yesterday and starts
+                max_age_days before today. Only days in the search window are exported, files
+                of the day before and after are also searched.
+            overwrite: export days again even if they are listed in the filetype logfile
+            profile: profiling of sections, e.g. 'cprofile,memory', if None the
+                environment variable PPICOS_PROFILE is used (see profiling.py)
+            profile_sections: comma-separated names of the profiled sections, if None
+                the environment variable PPICOS_PROFILE_SECTIONS is used
+        """
         self.filesettings = filesettings
         self.max_age_days = max_age_days
+        self.search_window = tuple(search_window) if search_window else None
+        self.overwrite = overwrite
 
-        # Make identifier for this run
+        # Make identifier for this run, runs with a search window (e.g. backfill partitions
+        # running in parallel) get their own log file
         self.run_id, self.run_start_datestr, self.run_start_dt = tools.make_run_id()
+        if self.search_window:
+            self.run_id += f"-{self.search_window[0]:%Y%m%d}-{self.search_window[1]:%Y%m%d}"
 
         # Init logger
         self.logger = self._setup_logger()
 
+        # Profiling of sections, switched off by default
+        self.logger.profiler = profiling.get_profiler(
+            logfilepath=self.logger.logfilepath, profile=profile, profile_sections=profile_sections,
+            info=dict(run_id=self.run_id, filegroup=self.filesettings['FILE_FILEGROUP'], max_age_days=max_age_days))
+        if self.logger.profiler:
+            self.logger.log_info(f"PROFILING:     {', '.join(self.logger.profiler.report['profile_tools'])} "
+                                 f"(report: {self.logger.profiler.reportfilepath})")
+
         # Location of filetype logfile, stores names of already-processed files
         logfilename_alreadyprocessed = f"ppicos_{self.filesettings['FILE_FILEGROUP']}_files-already-processed.log"
         self.logfilepath_alreadyprocessed = self.filesettings['DIR_OUT_ICOS'] / logfilename_alreadyprocessed
-        self.filetype_logfile_contents = self._read_filetype_logfile()
+
+        # Database of already-processed files on local disk, the filetype logfile is kept in sync for operators
+        self.dbfilepath_alreadyprocessed = statestore.get_dbfilepath(filegroup=self.filesettings['FILE_FILEGROUP'],
+                                                                     outdir=self.filesettings['DIR_OUT_ICOS'])
+        self.processed_files = self._open_processed_files_store()
+
+        # Location of file coverage index, stores first and last timestamp of source files
+        filename_coverage_index = f"ppicos_{self.filesettings['FILE_FILEGROUP']}_file-coverage.csv"
+        self.filepath_coverage_index = self.filesettings['DIR_OUT_ICOS'] / filename_coverage_index
+
+        # Cache for parsed source files, use_cache=False always reads files from source
+        self.cache = cache.ParsedFileCache(filesettings=self.filesettings) if use_cache else None
+
+        # Days that were not exported yet, detected before reading files
+        self.target_days = []
+        self.days = set(days) if days is not None else None
+
+        # Days that were already exported, but their source files were revised (filename and
+        # previous record in the database of already-processed files), exported again
+        self.revised = {}
+
+        # Reader for source files, numeric columns are detected from the first file
+        self.reader = readers.get_reader(filesettings=self.filesettings)
+        self.dtypes = None
+
+        # Writer for ICOS files, header rows are rendered once
+        self.icos_csv_writer = icoscsv.IcosCsvWriter(header=self.filesettings['DATA_HEADER_OUTPUT_TO_FILE'])
 
         # ICOS timestamp column
         if len(self.filesettings['DATA_HEADER_ROWS']) > 1:
@@ -59,20 +123,41 @@ class IcosFormat:
         else:
             self.icos_timestamp_col = 'TIMESTAMP'
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close database of already-processed files and log file"""
+        self.processed_files.close()
+        self.logger.close()
+
     def run(self):
         """Run ppicos processing chain"""
 
         # Search files in source and make a dataframe
         input_files_df = self._generate_file_list()
 
-        # Read all data from input files to dataframe
-        merged_df = self._readfiles(filepaths=input_files_df['ETH_FILEPATH'].to_list())
+        # Keep only files that contain data for days that were not exported yet
+        input_files_df = self._plan_files_for_target_days(files_df=input_files_df)
+        if input_files_df.empty:
+            self.logger.log_info('\nAll days in the search window were already processed, nothing to do.')
+            return
+
+        if self._use_streaming(files_df=input_files_df):
+            # Read, format and export data one day after the other
+            self._run_streaming(files_df=input_files_df)
+        else:
+            # Read all data from input files to dataframe
+            merged_df = self._readfiles(filepaths=input_files_df['ETH_FILEPATH'].to_list())
 
-        # Format data to ICOS formats
-        merged_df = self._format_data(df=merged_df)
+            # Format data to ICOS formats
+            merged_df = self._format_data(df=merged_df)
 
-        # Export data as daily files
-        self._export_data(df=merged_df)
+            # Export data as daily files
+            self._export_data(df=merged_df, files_df=input_files_df)
 
         # # Make HTML overview list
         # self._make_html()
@@ -81,14 +166,87 @@ class IcosFormat:
         script_runtime = datetime.datetime.now() - self.run_start_dt
         self.logger.log_info(f'\nSCRIPT RUNTIME FOR THIS FILETYPE: {script_runtime.total_seconds():.4f}s')
 
+    def _use_streaming(self, files_df) -> bool:
+        """Check if the memory estimated for reading all files at once exceeds the memory budget"""
+        budget_mb = self.filesettings['READ_MEMORY_BUDGET_MB']
+        if budget_mb is None:
+            return False
+        estimated_mb = planner.estimate_memory_bytes(filepaths=files_df['ETH_FILEPATH']) / 1024 ** 2
+        use_streaming = estimated_mb > budget_mb
+        self.logger.log_info(f"\nEstimated memory needed for {len(files_df)} files: {estimated_mb:.0f} MB "
+                             f"(budget: {budget_mb} MB), "
+                             f"{'processing one day after the other' if use_streaming else 'processing all days at once'}")
+        return use_streaming
+
+    def _run_streaming(self, files_df) -> None:
+        """Read, format and export data one day after the other
+
+        Only the files that contain data for the current day are kept in memory. The
+        continuous timestamp of each day is generated in the same way as if all files
+        were merged, i.e. from the first to the last timestamp in all files.
+        """
+        section_name = '[streaming days]'
+        freq = pd.Timedelta(self.filesettings['DATA_FREQUENCY'])
+        filepaths = files_df['ETH_FILEPATH'].to_list()
+        file_lasts = dict(zip(filepaths, files_df['FILE_LAST']))
+        known_firsts = [x for x in files_df['FILE_FIRST'] if x is not None]
+        known_lasts = [x for x in files_df['FILE_LAST'] if x is not None]
+
+        loaded = {}  # Data of files that are needed for the current or later days
+        for day in self.target_days:
+            tic = logger.section_start(logger=self.logger, section_name=section_name)
+
+            # Original timestamps of this day, daily files are created from TIMESTAMP_MIDDLE
+            # (see _convert_index_to_middle_timestamp), i.e. the record at midnight belongs to the
+            # previous day
+            day_start = pd.Timestamp(day) + freq / 2
+            day_end = day_start + pd.Timedelta(days=1)
+            intervals = [(day_start.to_pydatetime() - datetime.timedelta(microseconds=1), day_end.to_pydatetime())]
+            needed = [filepath for filepath, first, last
+                      in zip(filepaths, files_df['FILE_FIRST'], files_df['FILE_LAST'])
+                      if planner.covers_intervals(first=first, last=last, intervals=intervals)]
+            new = [filepath for filepath in needed if filepath not in loaded]
+            self.logger.log_info(f"{section_name} Day {day}: {len(needed)} files contain data for this day, "
+                                 f"{len(needed) - len(new)} of them are already in memory")
+            loaded.update(zip(new, self._readfiles_parallel(filepaths=new, section_name=section_name)))
+            file_dfs = [loaded[filepath] for filepath in needed if loaded[filepath] is not None]
+            merged_df = pd.concat(file_dfs, axis=0) if file_dfs else pd.DataFrame(index=pd.DatetimeIndex([]))
+
+            # First and last timestamp in all files
+            first = min(known_firsts + list(merged_df.index.dropna()[:1]), default=None)
+            last = max(known_lasts + list(merged_df.index.dropna()[-1:]), default=None)
+
+            # Files that end before the next day are not needed anymore
+            for filepath in needed:
+                if (file_lasts[filepath] is not None) and (file_lasts[filepath] <= day_end):
+                    del loaded[filepath]
+
+            merged_df = merged_df.loc[(merged_df.index >= day_start) & (merged_df.index < day_end)].copy()
+            logger.section_end(logger=self.logger, section_name=section_name, tic=tic)
+            if merged_df.empty:
+                self.logger.log_info(f"{section_name} (!) No data found for day {day}, skipping day")
+                continue
+
+            # Continuous timestamp for this day, starting from the first timestamp in all files
+            if first < day_start:
+                first -= ((first - day_start) // freq) * freq
+            last = min(last, day_end - pd.Timedelta(1, unit='ns'))
+            merged_df = self._format_data(df=merged_df, index_range=(first, last))
+            if merged_df.empty:
+                continue
+            self._export_data(df=merged_df, files_df=files_df)
+
+        self._evict_cache(section_name=section_name)
+
     def _make_html(self):
         """Make the index html for this site"""
+        import html  # jinja2 is only imported if the overview is made
         html.make_file_overview(filetype=self.filesettings['FILE_FILEGROUP'],
                                 site_html_outdir=self.filesettings['DIR_OUT_ICOS'],
                                 settings_dict=self.filesettings,
                                 run_id=self.run_id,
                                 run_date=self.run_start_datestr,
-                                table=self.filetype_logfile_contents)
+                                table=self.logfilepath_alreadyprocessed.read_text())
 
     def _create_icos_filename(self, year, month, day) -> str:
         """Create ICOS filename"""
@@ -99,8 +257,49 @@ class IcosFormat:
                 file=self.filesettings['OUTFILE_ICOS_FILENUMBER_FN'])
         return outfilename_icos
 
+    def _create_filename_for_filetype_logfile(self, date) -> str:
+        """Create filename (zipped or uncompressed) that is listed in the filetype logfile"""
+        outfilename_icos = self._create_icos_filename(year=date.year, month=date.month, day=date.day)
+        if self.filesettings['OUTFILE_COMPRESSION']:
+            outfilename_icos = f"{Path(outfilename_icos).stem}.zip"
+        return outfilename_icos
+
+    def _get_search_window(self) -> tuple:
+        """First and last day of the search window (argument search_window or max_age_days)"""
+        if self.search_window:
+            return self.search_window
+        return tools.set_search_window(max_age_days=self.max_age_days)
+
+    def _get_file_search_window(self) -> tuple:
+        """First and last day of the search for files, includes days before and after an explicit search window"""
+        search_firstdate, search_lastdate = self._get_search_window()
+        if self.search_window:
+            # Files of the day before and after can contain data of the first and last day,
+            # e.g. the record at midnight (plus the previous date if data are complemented)
+            n_days_before = 2 if self.filesettings['DATA_COMPLEMENT_WITH_PREVIOUS_DATE'] else 1
+            search_firstdate -= datetime.timedelta(days=n_days_before)
+            search_lastdate += datetime.timedelta(days=1)
+        return search_firstdate, search_lastdate
+
+    def _is_excluded_day(self, date) -> bool:
+        """Check if date is not one of the selected days (argument days) or outside the argument search_window"""
+        if self.search_window and not (self.search_window[0] <= date <= self.search_window[1]):
+            return True
+        return (self.days is not None) and (date not in self.days)
+
+    def is_exported(self, date) -> bool:
+        """Check if the daily file of date is listed in the database of already-processed files"""
+        return self.processed_files.is_processed(filename=self._create_filename_for_filetype_logfile(date=date))
+
+    def _is_listed_in_filetype_logfile(self, filename) -> bool:
+        """Check if filename is listed in the logfile of already-processed files, always False with
+        overwrite and for days with revised source files"""
+        if self.overwrite or (filename in self.revised):
+            return False
+        return self.processed_files.is_processed(filename=filename)
+
     def _check_if_already_processed(self, filename, grp_date, section_name) -> bool:
-        if filename in self.filetype_logfile_contents:
+        if self._is_listed_in_filetype_logfile(filename=filename):
             checkok = False
             self.logger.log_info(f"{section_name}    --| NOT creating daily file {filename} "
                                  f"for date {grp_date}, already listed in filetype logfile")
@@ -108,7 +307,7 @@ class IcosFormat:
             checkok = True
         return checkok
 
-    def _export_data(self, df):
+    def _export_data(self, df, files_df):
         """Export data to ICOS daily files"""
 
         # Start section
@@ -120,8 +319,37 @@ class IcosFormat:
 
         # Group data by date, this works because the
         # timestamp index TIMESTAMP_MIDDLE is used for grouping
-        grouped_daily = df.groupby(df.index.date)
-        for grp_date, grp_df in grouped_daily:
+        # - the index is sorted (continuous timestamp), otherwise rows are sorted by
+        #   date and keep their order within the date
+        if not df.index.is_monotonic_increasing:
+            df = df.iloc[np.argsort(tools.get_day_codes(index=df.index), kind='stable')]
+        day_bounds = tools.get_day_bounds(index=df.index)
+
+        # Only target days are exported, the files that were read can also contain data of
+        # other days (e.g. the previous date for DATA_COMPLEMENT_WITH_PREVIOUS_DATE), these
+        # days are already exported or outside the search window
+        target_days = set(self.target_days)
+        other_days = [grp_date for grp_date in day_bounds if grp_date not in target_days]
+        if other_days:
+            self.logger.log_info(f"{section_name} NOT creating daily files for {len(other_days)} days that are "
+                                 f"not target days: {logger.format_list(other_days)}")
+        day_bounds = {grp_date: day_bound for grp_date, day_bound in day_bounds.items()
+                      if (grp_date in target_days) and not self._is_excluded_day(date=grp_date)}
+
+        # Rows of days that were not processed yet
+        export_bounds = {grp_date: day_bound for grp_date, day_bound in day_bounds.items()
+                         if not self._is_listed_in_filetype_logfile(
+                             filename=self._create_filename_for_filetype_logfile(date=grp_date))}
+
+        # ICOS timestamp as text, only for the days that need to be exported
+        df = self._format_icos_timestamp(df=df, bounds=list(export_bounds.values()), section_name=section_name)
+
+        # CSV of all days that need to be exported, created in one step
+        icos_csv_contents = self._serialize_icos_csv(df=df, bounds=export_bounds, section_name=section_name)
+
+        daily_exports = []
+        for grp_date, (start, end) in day_bounds.items():
+            grp_df = df.iloc[start:end]
 
             # Make filename for ICOS
             outfilename_icos = self._create_icos_filename(year=grp_date.year, month=grp_date.month, day=grp_date.day)
@@ -129,14 +357,10 @@ class IcosFormat:
             # Full output path to output files
             # Detect output path with subdir from filedate
             outpath = tools.get_subdir_from_date(date=grp_date, outpath=self.filesettings['DIR_OUT_ICOS'])
-            icos_uncompressed_outfilepath = outpath / outfilename_icos
-            icos_zipped_outfilepath = outpath / f"{Path(outfilename_icos).stem}.zip"
 
             # Detect which filename to write to the filetype processing logfile
-            filename_for_filetype_logfile = \
-                str(icos_zipped_outfilepath.name) \
-                    if self.filesettings['OUTFILE_COMPRESSION'] \
-                    else str(icos_uncompressed_outfilepath.name)
+            filename_for_filetype_logfile = self._create_filename_for_filetype_logfile(date=grp_date)
+            source_files = self._get_source_files_for_date(files_df=files_df, date=grp_date)
 
             # Check if filename already processed, if yes skip this file
             checkok = self._check_if_already_processed(filename=filename_for_filetype_logfile,
@@ -154,88 +378,265 @@ class IcosFormat:
                                  f"(i) Data from {firstdate} to {lastdate} "
                                  f"({len(grp_df)} values, {len(grp_df.columns)} columns)")
 
-            # Save uncompressed ICOS file
-            self._save_uncompressed_icos_file(df=grp_df,
-                                              outfilepath=icos_uncompressed_outfilepath,
+            daily_exports.append(dict(
+                grp_date=grp_date,
+                df=grp_df,
+                first_timestamp=firstdate,
+                last_timestamp=lastdate,
+                content=icos_csv_contents.get(grp_date),
+                outfilename_icos=outfilename_icos,
+                icos_uncompressed_outfilepath=outpath / outfilename_icos,
+                icos_zipped_outfilepath=outpath / f"{Path(outfilename_icos).stem}.zip",
+                filename_for_filetype_logfile=filename_for_filetype_logfile,
+                previous_sha256=self.revised.get(filename_for_filetype_logfile, {}).get('sha256'),
+                source_files=source_files,
+                source_checksums=self._get_source_checksums(files_df=files_df, source_files=source_files)))
+
+        # Write and compress daily files in parallel
+        # - results are collected in the order of the days, a day is added to the
+        #   filetype logfile only after its files were completely written
+        # - if a day fails, later days are not added to the filetype logfile and
+        #   are created again in the next run
+        max_workers = max(1, min(self.filesettings['OUTFILE_MAX_WORKERS'], len(daily_exports)))
+        self.logger.log_info(f"{section_name} Writing {len(daily_exports)} daily files using {max_workers} threads "
+                             f"(zlib level {self.filesettings['OUTFILE_ZLIB_LEVEL']})")
+        # - all days that were written are recorded in one transaction, also if a later day failed
+        records = []
+        manifest_rows = {}  # Rows of the checksum manifest of each month
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self._write_daily_files, daily_export=daily_export)
+                       for daily_export in daily_exports]
+            try:
+                for daily_export, future in zip(daily_exports, futures):
+                    messages, checksum, outputs = future.result()
+                    for msg in messages:
+                        self.logger.log_info(f"{section_name}        {msg}")
+                    grp_date = daily_export['grp_date']
+                    manifest_rows.setdefault((grp_date.year, grp_date.month), []).extend(
+                        dict(FILENAME=output['filepath'].name, SIZE=output['size'], SHA256=output['sha256'],
+                             N_RECORDS=len(daily_export['df']), FIRST_TIMESTAMP=daily_export['first_timestamp'],
+                             LAST_TIMESTAMP=daily_export['last_timestamp'])
+                        for output in outputs)
+                    records.append(dict(filename=daily_export['filename_for_filetype_logfile'],
+                                        run_id=self.run_id,
+                                        source_files=daily_export['source_files'],
+                                        n_records=len(daily_export['df']),
+                                        sha256=checksum,
+                                        source_checksums=daily_export['source_checksums']))
+            except BaseException as err:
+                for future in futures:
+                    future.cancel()
+                self.logger.log_warning(f"{section_name} (!) ERROR while writing daily files ({err!r}), "
+                                        f"recording the {len(records)} days that were written before the error")
+                # An error while recording the days is logged, the original error is raised
+                try:
+                    self._record_written_days(records=records, manifest_rows=manifest_rows,
                                               section_name=section_name)
+                except Exception as record_err:
+                    self.logger.log_warning(f"{section_name} (!) ERROR while recording the written days "
+                                            f"({record_err!r}), they are created again in the next run")
+                raise
 
-            # Save zipped ICOS file (if required)
-            self._save_zipped_icos_file(filepath_to_compress=icos_uncompressed_outfilepath,
-                                        outfilepath=icos_zipped_outfilepath,
-                                        section_name=section_name)
-
-            # Delete uncompressed ICOS file (if required)
-            self._delete_uncompressed_icos_file(outfilepath_uncompressed=icos_uncompressed_outfilepath,
-                                                section_name=section_name)
-
-            # Get info about previous script runs
-            self._add_filename_to_filetype_logfile(filename=filename_for_filetype_logfile)
+        # Get info about previous script runs
+        self._record_written_days(records=records, manifest_rows=manifest_rows, section_name=section_name)
 
         # End section
+        logger.section_count(logger=self.logger, section_name=section_name, files=len(records),
+                             rows=sum(record['n_records'] for record in records))
         logger.section_end(logger=self.logger, section_name=section_name, tic=tic)
 
-    def _delete_uncompressed_icos_file(self, outfilepath_uncompressed, section_name) -> None:
+    def _write_daily_files(self, daily_export: dict) -> tuple:
+        """Write files for one day, returns log messages, SHA-256 checksum of the ICOS CSV data
+        and the written files that are kept (see _write_output_file)
+
+        Runs in a worker thread, messages are logged by the main thread in the order of the days.
+        """
+        content = self._get_icos_csv(df=daily_export['df'], content=daily_export['content'])
+        checksum = hashlib.sha256(content).hexdigest()
+        messages = []
+        if (checksum == daily_export['previous_sha256']) and self._output_files_exist(daily_export=daily_export):
+            # Day with revised source files, but the same data: files are not written again,
+            # i.e. they keep their modification time and are not transferred again
+            messages.append(f"* ICOS CSV data did not change (SHA-256 {checksum[:12]}...), files were not written")
+            return messages, checksum, []
+
+        outputs = []
+        if self.filesettings['OUTFILE_COMPRESSION'] and self.filesettings['OUTFILE_DELETE_UNCOMPRESSED']:
+            # Write data directly to ZIP file, without uncompressed file
+            msg, output = self._stream_zipped_icos_file(content=content,
+                                                        arcname=daily_export['outfilename_icos'],
+                                                        outfilepath=daily_export['icos_zipped_outfilepath'],
+                                                        date=daily_export['grp_date'])
+            messages.append(msg)
+            outputs.append(output)
+
+        else:
+            # Save uncompressed ICOS file
+            msg, output = self._save_uncompressed_icos_file(
+                content=content, outfilepath=daily_export['icos_uncompressed_outfilepath'], checksum=checksum)
+            messages.append(msg)
+            outputs.append(output)
+
+            # Save zipped ICOS file (if required)
+            msg, output = self._save_zipped_icos_file(
+                content=content,
+                arcname=daily_export['outfilename_icos'],
+                outfilepath=daily_export['icos_zipped_outfilepath'],
+                date=daily_export['grp_date'])
+            messages.append(msg)
+            outputs.append(output)
+
+            # Delete uncompressed ICOS file (if required)
+            messages.append(self._delete_uncompressed_icos_file(
+                outfilepath_uncompressed=daily_export['icos_uncompressed_outfilepath']))
+            if self.filesettings['OUTFILE_DELETE_UNCOMPRESSED']:
+                outputs = [output for output in outputs
+                           if output and (output['filepath'] != daily_export['icos_uncompressed_outfilepath'])]
+        return messages, checksum, [output for output in outputs if output]
+
+    @staticmethod
+    def _write_output_file(data: bytes, outfilepath, checksum: str = None) -> dict:
+        """Write data to outfilepath, returns filepath, size and SHA-256 checksum of the written bytes
+
+        The checksum is computed from the bytes in memory (if not given), i.e. the file is
+        not read again. The file is complete when it appears with its final name.
+        """
+        with tools.atomic_filepath(filepath=outfilepath) as tmpfilepath:
+            with open(tmpfilepath, 'wb') as f:
+                f.write(data)
+        return dict(filepath=Path(outfilepath), size=len(data),
+                    sha256=checksum or hashlib.sha256(data).hexdigest())
+
+    def _zip_icos_csv(self, content: bytes, arcname, date) -> bytes:
+        """ZIP file with the ICOS CSV data as bytes"""
+        zinfo = self._make_zipinfo(arcname=arcname, date=date)
+        buffer = io.BytesIO()
+        with zf.ZipFile(buffer, 'w') as zipped_file:
+            zipped_file.writestr(zinfo, content, compresslevel=self.filesettings['OUTFILE_ZLIB_LEVEL'])
+        return buffer.getvalue()
+
+    def _output_files_exist(self, daily_export: dict) -> bool:
+        """Check if the files of one day that are kept after writing exist"""
+        filepaths = []
+        if self.filesettings['OUTFILE_COMPRESSION']:
+            filepaths.append(daily_export['icos_zipped_outfilepath'])
+        if not (self.filesettings['OUTFILE_COMPRESSION'] and self.filesettings['OUTFILE_DELETE_UNCOMPRESSED']):
+            filepaths.append(daily_export['icos_uncompressed_outfilepath'])
+        return all(os.path.isfile(filepath) for filepath in filepaths)
+
+    @staticmethod
+    def _make_zipinfo(arcname, date) -> zf.ZipInfo:
+        """ZIP entry with a fixed timestamp (midnight of the date of the data) instead of the time
+        of writing, i.e. ZIP files of the same data are identical (same bytes)"""
+        zinfo = zf.ZipInfo(filename=arcname, date_time=(date.year, date.month, date.day, 0, 0, 0))
+        zinfo.compress_type = zf.ZIP_DEFLATED
+        zinfo.external_attr = 0o644 << 16  # Regular file, as with files added from disk
+        return zinfo
+
+    def _delete_uncompressed_icos_file(self, outfilepath_uncompressed) -> str:
         """Delete uncompressed file if needed (optional)"""
         if self.filesettings['OUTFILE_DELETE_UNCOMPRESSED']:
             os.remove(outfilepath_uncompressed)
-            self.logger.log_info(
-                f"{section_name}        * deleted uncompressed ICOS file: {outfilepath_uncompressed}")
+            return f"* deleted uncompressed ICOS file: {outfilepath_uncompressed}"
         else:
-            self.logger.log_info(
-                f"{section_name}        * uncompressed ICOS file {outfilepath_uncompressed} was not deleted")
+            return f"* uncompressed ICOS file {outfilepath_uncompressed} was not deleted"
 
-    def _save_zipped_icos_file(self, filepath_to_compress, outfilepath, section_name) -> None:
-        """Saves compressed (zipped) ICOS file"""
+    def _save_zipped_icos_file(self, content, arcname, outfilepath, date) -> tuple:
+        """Saves compressed (zipped) ICOS file, returns log message and written file (None if no file)"""
         if self.filesettings['OUTFILE_COMPRESSION']:
 
-            # Write to ZIP
-            zipped_file = zf.ZipFile(outfilepath, 'w')
-            # note the arcname argument: it enables to directly zip the file w/o including the
-            # file-containing folder in the zip file
-            zipped_file.write(filepath_to_compress, compress_type=zf.ZIP_DEFLATED,
-                              arcname=os.path.basename(filepath_to_compress))
-            zipped_file.close()
-            self.logger.log_info(f"{section_name}        * saved compressed ICOS ZIP file: {outfilepath}")
-
-            # f_hash = self.hash_value_for_file(file_full_path=outfilepath_zip)
-            # self.file_list_df.loc[orig_filedate, 'saved_icos_zip_file_hash'] = '{0}'.format(f_hash)
+            # Zip the ICOS CSV data in memory, the uncompressed file is not read again
+            # - note the arcname: the file is zipped w/o the file-containing folder
+            output = self._write_output_file(data=self._zip_icos_csv(content=content, arcname=arcname, date=date),
+                                             outfilepath=outfilepath)
+            return f"* saved compressed ICOS ZIP file: {outfilepath}", output
         else:
-            self.logger.log_info(f"{section_name}        * no compressed ZIP file was created")
+            return "* no compressed ZIP file was created", None
 
-    def _save_uncompressed_icos_file(self, df, outfilepath, section_name) -> None:
+    def _save_uncompressed_icos_file(self, content, outfilepath, checksum: str = None) -> tuple:
         """ Saves uncompressed data as CSV
         - File is saved w/ ICOS filename
-        - CSV is generated using quote arguments to output double quotes for header, index and NaNs
+        - The file is complete when it appears with its final name
+        """
+        output = self._write_output_file(data=content, outfilepath=outfilepath, checksum=checksum)
+        return f"* saved uncompressed ICOS file: {outfilepath}", output
+
+    def _stream_zipped_icos_file(self, content, arcname, outfilepath, date) -> tuple:
+        """Saves data as CSV directly into compressed (zipped) ICOS file
+        - The CSV in the ZIP file is the same as the uncompressed ICOS file
+        - No uncompressed file is written (and deleted again) on the file share
+        - The file is complete when it appears with its final name
         """
+        output = self._write_output_file(data=self._zip_icos_csv(content=content, arcname=arcname, date=date),
+                                         outfilepath=outfilepath)
+        return f"* saved compressed ICOS ZIP file: {outfilepath} (written directly, no uncompressed file)", output
+
+    def _get_icos_csv(self, df, content: bytes = None) -> bytes:
+        """Data in ICOS CSV format
+        - content is the CSV created by the fast ICOS CSV writer, if not available
+          the CSV is generated by pandas
+        """
+        if content is not None:
+            return content
 
         # check if we need to output the header column names to the file
         header = True if self.filesettings['DATA_HEADER_OUTPUT_TO_FILE'] else False
+        return icoscsv.to_csv_pandas(df=df, header=header).encode(icoscsv.ENCODING)
+
+    def _format_icos_timestamp(self, df, bounds: list, section_name) -> DataFrame:
+        """Convert ICOS timestamp to text for the rows (start, end) of the days that are exported
+
+        The ICOS timestamp is inserted as datetime (see _insert_icos_timestamp), the text
+        is generated here only for data that are written to daily files. The ICOS
+        timestamp of all other rows is missing.
+        """
+        rows = np.concatenate([np.arange(start, end) for start, end in bounds]) if bounds else []
+        timestamps = pd.DatetimeIndex(df[self.icos_timestamp_col].to_numpy()[rows])
+        icos_timestamps = np.full(len(df), np.nan, dtype=object)
+        icos_timestamps[rows] = tools.format_timestamps(
+            timestamps=timestamps, fmt=self.filesettings['DATA_ICOS_TIMESTAMP_FORMAT'])
+        df = df.copy(deep=False)  # New frame without copying data, only the ICOS timestamp is replaced
+        df[self.icos_timestamp_col] = icos_timestamps
+        self.logger.log_info(f"{section_name} Generated ICOS timestamp {self.icos_timestamp_col} "
+                             f"for {len(rows)} records in {len(bounds)} days that need to be exported")
+        return df
+
+    def _serialize_icos_csv(self, df, bounds: dict, section_name) -> dict:
+        """Serialize data of all days not yet processed in one step, returns the CSV for each date
 
-        # Save dataframe to file
-        # - note the quote arguments: these make sure that the header, row indices and also NANs
-        #   are output with double quotes. also, index=False b/c timestamp was inserted as regular column
-        # - na_rep is used to fix representation for NaNs in output csv file
-        #   for the ICOS files, NaN is used, in combination with the quote args NaN is output as "NaN"
-        #   we need it like this b/c we defined missing values for the files as "NaN"
-        df.to_csv(outfilepath,
-                  quotechar='"',
-                  quoting=csv.QUOTE_NONNUMERIC,
-                  index=False,
-                  header=header,
-                  na_rep='NaN',
-                  lineterminator='\r\n')
-
-        self.logger.log_info(f"{section_name}        * saved uncompressed ICOS file: {outfilepath}")
+        Args:
+            bounds: rows (start, end) of each day that needs to be exported, keys are the dates
+        """
+        if self.filesettings['OUTFILE_CSV_WRITER'] != 'fast':
+            return {}
+
+        try:
+            contents = self.icos_csv_writer.serialize(df=df, bounds=list(bounds.values()))
+        except icoscsv.NotSupportedError as e:
+            self.logger.log_info(f"{section_name} (!) Data cannot be written with the fast ICOS CSV writer ({e}), "
+                                 f"files are written with pandas")
+            return {}
+        self.logger.log_info(f"{section_name} Serialized {len(contents)} days with the fast ICOS CSV writer")
+        return dict(zip(bounds.keys(), contents))
 
     def _detect_unique_dates(self, df, section_name):
         """Detect unique dates in dataframe"""
-        unique_dates = list(df.index.date)
-        unique_dates = np.unique(unique_dates)
-        self.logger.log_info(f"{section_name}    Found {len(unique_dates)} unique dates in merged data:")
-        for ud in unique_dates:
-            self.logger.log_info(f"{section_name}        Found date {ud}")
-
-    def _format_data(self, df) -> DataFrame:
+        unique_dates = [tools.day_code_to_date(day_code=day_code)
+                        for day_code in np.unique(tools.get_day_codes(index=df.index))]
+        self.logger.log_info(f"{section_name}    Found {len(unique_dates)} unique dates in merged data: "
+                             f"{logger.format_list(unique_dates)}")
+        if self.logger.is_debug():
+            for ud in unique_dates:
+                self.logger.log_debug(f"{section_name}        Found date {ud}")
+
+    def _format_data(self, df, index_range: tuple = None) -> DataFrame:
+        """Format data to ICOS format
+
+        Args:
+            df: merged data
+            index_range: first and last timestamp of the continuous timestamp, if None
+                the first and last timestamp of df are used
+        """
 
         # Start section
         section_name = '[formatting data]'
@@ -256,7 +657,7 @@ class IcosFormat:
         df = self._delete_suffix_from_variable_names(df=df, section_name=section_name)
 
         # Make sure timestamp is continuous
-        df = self._reindex_data_to_continuous_timestamp(df=df, section_name=section_name)
+        df = self._reindex_data_to_continuous_timestamp(df=df, index_range=index_range, section_name=section_name)
 
         # Insert ICOS timestamp as column for correct CSV export
         df = self._insert_icos_timestamp(
@@ -272,7 +673,11 @@ class IcosFormat:
         # Remove partial days, when timestamp does not cover the full day
         df = self._remove_partial_days(df=df, section_name=section_name)
 
+        # Original data types of compacted columns (float64 and str) for export
+        df = compact.restore_dtypes(df=df)
+
         # End section
+        logger.section_count(logger=self.logger, section_name=section_name, rows=len(df))
         logger.section_end(logger=self.logger, section_name=section_name, tic=tic)
 
         return df
@@ -280,18 +685,15 @@ class IcosFormat:
     def _remove_partial_days(self, df, section_name) -> DataFrame:
         """Remove partial days based on (filled) timestamp completeness"""
         n_expected_records_per_day = pd.Timedelta('1D') / self.filesettings['DATA_FREQUENCY']
-        n_timestamps_per_day = df.groupby(df.index.date).count()[self.icos_timestamp_col]
+        day_codes, day_ix = np.unique(tools.get_day_codes(index=df.index), return_inverse=True)
+        n_timestamps_per_day = np.bincount(day_ix, weights=df[self.icos_timestamp_col].notna().to_numpy(),
+                                           minlength=len(day_codes))
         ix_equals_expected = n_timestamps_per_day == n_expected_records_per_day
-        okdates = ix_equals_expected[ix_equals_expected]
-        notokdates = ix_equals_expected[~ix_equals_expected]
-        df['__DATE_AUX__'] = df.index.date
-        df = df.loc[df['__DATE_AUX__'].isin(okdates.index)].copy()
-        df = df.drop('__DATE_AUX__', axis=1)
+        notokdates = [tools.day_code_to_date(day_code=day_code) for day_code in day_codes[~ix_equals_expected]]
         if len(notokdates) > 0:
-            removed_dates = []
-            [removed_dates.append(f"{x}") for x in notokdates.index]
+            df = df.loc[ix_equals_expected[day_ix]].copy()
             self.logger.log_info(f"{section_name}    * removed dates with timestamps not covering the "
-                                 f"full day (partial days) {removed_dates}")
+                                 f"full day (partial days) {logger.format_list(notokdates)}")
         else:
             self.logger.log_info(f"{section_name}    * keeping all days, no partial days found")
         return df
@@ -301,18 +703,19 @@ class IcosFormat:
         today_date = datetime.datetime.now().date()
         last_allowed_timestamp = datetime.datetime(year=today_date.year, month=today_date.month,
                                                    day=today_date.day, hour=0, minute=0, second=0)
-        is_not_today = df.index <= last_allowed_timestamp
-        is_today = ~is_not_today
-
-        if np.sum(is_today) > 0:
-            removed_dt = []
-            [removed_dt.append(f"{x}") for x in df[is_today].index]
-            self.logger.log_info(f"{section_name}    * removed {np.sum(is_today)} records "
-                                 f"with today's date (today's data always ignored) {removed_dt}")
+        # The timestamp index is sorted (continuous timestamp)
+        n_not_today = df.index.searchsorted(last_allowed_timestamp, side='right')
+        n_today = len(df) - n_not_today
+
+        if n_today > 0:
+            self.logger.log_info(f"{section_name}    * removed {n_today} records with today's date "
+                                 f"(today's data always ignored) from {df.index[n_not_today]} to {df.index[-1]}")
+            if self.logger.is_debug():
+                self.logger.log_debug(f"{section_name}      removed records {[str(x) for x in df.index[n_not_today:]]}")
         else:
-            self.logger.log_info(f"{section_name}    * no records ({np.sum(is_today)} values) "
+            self.logger.log_info(f"{section_name}    * no records ({n_today} values) "
                                  f"with today's date found, nothing removed (today's data always ignored)")
-        df = df[is_not_today].copy()
+        df = df.iloc[:n_not_today].copy()
         return df
 
     def _convert_index_to_middle_timestamp(self, df, section_name) -> DataFrame:
@@ -325,19 +728,30 @@ class IcosFormat:
                              f"ICOS timestamp remains unchanged)")
         return df
 
-    def _reindex_data_to_continuous_timestamp(self, df, section_name) -> DataFrame:
+    def _reindex_data_to_continuous_timestamp(self, df, section_name, index_range: tuple = None) -> DataFrame:
         """Generate continuous timestamp index b/w first and last date"""
-        index_orig = df.index
-        index_new = pd.date_range(start=df.index[0], end=df.index[-1], freq=self.filesettings['DATA_FREQUENCY'])
-        is_equal = index_new.equals(index_orig)
+        start, end = index_range if index_range else (df.index[0], df.index[-1])
+
+        # Timestamps as int64 nanoseconds, the index is continuous if it starts at
+        # start, has a constant step of freq and ends with the last step before end
+        freq_ns = pd.Timedelta(self.filesettings['DATA_FREQUENCY']).value
+        start_ns = pd.Timestamp(start).value
+        n_expected = max((pd.Timestamp(end).value - start_ns) // freq_ns + 1, 0)
+        index_ns = df.index.asi8
+        is_equal = (len(index_ns) == n_expected) and (n_expected > 0) and (index_ns[0] == start_ns) \
+            and (np.diff(index_ns) == freq_ns).all()
         if not is_equal:
-            different = index_new.difference(index_orig)
-            df = df.reindex(index_new)
+            # Timestamps on the continuous timestamp are kept, all others are added
+            is_kept = ((index_ns - start_ns) % freq_ns == 0) & (index_ns >= start_ns) \
+                & (index_ns < start_ns + n_expected * freq_ns)
+            df = df.reindex(pd.date_range(start=start, end=end, freq=self.filesettings['DATA_FREQUENCY']))
             self.logger.log_info(f"{section_name}    * timestamp was not continuous, fixed "
-                                 f"(added {len(different)} timestamps) ")
+                                 f"(added {n_expected - np.count_nonzero(is_kept)} timestamps) ")
         else:
+            # New frame (without copying data) that owns its columns, columns are added later
+            df = df.copy(deep=False)
+            df.index = pd.DatetimeIndex(df.index, freq=self.filesettings['DATA_FREQUENCY'])
             self.logger.log_info(f"{section_name}    * timestamp is already continuous, nothing changed")
-        df = df.asfreq(self.filesettings['DATA_FREQUENCY'])
         return df
 
     def _delete_suffix_from_variable_names(self, df, section_name) -> DataFrame:
@@ -392,9 +806,9 @@ class IcosFormat:
     def _insert_icos_timestamp(self, df, keep_non_icos_timestamp, section_name) -> DataFrame:
 
         # Insert timestamp index as regular column (i.e. not pandas index)
+        # - the ICOS timestamp is converted to text only for the days that are
+        #   exported, see _format_icos_timestamp
         df.insert(0, self.icos_timestamp_col, df.index)
-        df[self.icos_timestamp_col] = df[self.icos_timestamp_col].dt.strftime(
-            self.filesettings['DATA_ICOS_TIMESTAMP_FORMAT'])
         self.logger.log_info(f"{section_name}    * inserted ICOS timestamp with name "
                              f"{self.icos_timestamp_col} as first column")
 
@@ -413,11 +827,26 @@ class IcosFormat:
         section_name = '[reading file data]'
         tic = logger.section_start(logger=self.logger, section_name=section_name)
 
-        # Merge data from all files
-        merged_df = pd.DataFrame()
-        for filepath in filepaths:
-            file_df = self._readfile(filepath=filepath, section_name=section_name)
-            merged_df = pd.concat([merged_df, file_df], axis=0)  # add to data from this day
+        # Read files in parallel, most of the time is spent waiting for the file server
+        # - executor.map returns the data in the same order as filepaths, this is important
+        #   because duplicate timestamps are later removed by keeping the last record
+        file_dfs = self._readfiles_parallel(filepaths=filepaths, section_name=section_name)
+
+        # Files without read permission were skipped
+        file_dfs = [filedata_df for filedata_df in file_dfs if filedata_df is not None]
+
+        # Merge data from all files in one step
+        merged_df = pd.concat(file_dfs, axis=0) if file_dfs else pd.DataFrame()
+
+        # Text columns with different categories in different files are merged to str
+        if self.filesettings['READ_COMPACT_DTYPES']:
+            merged_df = compact.compact_dtypes(df=merged_df)
+            self.logger.log_info(f"{section_name}   Compact data types: "
+                                 f"{merged_df.dtypes.astype(str).value_counts().to_dict()} "
+                                 f"({merged_df.memory_usage(deep=True).sum() / 1024 ** 2:.1f} MB)")
+
+        # Remove least recently used files from cache
+        self._evict_cache(section_name=section_name)
 
         # End section
         self.logger.log_info(f"{section_name}   {'-' * 40}\n"
@@ -427,23 +856,77 @@ class IcosFormat:
 
         return merged_df
 
-    def _readfile(self, filepath, section_name: str = None):
+    def _readfiles_parallel(self, filepaths: list, section_name: str) -> list:
+        """Read files in parallel, returns data of each file (None if the file was skipped) in the order of filepaths"""
+        max_workers = max(1, min(self.filesettings['READ_MAX_WORKERS'], len(filepaths)))
+        self.logger.log_info(f"{section_name} Reading {len(filepaths)} files using {max_workers} threads "
+                             f"(reader: {self.reader.name})")
+        file_dfs = []
+        remaining_filepaths = list(filepaths)
+        while remaining_filepaths and not self.dtypes:
+            # First readable file is read before the others to detect data types
+            filedata_df = self._readfile(filepath=remaining_filepaths.pop(0), section_name=section_name)
+            file_dfs.append(filedata_df)
+            if filedata_df is not None:
+                self._detect_dtypes(df=filedata_df, section_name=section_name)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            file_dfs += list(executor.map(partial(self._readfile, section_name=section_name), remaining_filepaths))
+        n_read = sum(1 for df in file_dfs if df is not None)
+        self.logger.log_info(f"{section_name}   Read {n_read} files, {len(filepaths) - n_read} files skipped")
+
+        # Counters for profiling, the size of source files is only checked if the section is profiled
+        if self.logger.profiler:
+            read = [(filepath, df) for filepath, df in zip(filepaths, file_dfs) if df is not None]
+            logger.section_count(logger=self.logger, section_name=section_name, files=len(read),
+                                 rows=sum(len(df) for _, df in read),
+                                 bytes_read=sum(os.path.getsize(filepath) for filepath, _ in read))
+        return file_dfs
+
+    def _evict_cache(self, section_name: str) -> None:
+        """Remove least recently used files from cache"""
+        if self.cache:
+            n_deleted = self.cache.evict()
+            self.logger.log_info(f"{section_name}   Cache {self.cache.cachedir}: {self.cache.n_hits} files read "
+                                 f"from cache, {self.cache.n_misses} files parsed, "
+                                 f"{n_deleted} old files deleted from cache")
 
-        # kudos: https://stackoverflow.com/a/46545843
-        dateparse = lambda date: pd.to_datetime(date, format=self.filesettings['DATA_TIMESTAMP_FORMAT'],
-                                                errors='coerce')
-
-        # read data to df
-        filedata_df = pd.read_csv(filepath,
-                                  parse_dates=True,
-                                  date_parser=dateparse,
-                                  index_col=self.filesettings['DATA_TIMESTAMP_COL'],
-                                  header=self.filesettings['DATA_HEADER_ROWS'],
-                                  skiprows=self.filesettings['DATA_SKIP_ROWS'],
-                                  encoding='utf-8',
-                                  sep=self.filesettings['DATA_SEPARATOR'],
-                                  on_bad_lines='skip',
-                                  na_values=['NAN', 'inf'])  # 'inf' added in v4.0.15
+    def _readfile(self, filepath, section_name: str = None):
+        """Read data from one file, returns None if the file cannot be accessed"""
+
+        # Data types given to the reader, also part of the cache key
+        dtypes = self.dtypes
+
+        # Use parsed data from cache if the file did not change since it was parsed
+        if self.cache:
+            filedata_df = self.cache.load(filepath=filepath, dtypes=dtypes)
+            if filedata_df is not None:
+                self.logger.log_debug(f'{section_name}   Reading file {filepath.name} from cache successful '
+                                     f'rows: {filedata_df.shape[0]} / columns: {filedata_df.shape[1]}  '
+                                     f'/ datasize: {filedata_df.size} ({filepath})')
+                return filedata_df
+
+        # Read data to df
+        # - with known data types, numeric columns are directly converted to float64
+        # - if this does not work (e.g. a numeric column contains text), data types are
+        #   detected again for this file
+        # - all other columns are converted to numeric where possible
+        # - read permission is not checked beforehand, files that cannot be accessed
+        #   are skipped when they are read
+        filedata_df = None
+        try:
+            if dtypes:
+                try:
+                    filedata_df = self.reader.read(filepath=filepath, dtypes=dtypes)
+                except ValueError as e:
+                    self.logger.log_warning(f"{section_name}       (!)WARNING file {filepath.name} could not be read "
+                                         f"with the detected data types ({e}), detecting data types for this file")
+            if filedata_df is None:
+                filedata_df = self.reader.read(filepath=filepath, dtypes=None)
+            filedata_df = self._convert_to_numeric(df=filedata_df, section_name=section_name)
+        except PermissionError as err:
+            msg = f"{section_name} (!) SKIPPING FILE - NO READ PERMISSION: {filepath} ({err})"
+            self.logger.log_warning(msg)
+            return None
 
         # # Indexes of rows that contain 'inf'
         # data_df.index[np.isinf(data_df).any(1)]
@@ -452,32 +935,57 @@ class IcosFormat:
         n_rows = filedata_df.shape[0]
         n_cols = filedata_df.shape[1]
         datasize = filedata_df.size
-        dtypes = filedata_df.dtypes
-        self.logger.log_info(f'{section_name}   Reading file {filepath.name} successful '
+        self.logger.log_debug(f'{section_name}   Reading file {filepath.name} successful '
                              f'rows: {n_rows} / columns: {n_cols}  / datasize: {datasize} '
                              f'({filepath})')
 
-        # Convert to numeric where possible
-        for col in filedata_df.columns:
-            try:
-                filedata_df[col] = filedata_df[col].astype(np.float64)
-            except ValueError as e:
-                self.logger.log_info(
-                    f"{section_name}       (!)WARNING column {col} could not be converted to numeric ({e}), "
-                    f"instead the column was converted to string")
-                filedata_df[col] = filedata_df[col].astype(str)
-
         # # NOT DONE FOR ICOS FILES: fill date range, no date gaps, needs freq
         # first_date = data_df.index[0]
         # last_date = data_df.index[-1]
 
+        # Compact data types, restored before export
+        if self.filesettings['READ_COMPACT_DTYPES']:
+            filedata_df = compact.compact_dtypes(df=filedata_df)
+
+        # Store parsed data for next runs
+        if self.cache:
+            try:
+                self.cache.store(filepath=filepath, df=filedata_df, dtypes=dtypes)
+            except OSError as e:
+                self.logger.log_warning(f"{section_name}       (!)WARNING file {filepath.name} could not be "
+                                     f"stored to cache ({e})")
+
         return filedata_df
 
+    def _convert_to_numeric(self, df, section_name: str = None) -> DataFrame:
+        """Convert to numeric where possible, other columns are converted to string"""
+        for col in df.columns:
+            if df[col].dtype == np.float64:
+                continue  # Already numeric, e.g. read with the detected data types
+            try:
+                df[col] = df[col].astype(np.float64)
+            except ValueError as e:
+                self.logger.log_warning(
+                    f"{section_name}       (!)WARNING column {col} could not be converted to numeric ({e}), "
+                    f"instead the column was converted to string")
+                df[col] = df[col].astype(str)
+        return df
+
+    def _detect_dtypes(self, df, section_name: str = None) -> None:
+        """Detect numeric columns, used when reading all other files of this filetype"""
+        if self.dtypes:
+            return
+        self.dtypes = readers.infer_dtypes(df=df, filesettings=self.filesettings)
+        n_numeric = sum(1 for dtype in self.dtypes['dtypes'].values() if dtype == np.float64)
+        self.logger.log_info(f"{section_name}   Detected data types: {n_numeric} numeric columns, "
+                             f"data types of {len(self.dtypes['columns']) - n_numeric} other columns "
+                             f"are detected for each file")
+
     def _set_monthly_search_folders(self, section_name: str = None):
         """Set time range for search window and detect valid source folders"""
 
         # Search window
-        search_firstdate, search_lastdate = tools.set_search_window(max_age_days=self.max_age_days)
+        search_firstdate, search_lastdate = self._get_file_search_window()
 
         # Check in which subfolders we can start the search for new files
         search_dirs, search_firstdate = \
@@ -506,60 +1014,62 @@ class IcosFormat:
     #         checkok = False
     #     return checkok
 
-    def _search_files(self, search_dirs) -> list:
-        """Make list of all files in search dirs, store complete path to file"""
+    def _search_files(self, search_dirs, section_name: str = None) -> list:
+        """Make list of all files in search dirs, store complete path to file
+
+        The listing of the search dirs is shared with other filetypes that use the
+        same source folder, search dirs are only listed again if they changed.
+        """
+        index = dirindex.get_index(source_dir=self.filesettings['DIR_SOURCE_FILES'])
+        n_listed, n_reused = index.n_listed, index.n_reused
         fileslist = []
         for search_dir in search_dirs:
-            for root, dirs, files in os.walk(search_dir):
-                for file_ix, file in enumerate(files):
-                    filepath = Path(root) / file
-                    fileslist.append(filepath)
+            fileslist += index.list_files(search_dir=search_dir)
+        index.save()
+        self.logger.log_info(f"{section_name} Found {len(fileslist)} files in search dirs "
+                             f"({index.n_listed - n_listed} dirs listed, {index.n_reused - n_reused} dirs "
+                             f"unchanged since last listing, index: {index.indexfilepath})")
         return fileslist
 
-    def _check_filename_id(self, filename, section_name: str = None) -> bool:
-        if not fnmatch.fnmatch(filename, self.filesettings['FILENAME_ID']):
-            msg = f"{section_name} (!) SKIPPING FILE {filename} " \
-                  f"- not matching pattern ({self.filesettings['FILENAME_ID']})"
-            self.logger.log_info(msg)
-            checkok = False
-        else:
-            checkok = True
-        return checkok
-
-    def _check_date_in_filename(self, filename: str, search_firstdate, section_name: str = None) -> bool:
-        """Ignore files with filenames that are older than search date"""
-        filename_date = tools.get_datetime_from_filename(filename=filename, filesettings=self.filesettings)
-        filename_date = filename_date.date()
-        if (filename_date >= search_firstdate):
-            checkok = True
-        else:
-            checkok = False
-            msg = f"{section_name} (!) SKIPPING FILE {filename} - filedate {filename_date} older than start date {search_firstdate}"
-            self.logger.log_info(msg)
+    def _check_filename_ids(self, filepaths: list, section_name: str = None) -> list:
+        """Keep files with filenames matching FILENAME_ID, all filenames are matched with one compiled pattern"""
+        pattern = tools.compile_filename_id(filename_id=self.filesettings['FILENAME_ID'])
+        matching = [filepath for filepath in filepaths if pattern.match(filepath.name)]
+        if self.logger.is_debug():
+            for filepath in filepaths:
+                if not pattern.match(filepath.name):
+                    self.logger.log_debug(f"{section_name} (!) SKIPPING FILE {filepath.name} "
+                                          f"- not matching pattern ({self.filesettings['FILENAME_ID']})")
+        if len(matching) < len(filepaths):
+            self.logger.log_info(f"{section_name} (!) SKIPPING {len(filepaths) - len(matching)} FILES "
+                                 f"- not matching pattern ({self.filesettings['FILENAME_ID']})")
+        return matching
+
+    def _check_dates_in_filenames(self, filenames: list, filename_dts, search_firstdate,
+                                  section_name: str = None) -> np.ndarray:
+        """Ignore files with filenames that are older than search date, returns True for files to keep"""
+        filename_dates = filename_dts.normalize()
+        checkok = np.asarray(filename_dates >= pd.Timestamp(search_firstdate))
+        if self.logger.is_debug():
+            for filename, filename_date in zip(np.asarray(filenames)[~checkok], filename_dates[~checkok]):
+                self.logger.log_debug(f"{section_name} (!) SKIPPING FILE {filename} - filedate "
+                                      f"{filename_date.date()} older than start date {search_firstdate}")
+        if not checkok.all():
+            self.logger.log_info(f"{section_name} (!) SKIPPING {np.count_nonzero(~checkok)} FILES "
+                                 f"- filedate older than start date {search_firstdate}")
         return checkok
 
     def _remove_files_already_processed(self, df, section_name) -> DataFrame:
         """Remove files that were already processed"""
         already_processed = df.index.isin(self.prev_run_log_df.index)
         df = df.loc[~already_processed].copy()
-        msg = f"{section_name} (!) FILES REMOVED: ALREADY PROCESSED\n" \
-              f"{section_name} files that already appear in the log as processed are ignored\n" \
-              f"{df.loc[already_processed].sort_index()}"
+        with pd.option_context('display.width', None, 'display.max_columns', 3000):
+            msg = f"{section_name} (!) FILES REMOVED: ALREADY PROCESSED\n" \
+                  f"{section_name} files that already appear in the log as processed are ignored\n" \
+                  f"{df.loc[already_processed].sort_index()}"
         self.logger.log_info(msg)
         return df
 
-    def _check_file_read_permission(self, filepath, section_name) -> bool:
-        """Remove files that cannot be accessed"""
-        try:
-            with open(filepath) as f:
-                s = f.read(5)
-            checkok = True
-        except PermissionError as err:
-            msg = f"{section_name} (!) SKIPPING FILE - NO READ PERMISSION: {filepath} ({err})"
-            self.logger.log_info(msg)
-            checkok = False
-        return checkok
-
     def _generate_file_list(self):
         """Search valid files and store info in dataframe"""
 
@@ -576,38 +1086,31 @@ class IcosFormat:
         search_dirs, search_firstdate = self._set_monthly_search_folders(section_name=section_name)
 
         # Make list of all files in search dirs
-        fileslist = self._search_files(search_dirs=search_dirs)
-
-        # Dataframe to collect valid files
-        files_df = pd.DataFrame()
-
-        for filepath in fileslist:
-
-            kwargs = dict(section_name=section_name)
-
-            # Check filename ID
-            checkok = self._check_filename_id(filename=filepath.name, **kwargs)
-            if not checkok: continue
-
-            # Check if file has read permissions
-            checkok = self._check_file_read_permission(filepath=filepath, **kwargs)
-            if not checkok: continue
-
-            # Check if filedate is within search window
-            checkok = self._check_date_in_filename(filename=filepath.name, search_firstdate=search_firstdate, **kwargs)
-            if not checkok: continue
-
-            # Get date from filename
-            filename_dt = tools.get_datetime_from_filename(filename=filepath.name, filesettings=self.filesettings)
-
-            # Add file to df
-            # the index is the date contained in the filename
-            files_df.loc[filename_dt, 'RUN_ID'] = self.run_id
-            files_df.loc[filename_dt, 'RUN_DATETIME'] = self.run_start_dt
-            files_df.loc[filename_dt, 'ETH_FILENAME'] = filepath.name
-            files_df.loc[filename_dt, 'ETH_FILEPATH'] = filepath
-            files_df.loc[filename_dt, 'ETH_FILEDATE'] = filename_dt.date()
-
+        fileslist = self._search_files(search_dirs=search_dirs, section_name=section_name)
+
+        kwargs = dict(section_name=section_name)
+
+        # Check filename ID
+        fileslist = self._check_filename_ids(filepaths=fileslist, **kwargs)
+
+        # Get dates from filenames
+        filenames = [filepath.name for filepath in fileslist]
+        filename_dts = tools.get_datetimes_from_filenames(filenames=filenames, filesettings=self.filesettings)
+
+        # Check if filedate is within search window
+        checkok = self._check_dates_in_filenames(filenames=filenames, filename_dts=filename_dts,
+                                                 search_firstdate=search_firstdate, **kwargs)
+
+        # Dataframe of valid files
+        # the index is the date contained in the filename, if several files
+        # have the same date, the last file found is used
+        files_df = pd.DataFrame(index=filename_dts[checkok])
+        files_df['RUN_ID'] = self.run_id
+        files_df['RUN_DATETIME'] = pd.Timestamp(self.run_start_dt)
+        files_df['ETH_FILENAME'] = [filename for filename, ok in zip(filenames, checkok) if ok]
+        files_df['ETH_FILEPATH'] = [filepath for filepath, ok in zip(fileslist, checkok) if ok]
+        files_df['ETH_FILEDATE'] = files_df.index.date
+        files_df = files_df.loc[~files_df.index.duplicated(keep='last')]
         files_df = files_df.sort_index()
 
         # Check if there is at least one file available, otherwise stop script
@@ -615,17 +1118,170 @@ class IcosFormat:
         if not checkok: sys.exit(-1)
 
         # Log
-        available_files = files_df['ETH_FILEPATH'].to_list()
-        for file in available_files:
-            msg = f"{section_name}  ++ ADDING FILE   {file}   - for further processing"
-            self.logger.log_info(msg)
+        if self.logger.is_debug():
+            for file in files_df['ETH_FILEPATH']:
+                self.logger.log_debug(f"{section_name}  ++ ADDING FILE   {file}   - for further processing")
         self.logger.log_info(f"{section_name}   {'-' * 40}\n"
                              f"{section_name}   {len(files_df)} files are available "
                              f"for further processing.")
+        logger.section_count(logger=self.logger, section_name=section_name, files=len(files_df))
+        logger.section_end(logger=self.logger, section_name=section_name, tic=tic)
+
+        return files_df
+
+    def _plan_files_for_target_days(self, files_df) -> DataFrame:
+        """Keep only files that contain data for days that were not processed yet
+
+        Target days are days in the search window that are not listed in the
+        filetype logfile, and days whose source files were revised since they were
+        exported (OUTFILE_REEXPORT_REVISED_DAYS). Files are kept if their time coverage
+        (first and last timestamp, stored in the file coverage index) overlaps with
+        the target days.
+        """
+
+        # Start section
+        section_name = '[planning target days]'
+        tic = logger.section_start(logger=self.logger, section_name=section_name)
+
+        # Days that still need to be exported
+        search_firstdate, search_lastdate = self._get_search_window()
+        target_days = self.target_days = planner.get_target_days(
+            search_firstdate=search_firstdate,
+            search_lastdate=search_lastdate,
+            is_processed=lambda day: self._is_excluded_day(date=day) or self._is_listed_in_filetype_logfile(
+                filename=self._create_filename_for_filetype_logfile(date=day)))
+        self.logger.log_info(f"{section_name} Found {len(target_days)} days between {search_firstdate} and "
+                             f"{search_lastdate} that were not processed yet: {logger.format_list(target_days)}")
+
+        # Time coverage and checksums of files
+        coverage_index = planner.FileCoverageIndex(indexfilepath=self.filepath_coverage_index,
+                                                   filesettings=self.filesettings)
+
+        # Days that were already exported, but their source files were revised
+        if self.filesettings['OUTFILE_REEXPORT_REVISED_DAYS'] and not self.overwrite:
+            revised_days = self._detect_revised_days(files_df=files_df, coverage_index=coverage_index,
+                                                     section_name=section_name)
+            target_days = self.target_days = sorted(set(target_days) | set(revised_days))
+
+        # Time intervals needed for target days, including previous date if needed
+        intervals = planner.get_required_intervals(
+            target_days=target_days,
+            complement_with_previous_date=self.filesettings['DATA_COMPLEMENT_WITH_PREVIOUS_DATE'],
+            freq=pd.Timedelta(self.filesettings['DATA_FREQUENCY']).to_pytimedelta())
+
+        # Check time coverage of files
+        keep = []
+        coverage = []
+        for filename_dt, filepath in files_df['ETH_FILEPATH'].items():
+            if planner.is_too_old(filename_dt=filename_dt, intervals=intervals):
+                keep.append(False)
+                coverage.append((None, None))
+                continue
+            first, last = coverage_index.get_coverage(filepath=filepath)
+            keep.append(planner.covers_intervals(first=first, last=last, intervals=intervals))
+            coverage.append((first, last))
+        # Files outside the search window are removed from the index, except for runs with
+        # an explicit search window (backfill partitions do not remove entries of each other)
+        keep_filepaths = None if self.search_window else files_df['ETH_FILEPATH'].to_list()
+        files_df['FILE_FIRST'] = [first for first, last in coverage]
+        files_df['FILE_LAST'] = [last for first, last in coverage]
+        files_df = files_df.loc[keep].copy()
+
+        # Checksums of the files that are read, stored for each exported day
+        if self.filesettings['OUTFILE_REEXPORT_REVISED_DAYS']:
+            files_df['FILE_SHA256'] = [coverage_index.get_checksum(filepath=filepath)
+                                       for filepath in files_df['ETH_FILEPATH']]
+        coverage_index.save(keep_filepaths=keep_filepaths)
+
+        self.logger.log_info(f"{section_name} Scanned time coverage of {coverage_index.n_scanned} new or "
+                             f"changed files, computed checksums of {coverage_index.n_hashed} files "
+                             f"({self.filepath_coverage_index})")
+        if self.logger.is_debug():
+            for file in files_df['ETH_FILEPATH']:
+                self.logger.log_debug(f"{section_name}  ++ READING FILE   {file}   - contains data for target days")
+        self.logger.log_info(f"{section_name}   {'-' * 40}\n"
+                             f"{section_name}   {len(files_df)} files are needed for target days.")
         logger.section_end(logger=self.logger, section_name=section_name, tic=tic)
 
         return files_df
 
+    def _detect_revised_days(self, files_df, coverage_index, section_name) -> list:
+        """Days that were already exported, but whose source files changed since they were exported
+
+        The checksums of the source files that contain data for a day are compared with
+        the checksums that were stored when the day was exported, i.e. days are exported
+        again if a source file was changed, added or removed. Only the checksums of new
+        or changed files are computed (file coverage index). Days exported by older versions
+        of ppicos get the current checksums, without exporting them again.
+
+        For days at the start of the search window, some source files can be older than the
+        search for files (e.g. the file of the previous date for DATA_COMPLEMENT_WITH_PREVIOUS_DATE).
+        These files are not checked, all other files of these days are checked.
+        """
+        complement = self.filesettings['DATA_COMPLEMENT_WITH_PREVIOUS_DATE']
+        freq = pd.Timedelta(self.filesettings['DATA_FREQUENCY']).to_pytimedelta()
+        files_firstdate, _ = self._get_file_search_window()
+        search_firstdate, search_lastdate = self._get_search_window()
+        days = [search_firstdate + datetime.timedelta(days=n)
+                for n in range((search_lastdate - search_firstdate).days + 1)]
+
+        revised_days = []
+        baseline = {}
+        partly_checked = {}  # Days with source files older than the search, not checked
+        n_checked = 0
+        for day in days:
+            if self._is_excluded_day(date=day):
+                continue
+            filename = self._create_filename_for_filetype_logfile(date=day)
+            record = self.processed_files.get_record(filename=filename)
+            if record is None:
+                continue
+            intervals = planner.get_required_intervals(target_days=[day], complement_with_previous_date=complement,
+                                                       freq=freq)
+            try:
+                checksums = {
+                    filepath.name: coverage_index.get_checksum(filepath=filepath)
+                    for filename_dt, filepath in files_df['ETH_FILEPATH'].items()
+                    if not planner.is_too_old(filename_dt=filename_dt, intervals=intervals)
+                    and planner.covers_intervals(*coverage_index.get_coverage(filepath=filepath), intervals=intervals)}
+            except OSError as e:
+                self.logger.log_warning(f"{section_name} (!) Source files of {filename} could not be checked ({e})")
+                continue
+            n_checked += 1
+            if record['source_checksums'] is None:
+                baseline[filename] = checksums
+                continue
+            previous = self._remove_files_before_search(checksums=record['source_checksums'],
+                                                        files_firstdate=files_firstdate)
+            if len(previous) < len(record['source_checksums']):
+                partly_checked[day] = sorted(set(record['source_checksums']) - set(previous))
+            if previous != checksums:
+                changed = sorted(name for name in checksums if name in previous and checksums[name] != previous[name])
+                self.logger.log_info(f"{section_name}    Source files of {filename} were revised: "
+                                     f"changed {changed}, added {sorted(set(checksums) - set(previous))}, "
+                                     f"removed {sorted(set(previous) - set(checksums))}")
+                revised_days.append(day)
+                self.revised[filename] = record
+        if baseline:
+            self.processed_files.set_source_checksums(source_checksums=baseline)
+        for day, filenames in partly_checked.items():
+            self.logger.log_info(f"{section_name}    Source files of {day} older than the search for files "
+                                 f"({files_firstdate}) were not checked: {filenames}")
+        self.logger.log_info(f"{section_name} Checked source files of {n_checked} exported days, "
+                             f"{len(baseline)} days without stored checksums (stored now), "
+                             f"{len(revised_days)} days with revised source files are exported again: "
+                             f"{logger.format_list(revised_days)}")
+        return revised_days
+
+    def _remove_files_before_search(self, checksums: dict, files_firstdate) -> dict:
+        """Remove checksums of source files with a filename date before the search for files, these
+        files are not listed and cannot be checked"""
+        if not checksums:
+            return checksums
+        filename_dts = tools.get_datetimes_from_filenames(filenames=list(checksums), filesettings=self.filesettings)
+        is_searched = np.asarray(filename_dts.normalize() >= pd.Timestamp(files_firstdate))
+        return {filename: checksum for (filename, checksum), ok in zip(checksums.items(), is_searched) if ok}
+
     def _check_if_files_available(self, files_df) -> bool:
         """Check if at least one file is available for further processing"""
         if not files_df.empty:
@@ -637,33 +1293,62 @@ class IcosFormat:
             self.logger.log_info(msg)
         return checkok
 
-    def _read_filetype_logfile(self):
-        """Read logfile of already-processed files"""
-        if self.logfilepath_alreadyprocessed.is_file():
-            with open(self.logfilepath_alreadyprocessed) as f:
-                contents = f.read()
-        else:
-            # Create logfile if it does not exist yet
-            with open(self.logfilepath_alreadyprocessed, 'w') as f:
-                f.write(f"================================================\n")
-                f.write(f"FILES ALREADY PROCESSED AND CREATED WITH ppicos\n")
-                f.write(f"================================================\n")
-                f.write(f"* Files listed here are not re-processed\n")
-                f.write(f"* Delete files from list this enable re-processing with ppicos\n")
-                f.write(f"------------------------------------------------\n")
-            contents = ""
-        return contents
-
-    def _add_filename_to_filetype_logfile(self, filename: str) -> None:
+    def _open_processed_files_store(self) -> statestore.ProcessedFilesStore:
+        """Open database of already-processed files, changes in the filetype logfile are imported"""
+        if statestore.is_network_path(self.dbfilepath_alreadyprocessed):
+            self.logger.log_warning(f"(!)WARNING database of already-processed files {self.dbfilepath_alreadyprocessed} "
+                                 f"is on a network share, database locking is not reliable there "
+                                 f"(set {statestore.ENV_STATE_DIR} to a local folder)")
+        processed_files = statestore.ProcessedFilesStore(dbfilepath=self.dbfilepath_alreadyprocessed,
+                                                         logfilepath=self.logfilepath_alreadyprocessed)
+        if processed_files.n_synced:
+            self.logger.log_info(f"Imported {processed_files.n_synced} changes from filetype logfile "
+                                 f"{self.logfilepath_alreadyprocessed} to {self.dbfilepath_alreadyprocessed}")
+        return processed_files
+
+    def _get_source_files_for_date(self, files_df, date) -> list:
+        """Names of source files that contain data for date"""
+        intervals = planner.get_required_intervals(
+            target_days=[date],
+            complement_with_previous_date=self.filesettings['DATA_COMPLEMENT_WITH_PREVIOUS_DATE'],
+            freq=pd.Timedelta(self.filesettings['DATA_FREQUENCY']).to_pytimedelta())
+        return [filename for filename, first, last
+                in zip(files_df['ETH_FILENAME'], files_df['FILE_FIRST'], files_df['FILE_LAST'])
+                if planner.covers_intervals(first=first, last=last, intervals=intervals)]
+
+    @staticmethod
+    def _get_source_checksums(files_df, source_files: list):
+        """Checksums of source files (dict), None if checksums were not computed (OUTFILE_REEXPORT_REVISED_DAYS)"""
+        if 'FILE_SHA256' not in files_df:
+            return None
+        checksums = dict(zip(files_df['ETH_FILENAME'], files_df['FILE_SHA256']))
+        return {filename: checksums[filename] for filename in source_files}
+
+    def _record_written_days(self, records: list, manifest_rows: dict, section_name: str) -> None:
+        """Add written days to the filetype logfile and their files to the checksum manifests"""
+        self._add_filenames_to_filetype_logfile(records=records, section_name=section_name)
+        self._update_manifests(manifest_rows=manifest_rows, section_name=section_name)
+
+    def _update_manifests(self, manifest_rows: dict, section_name: str) -> None:
+        """Add written files to the checksum manifests of their months (manifest.py)"""
+        if not manifest_rows:
+            return
+        with self.processed_files.lock():
+            for (year, month), rows in manifest_rows.items():
+                manifest.update_manifest(
+                    filepath=manifest.get_manifest_filepath(outdir=self.filesettings['DIR_OUT_ICOS'],
+                                                            year=year, month=month),
+                    rows=rows)
+        self.logger.log_info(f"{section_name} Added {sum(len(rows) for rows in manifest_rows.values())} files "
+                             f"to the checksum manifests of {len(manifest_rows)} months")
+
+    def _add_filenames_to_filetype_logfile(self, records: list, section_name: str) -> None:
         """
-        Add filename to filetype logfile that stores names
+        Add filenames to filetype logfile that stores names
         of files that were already processed
         """
-        # Add filename to logfile
-        writemode = 'a' if self.logfilepath_alreadyprocessed.is_file() else 'w'
-        with open(self.logfilepath_alreadyprocessed, writemode) as f:
-            f.write(f"{filename}    created {datetime.datetime.now()}")
-            f.write('\n')
+        self.processed_files.add(records=records)
+        self.logger.log_info(f"{section_name} Added {len(records)} files to filetype logfile")
 
     def _setup_logger(self):
         """Setup text output to console and file"""
@@ -0,0 +1,107 @@
+"""
+Checksum manifest of the created ICOS files
+
+For each month, the files in the output folder YYYY/MM (tools.get_subdir_from_date)
+are listed in a manifest next to the folder, YYYY/ppicos_manifest_YYYY-MM.csv:
+
+    FILENAME, SIZE, SHA256, N_RECORDS, FIRST_TIMESTAMP, LAST_TIMESTAMP
+
+SIZE and SHA256 are computed from the bytes while they are written
+(IcosFormat._write_output_file), i.e. files are not read again. N_RECORDS and
+the timestamps (ICOS timestamp) are those of the ICOS CSV data. Files that are
+written again (e.g. revised days) replace their rows.
+
+The manifest is checked against the files on disk with:
+
+    python cli.py verify 10_meteo [--checksums]
+
+By default only the size of each file is checked (no file is read), with
+--checksums the SHA-256 checksums are computed. Files in the month folders that
+are not listed in the manifest (e.g. created by older versions of ppicos) are
+reported, but are not errors.
+
+"""
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+MANIFEST_COLUMNS = ['FILENAME', 'SIZE', 'SHA256', 'N_RECORDS', 'FIRST_TIMESTAMP', 'LAST_TIMESTAMP']
+MANIFEST_GLOB = 'ppicos_manifest_*.csv'
+
+# Number of threads used to compute checksums of files in verify
+VERIFY_MAX_WORKERS = 8
+
+
+def get_manifest_filepath(outdir: Path, year: int, month: int) -> Path:
+    """Manifest of the month folder outdir/YYYY/MM"""
+    return Path(outdir) / f'{year:04}' / f'ppicos_manifest_{year:04}-{month:02}.csv'
+
+
+def read_manifest(filepath: Path) -> dict:
+    """Rows of the manifest (dicts) by filename, empty if the manifest does not exist"""
+    if not Path(filepath).is_file():
+        return {}
+    with open(filepath, newline='') as f:
+        return {row['FILENAME']: row for row in csv.DictReader(f)}
+
+
+def update_manifest(filepath: Path, rows: list) -> None:
+    """Add rows (dicts with MANIFEST_COLUMNS) to the manifest, rows of the same files are replaced
+
+    Several processes can create files of the same month (e.g. backfill partitions),
+    the caller makes sure that only one process updates the manifest at a time.
+    """
+    import tools  # Not imported at the top, verify does not need pandas
+
+    manifest = read_manifest(filepath=filepath)
+    manifest.update({row['FILENAME']: row for row in rows})
+    with tools.atomic_filepath(filepath=Path(filepath)) as tmpfilepath:
+        with open(tmpfilepath, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=MANIFEST_COLUMNS)
+            writer.writeheader()
+            for filename in sorted(manifest):
+                writer.writerow({col: manifest[filename][col] for col in MANIFEST_COLUMNS})
+
+
+def verify(outdir: Path, checksums: bool = False) -> dict:
+    """Check the files listed in all manifests in outdir
+
+    Returns:
+        dict with the number of checked files (n_checked) and lists of filepaths that
+        are missing, have a different size (wrong_size) or checksum (wrong_checksum),
+        or are not listed in a manifest (unlisted)
+    """
+    result = dict(n_checked=0, missing=[], wrong_size=[], wrong_checksum=[], unlisted=[])
+    to_hash = []
+    # Months with a manifest or a month folder
+    months = {tuple(int(x) for x in filepath.stem.rsplit('_', 1)[1].split('-'))
+              for filepath in Path(outdir).glob(f'[0-9][0-9][0-9][0-9]/{MANIFEST_GLOB}')}
+    months |= {(int(month_dir.parent.name), int(month_dir.name))
+               for month_dir in Path(outdir).glob('[0-9][0-9][0-9][0-9]/[0-9][0-9]') if month_dir.is_dir()}
+    for year, month in sorted(months):
+        month_dir = Path(outdir) / f'{year:04}' / f'{month:02}'
+        listed = read_manifest(filepath=get_manifest_filepath(outdir=outdir, year=year, month=month))
+        for filename, row in listed.items():
+            filepath = month_dir / filename
+            result['n_checked'] += 1
+            try:
+                size = os.stat(filepath).st_size
+            except FileNotFoundError:
+                result['missing'].append(filepath)
+                continue
+            if size != int(row['SIZE']):
+                result['wrong_size'].append(filepath)
+            elif checksums:
+                to_hash.append((filepath, row['SHA256']))
+        if month_dir.is_dir():
+            result['unlisted'] += sorted(filepath for filepath in month_dir.iterdir()
+                                         if filepath.is_file() and (filepath.name not in listed))
+
+    if to_hash:
+        import tools  # pandas is only imported if checksums are computed
+        with ThreadPoolExecutor(max_workers=VERIFY_MAX_WORKERS) as executor:
+            computed = executor.map(tools.hash_value_for_file, [filepath for filepath, _ in to_hash])
+            result['wrong_checksum'] = [filepath for (filepath, sha256), checksum in zip(to_hash, computed)
+                                        if checksum != sha256]
+    return result
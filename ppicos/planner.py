@@ -0,0 +1,214 @@
+"""
+Plan which source files need to be read
+
+Daily ICOS files are created only once. Before reading the source files,
+the days in the search window that were not yet exported (target days)
+are detected and only the source files that contain data for these days
+are read.
+
+To know which data a source file contains, the first and last timestamp
+of each file are stored in a small index file (file coverage index). The
+timestamps are read from the first and last lines of the file, the index
+is updated only when the size or modification time of a file changed. The
+index also stores the SHA-256 checksum of the file content, computed when
+it is needed for the first time (see FileCoverageIndex.get_checksum), to
+detect files that were revised (see IcosFormat._detect_revised_days).
+
+"""
+import csv
+import datetime as dt
+import os
+from pathlib import Path
+
+import tools
+
+# Max number of bytes read from the end of a file to find the last record
+TAIL_BLOCK_SIZE = 2 ** 16
+
+# Memory needed per byte of source file, parsed data need about as much memory
+# as the file and are copied several times while they are formatted
+MEMORY_PER_FILE_BYTE = 4
+
+
+def get_target_days(search_firstdate: dt.date, search_lastdate: dt.date, is_processed) -> list:
+    """Return days between first and last date (incl.) that were not processed yet
+
+    Args:
+        search_firstdate: first day of search window
+        search_lastdate: last day of search window
+        is_processed: function that returns True for days that were already exported
+    """
+    target_days = []
+    day = search_firstdate
+    while day <= search_lastdate:
+        if not is_processed(day):
+            target_days.append(day)
+        day += dt.timedelta(days=1)
+    return target_days
+
+
+def get_required_intervals(target_days: list, complement_with_previous_date: bool,
+                           freq: dt.timedelta = dt.timedelta(0)) -> list:
+    """Time intervals (start, end] of original timestamps needed for target days
+
+    The original timestamp shows the END of the averaging interval, the record
+    at midnight therefore belongs to the previous day. Records are assigned to
+    days by the middle of the averaging interval, i.e. records up to half the
+    data frequency (freq) after midnight also belong to the previous day (e.g.
+    00:00:04 with 1-minute data). If data of the previous date are needed to
+    complement the day, the interval starts one day earlier.
+    """
+    intervals = []
+    for day in target_days:
+        start = dt.datetime(day.year, day.month, day.day)
+        if complement_with_previous_date:
+            start -= dt.timedelta(days=1)
+        end = dt.datetime(day.year, day.month, day.day) + dt.timedelta(days=1) + freq / 2
+        intervals.append((start, end))
+    return intervals
+
+
+def covers_intervals(first: dt.datetime, last: dt.datetime, intervals: list) -> bool:
+    """Check if file coverage [first, last] overlaps with at least one interval (start, end]"""
+    if (first is None) or (last is None):
+        # Unknown coverage, file is always read
+        return True
+    for start, end in intervals:
+        if (first <= end) and (last > start):
+            return True
+    return False
+
+
+class FileCoverageIndex:
+    """First and last timestamp and checksum of source files, stored to CSV"""
+
+    columns = ['FILEPATH', 'SIZE', 'MTIME', 'FIRST', 'LAST', 'SHA256']
+    datetime_format = '%Y-%m-%d %H:%M:%S'
+
+    def __init__(self, indexfilepath: Path, filesettings: dict):
+        self.indexfilepath = indexfilepath
+        self.filesettings = filesettings
+        self.entries = self._load()
+        self.n_scanned = 0
+        self.n_hashed = 0
+
+    def _load(self) -> dict:
+        entries = {}
+        if not self.indexfilepath.is_file():
+            return entries
+        with open(self.indexfilepath, newline='') as f:
+            for row in csv.DictReader(f):
+                entries[row['FILEPATH']] = dict(
+                    SIZE=int(row['SIZE']),
+                    MTIME=float(row['MTIME']),
+                    FIRST=self._str_to_dt(row['FIRST']),
+                    LAST=self._str_to_dt(row['LAST']),
+                    SHA256=row.get('SHA256') or None)  # Index files of older versions have no checksums
+        return entries
+
+    def save(self, keep_filepaths: list = None) -> None:
+        """Save index, only keep files in keep_filepaths (if given)"""
+        if keep_filepaths is not None:
+            keep = {str(fp) for fp in keep_filepaths}
+            self.entries = {k: v for k, v in self.entries.items() if k in keep}
+        # Other processes (e.g. backfill partitions) never read an incomplete index
+        with tools.atomic_filepath(filepath=Path(self.indexfilepath)) as tmpfilepath:
+            with open(tmpfilepath, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(self.columns)
+                for filepath, e in sorted(self.entries.items()):
+                    writer.writerow([filepath, e['SIZE'], e['MTIME'],
+                                     self._dt_to_str(e['FIRST']), self._dt_to_str(e['LAST']), e['SHA256'] or ''])
+
+    def get_coverage(self, filepath: Path) -> tuple:
+        """Return first and last timestamp in file, (None, None) if not known"""
+        stat = os.stat(filepath)
+        entry = self.entries.get(str(filepath))
+        if entry and (entry['SIZE'] == stat.st_size) and (entry['MTIME'] == stat.st_mtime):
+            return entry['FIRST'], entry['LAST']
+        first, last = self._scan_file(filepath=filepath)
+        self.n_scanned += 1
+        self.entries[str(filepath)] = dict(SIZE=stat.st_size, MTIME=stat.st_mtime, FIRST=first, LAST=last,
+                                           SHA256=None)
+        return first, last
+
+    def get_checksum(self, filepath: Path) -> str:
+        """Return SHA-256 checksum of the file content, only computed if the file is new or changed
+
+        Returns None if the file cannot be read (e.g. no read permission), the file is
+        skipped when it is read.
+        """
+        self.get_coverage(filepath=filepath)
+        entry = self.entries[str(filepath)]
+        if entry['SHA256'] is None:
+            try:
+                entry['SHA256'] = tools.hash_value_for_file(file_full_path=filepath)
+            except OSError:
+                return None
+            self.n_hashed += 1
+        return entry['SHA256']
+
+    def _scan_file(self, filepath: Path) -> tuple:
+        """Read timestamps of first and last record"""
+        n_preamble = tools.get_first_data_row(filesettings=self.filesettings)
+        try:
+            with open(filepath, 'rb') as f:
+                # First record
+                first = None
+                for ix, line in enumerate(f):
+                    if ix < n_preamble:
+                        continue
+                    first = self._parse_line(line)
+                    if first:
+                        break
+
+                # Last record
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(0, size - TAIL_BLOCK_SIZE))
+                lines = f.read().splitlines()
+                last = None
+                for line in reversed(lines):
+                    last = self._parse_line(line)
+                    if last:
+                        break
+        except OSError:
+            first, last = None, None
+        return first, last
+
+    def _parse_line(self, line: bytes):
+        """Parse timestamp from one data line, returns None if not possible"""
+        try:
+            values = line.decode('utf-8').split(self.filesettings['DATA_SEPARATOR'])
+            value = values[self.filesettings['DATA_TIMESTAMP_COL']].strip().strip('"')
+            return dt.datetime.strptime(value, self.filesettings['DATA_TIMESTAMP_FORMAT'])
+        except (ValueError, IndexError, UnicodeDecodeError):
+            return None
+
+    def _dt_to_str(self, value) -> str:
+        return value.strftime(self.datetime_format) if value else ''
+
+    def _str_to_dt(self, value: str):
+        return dt.datetime.strptime(value, self.datetime_format) if value else None
+
+
+def is_too_old(filename_dt: dt.datetime, intervals: list) -> bool:
+    """Check if the date in the filename (filename_dt) is too old for the required intervals
+
+    Data files contain data until at most one day after the date in the filename
+    (e.g. the record at midnight), older files are not needed.
+    """
+    if not intervals:
+        return True
+    first_needed = min(start for start, end in intervals)
+    return (filename_dt + dt.timedelta(days=1)) < first_needed
+
+
+def estimate_memory_bytes(filepaths: list) -> int:
+    """Estimate memory needed to read and format all files at once, from the size of the files"""
+    size = 0
+    for filepath in filepaths:
+        try:
+            size += os.stat(filepath).st_size
+        except OSError:
+            pass
+    return size * MEMORY_PER_FILE_BYTE
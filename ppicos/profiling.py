@@ -0,0 +1,176 @@
+"""
+Profiling of processing sections
+
+The sections of a run (e.g. [reading file data], [formatting data] and
+[exporting daily files], see logger.section_start and logger.section_end)
+can be profiled. Profiling is switched off by default and is switched on
+with the environment variable PPICOS_PROFILE (or the argument profile of
+IcosFormat), a comma-separated list of:
+
+    time:       runtime and counters of each section, e.g. number of rows, bytes
+                read from source files and rows per second (always included)
+    cprofile:   cProfile of each section, stored next to the run log as
+                <run log>_<section>_<n>.prof (e.g. for pstats or snakeviz). Only the
+                main thread is profiled, not the threads that read and write files.
+    memory:     memory at the start and end and peak memory of each section and the
+                code lines that allocated most of the memory that is still used at
+                the end of the section (tracemalloc, started when the run starts,
+                slows down the run)
+    all:        all of the above
+
+Only some sections are profiled if PPICOS_PROFILE_SECTIONS (or the argument
+profile_sections) is set, a comma-separated list of section names without
+brackets, e.g. PPICOS_PROFILE_SECTIONS="reading file data,formatting data".
+
+The results are stored as JSON next to the run log (<run log>_profile.json),
+together with the versions of Python, pandas, numpy and pyarrow, so that runs
+before and after an update of these packages can be compared. The report is
+updated at the end of each profiled section.
+
+"""
+import cProfile
+import datetime
+import json
+import os
+import platform
+import re
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import tools
+
+ENV_PROFILE = 'PPICOS_PROFILE'
+ENV_PROFILE_SECTIONS = 'PPICOS_PROFILE_SECTIONS'
+PROFILE_TOOLS = ['time', 'cprofile', 'memory']
+
+# Number of code lines with the largest memory allocations in the report
+N_TOP_ALLOCATIONS = 10
+
+
+def get_profiler(logfilepath: Path, profile: str = None, profile_sections: str = None, info: dict = None):
+    """Profiler for the run with logfilepath, None if profiling is switched off
+
+    Args:
+        profile: comma-separated profiling tools (see PROFILE_TOOLS), if None
+            the environment variable PPICOS_PROFILE is used
+        profile_sections: comma-separated section names, if None the environment
+            variable PPICOS_PROFILE_SECTIONS is used, if not set all sections are profiled
+        info: added to the report, e.g. run ID and filegroup
+    """
+    profile = os.environ.get(ENV_PROFILE, '') if profile is None else profile
+    profile_tools = {x.strip().lower() for x in profile.split(',') if x.strip()}
+    if not profile_tools or profile_tools <= {'0', 'false', 'no', 'off'}:
+        return None
+    if profile_tools & {'1', 'true', 'yes', 'on', 'all'}:
+        profile_tools = set(PROFILE_TOOLS)
+    unknown = profile_tools - set(PROFILE_TOOLS)
+    if unknown:
+        raise ValueError(f"Unknown profiling tools {sorted(unknown)}, must be 'all' or from {PROFILE_TOOLS}")
+    profile_tools.add('time')
+
+    profile_sections = os.environ.get(ENV_PROFILE_SECTIONS) if profile_sections is None else profile_sections
+    sections = {x.strip().strip('[]') for x in profile_sections.split(',') if x.strip()} \
+        if profile_sections else None
+    return Profiler(logfilepath=logfilepath, profile_tools=profile_tools, sections=sections, info=info)
+
+
+def get_versions() -> dict:
+    try:
+        import pyarrow
+        pyarrow_version = pyarrow.__version__
+    except ImportError:
+        pyarrow_version = None
+    return dict(python=platform.python_version(), pandas=pd.__version__, numpy=np.__version__,
+                pyarrow=pyarrow_version)
+
+
+class Profiler:
+    """Runtime, counters, cProfile and memory of sections, stored as JSON report"""
+
+    def __init__(self, logfilepath: Path, profile_tools: set, sections: set = None, info: dict = None):
+        self.basepath = Path(logfilepath).with_suffix('')
+        self.reportfilepath = self.basepath.with_name(f"{self.basepath.name}_profile.json")
+        self.profile_tools = profile_tools
+        self.sections = sections
+        self.report = dict(created=str(datetime.datetime.now()), info=info or {}, versions=get_versions(),
+                           profile_tools=sorted(profile_tools),
+                           sections_filter=sorted(sections) if sections else None,
+                           sections=[])
+        self._active = {}  # State of sections that were started and not stopped yet
+        self._n_calls = {}  # Number of times each section was started
+        self._cprofile_active = False
+        if ('memory' in self.profile_tools) and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def is_profiled(self, section_name: str) -> bool:
+        return (self.sections is None) or (section_name.strip('[]') in self.sections)
+
+    def start(self, section_name: str) -> None:
+        if not self.is_profiled(section_name=section_name):
+            return
+        self._n_calls[section_name] = self._n_calls.get(section_name, 0) + 1
+        state = dict(counters={})
+        if 'memory' in self.profile_tools:
+            tracemalloc.reset_peak()
+            state['memory_start'] = tracemalloc.get_traced_memory()[0]
+            state['snapshot'] = self._take_snapshot()
+        if ('cprofile' in self.profile_tools) and not self._cprofile_active:
+            # Only one cProfile can be active, sections within sections are not profiled separately
+            state['cprofile'] = cProfile.Profile()
+            self._cprofile_active = True
+            state['cprofile'].enable()
+        self._active[section_name] = state
+
+    def count(self, section_name: str, **counters) -> None:
+        """Add counters to the section if it is profiled, e.g. rows=100"""
+        state = self._active.get(section_name)
+        if state is None:
+            return
+        for key, value in counters.items():
+            state['counters'][key] = state['counters'].get(key, 0) + value
+
+    def stop(self, section_name: str, runtime: float) -> None:
+        state = self._active.pop(section_name, None)
+        if state is None:
+            return
+        n_call = self._n_calls[section_name]
+        entry = dict(section=section_name, call=n_call, runtime=runtime, **state['counters'])
+        if runtime > 0:
+            if 'rows' in entry:
+                entry['rows_per_second'] = entry['rows'] / runtime
+            if 'bytes_read' in entry:
+                entry['mb_read_per_second'] = entry['bytes_read'] / 1024 ** 2 / runtime
+
+        if 'cprofile' in state:
+            state['cprofile'].disable()
+            self._cprofile_active = False
+            slug = re.sub(r'[^0-9A-Za-z]+', '-', section_name).strip('-')
+            filepath = self.basepath.with_name(f"{self.basepath.name}_{slug}_{n_call}.prof")
+            state['cprofile'].dump_stats(filepath)
+            entry['cprofile'] = filepath.name
+
+        if 'snapshot' in state:
+            current, peak = tracemalloc.get_traced_memory()
+            top = self._take_snapshot().compare_to(state['snapshot'], 'lineno')[:N_TOP_ALLOCATIONS]
+            entry['memory_start_mb'] = state['memory_start'] / 1024 ** 2
+            entry['memory_end_mb'] = current / 1024 ** 2
+            entry['memory_peak_mb'] = peak / 1024 ** 2
+            entry['memory_top_allocations'] = [
+                dict(location=f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                     size_mb=stat.size_diff / 1024 ** 2, count=stat.count_diff)
+                for stat in top]
+
+        self.report['sections'].append(entry)
+        self.write_report()
+
+    def write_report(self) -> None:
+        with tools.atomic_filepath(filepath=self.reportfilepath) as tmpfilepath:
+            with open(tmpfilepath, 'w') as f:
+                json.dump(self.report, f, indent=2)
+
+    @staticmethod
+    def _take_snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
@@ -0,0 +1,177 @@
+"""
+Readers for source files
+
+The data types of the columns in the source files rarely change from file
+to file. Numeric columns are therefore detected once for each filetype (from
+the first file that is read) and are given to the reader, which converts them
+directly to float64 while parsing the file. All other columns are detected for
+each file and are then converted to numeric where possible (IcosFormat._convert_to_numeric),
+i.e. a column with text in one file (e.g. "ERR") is still numeric in the other files.
+
+Two readers are available and can be selected with the filesettings
+key READ_BACKEND:
+
+    'pandas':   pandas C parser (default)
+    'pyarrow':  multithreaded CSV parser of pyarrow (optional dependency).
+                In contrast to pandas, rows with too few values are skipped
+                (pandas fills missing values with NaN).
+
+"""
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+import timestamps
+import tools
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    from pandas._libs.parsers import STR_NA_VALUES
+except ImportError:
+    pa = None
+    pacsv = None
+    STR_NA_VALUES = None
+
+# Values that are considered missing, in addition to the pandas defaults
+NA_VALUES = ['NAN', 'inf']  # 'inf' added in v4.0.15
+
+
+def infer_dtypes(df: DataFrame, filesettings: dict) -> dict:
+    """Detect numeric columns from data of one file
+
+    Args:
+        df: data of one file, after numeric columns were converted to float64
+            (or float32, see compact.py)
+        filesettings: settings of the filetype
+
+    Returns:
+        dict with the column names and the data type of the timestamp column (always
+        read as string) and of the numeric columns by position in the file, the data
+        types of other columns are not given and are detected for each file
+    """
+    ts_col = filesettings['DATA_TIMESTAMP_COL']
+    dtypes = {ts_col: str}
+    for ix, col in enumerate(df.columns):
+        filepos = ix if ix < ts_col else ix + 1  # Position in file includes timestamp column
+        if df[col].dtype.kind == 'f':
+            dtypes[filepos] = np.float64
+    return dict(columns=list(df.columns), dtypes=dtypes)
+
+
+def _set_timestamp_index(df: DataFrame, filesettings: dict) -> DataFrame:
+    """Parse timestamp index, timestamps that cannot be parsed are NaT"""
+    df.index = pd.DatetimeIndex(
+        timestamps.parse_timestamps(values=df.index.values, timestamp_format=filesettings['DATA_TIMESTAMP_FORMAT']),
+        name=df.index.name)
+    return df
+
+
+class PandasCsvReader:
+    """Read source file with the pandas C parser"""
+
+    name = 'pandas'
+
+    def __init__(self, filesettings: dict):
+        self.filesettings = filesettings
+
+    def read(self, filepath, dtypes: dict = None) -> DataFrame:
+        """Read file to dataframe with timestamp index
+
+        Args:
+            filepath: source file
+            dtypes: data types from infer_dtypes, if None only the timestamp is
+                read as string and the data types of all other columns are
+                detected by pandas
+
+        Columns without given data type are returned as detected by the reader,
+        they still need to be converted to numeric where possible.
+
+        Raises:
+            ValueError: if a column cannot be converted to the given data type
+        """
+        filedata_df = pd.read_csv(filepath,
+                                  dtype=dtypes['dtypes'] if dtypes else {self.filesettings['DATA_TIMESTAMP_COL']: str},
+                                  index_col=self.filesettings['DATA_TIMESTAMP_COL'],
+                                  header=self.filesettings['DATA_HEADER_ROWS'],
+                                  skiprows=self.filesettings['DATA_SKIP_ROWS'],
+                                  encoding='utf-8',
+                                  sep=self.filesettings['DATA_SEPARATOR'],
+                                  on_bad_lines='skip',
+                                  na_values=NA_VALUES)
+        filedata_df = _set_timestamp_index(df=filedata_df, filesettings=self.filesettings)
+        if dtypes:
+            _check_columns(df=filedata_df, dtypes=dtypes)
+        return filedata_df
+
+
+class PyarrowCsvReader(PandasCsvReader):
+    """Read source file with the multithreaded CSV parser of pyarrow"""
+
+    name = 'pyarrow'
+
+    def __init__(self, filesettings: dict):
+        if not pacsv:
+            raise ImportError("Reader 'pyarrow' needs the package pyarrow, please install it")
+        super().__init__(filesettings=filesettings)
+
+    def read(self, filepath, dtypes: dict = None) -> DataFrame:
+        # Without known data types, pandas is used to detect them
+        if not dtypes:
+            return super().read(filepath=filepath, dtypes=None)
+
+        # Column names are not parsed by pyarrow, check that the header of
+        # the file is the same as the header of the file used for the data types
+        header_df = pd.read_csv(filepath,
+                                nrows=0,
+                                index_col=self.filesettings['DATA_TIMESTAMP_COL'],
+                                header=self.filesettings['DATA_HEADER_ROWS'],
+                                skiprows=self.filesettings['DATA_SKIP_ROWS'],
+                                encoding='utf-8',
+                                sep=self.filesettings['DATA_SEPARATOR'])
+        _check_columns(df=header_df, dtypes=dtypes)
+
+        n_cols = len(dtypes['columns']) + 1  # Columns incl. timestamp
+        read_options = pacsv.ReadOptions(
+            skip_rows=tools.get_first_data_row(filesettings=self.filesettings),
+            column_names=[str(i) for i in range(n_cols)],
+            use_threads=True,
+            encoding='utf8')
+        parse_options = pacsv.ParseOptions(
+            delimiter=self.filesettings['DATA_SEPARATOR'],
+            invalid_row_handler=lambda row: 'skip')
+        convert_options = pacsv.ConvertOptions(
+            column_types={str(pos): pa.float64() if dtypes['dtypes'].get(pos) == np.float64 else pa.string()
+                          for pos in range(n_cols)},
+            null_values=sorted(STR_NA_VALUES) + NA_VALUES,
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=True)
+        table = pacsv.read_csv(filepath, read_options=read_options,
+                               parse_options=parse_options, convert_options=convert_options)
+
+        filedata_df = table.to_pandas()
+        filedata_df = filedata_df.set_index(str(self.filesettings['DATA_TIMESTAMP_COL']))
+        filedata_df.columns = header_df.columns
+        filedata_df.index.name = header_df.index.name
+        filedata_df = _set_timestamp_index(df=filedata_df, filesettings=self.filesettings)
+        for col in filedata_df.columns:
+            if filedata_df[col].dtype == object:
+                filedata_df[col] = filedata_df[col].fillna(np.nan)  # Missing values as NaN (not None), as with pandas
+        return filedata_df
+
+
+def _check_columns(df: DataFrame, dtypes: dict) -> None:
+    """Make sure the file has the same columns as the file the data types were detected from"""
+    if list(df.columns) != dtypes['columns']:
+        raise ValueError("columns in file are different from columns used to detect data types")
+
+
+READERS = {
+    'pandas': PandasCsvReader,
+    'pyarrow': PyarrowCsvReader
+}
+
+
+def get_reader(filesettings: dict):
+    """Return reader defined in filesettings"""
+    return READERS[filesettings['READ_BACKEND']](filesettings=filesettings)
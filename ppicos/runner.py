@@ -0,0 +1,145 @@
+"""
+Run several filetypes in parallel
+
+Each filetype is processed in its own worker process. Worker processes
+are not re-used (max_tasks_per_child=1, Python 3.11+), i.e. the memory used
+for one filetype is released when the filetype is finished and does not add
+up over the course of the run.
+
+If a worker process dies without returning a result (e.g. killed by the OOM
+killer), the pool is broken and all unfinished filetypes fail with
+BrokenProcessPool. These filetypes are then run again one after another, each
+in a new single worker process: the filetype whose process dies again is
+reported as failed, the other filetypes are processed normally (days that were
+already exported are skipped).
+
+"""
+import datetime
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+
+def run_filetype(filetype: str, filetypesettings: dict, max_age_days: int, use_cache: bool = True,
+                 **kwargs) -> dict:
+    """Run ppicos for one filetype and collect info about the run
+
+    Exceptions are not raised but returned as part of the result,
+    so that one failing filetype does not stop the other filetypes.
+    Further keyword arguments are passed to IcosFormat (e.g. search_window).
+    """
+    # Import here so that the main process does not need to load pandas
+    from main import IcosFormat
+
+    tic = time.time()
+    result = dict(filetype=filetype, ok=False, runtime=None, error=None, traceback=None, pid=os.getpid())
+    try:
+        # Log file is closed when the filetype is finished, worker processes do not run atexit handlers
+        with IcosFormat(filesettings=filetypesettings, max_age_days=max_age_days, use_cache=use_cache,
+                        **kwargs) as icosformat:
+            icosformat.run()
+        result['ok'] = True
+    except (Exception, SystemExit) as e:
+        # SystemExit b/c IcosFormat calls sys.exit() when no files are found, KeyboardInterrupt stops the run
+        result['error'] = f"{type(e).__name__}: {e}"
+        result['traceback'] = traceback.format_exc()
+    result['runtime'] = time.time() - tic
+    return result
+
+
+def run_filetypes(loop_settings: dict, max_age_days: int, max_workers: int = None, use_cache: bool = True) -> list:
+    """Run ppicos for all filetypes in loop_settings using a pool of worker processes
+
+    Args:
+        loop_settings: filetype names (keys) and their filesettings (values)
+        max_age_days: passed to IcosFormat
+        max_workers: number of worker processes, if None the number of CPUs is used,
+            if 1 all filetypes are processed one after another in this process
+        use_cache: passed to IcosFormat, False always reads files from source
+
+    Returns:
+        list of dicts (one per filetype, same order as loop_settings), see run_filetype
+    """
+    if not max_workers:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(loop_settings)))
+
+    tasks = [(filetype, filetypesettings, max_age_days, use_cache)
+             for filetype, filetypesettings in loop_settings.items()]
+
+    if max_workers == 1:
+        return [run_filetype(*task) for task in tasks]
+
+    return run_in_processes(func=run_filetype, tasks=tasks, names=list(loop_settings), max_workers=max_workers)
+
+
+def _make_executor(max_workers: int) -> ProcessPoolExecutor:
+    """Pool of worker processes, each task gets a fresh process (Python 3.11+)"""
+    if sys.version_info >= (3, 11):
+        return ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=1)
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+
+def _broken_result(name: str, error: BaseException, runtime: float) -> dict:
+    """Result of a task whose worker process died, see run_filetype"""
+    return dict(filetype=name, ok=False, runtime=runtime, pid=None,
+                error=f"{type(error).__name__}: worker process died without a result "
+                      f"(e.g. killed by the OOM killer)",
+                traceback=''.join(traceback.format_exception(type(error), error, error.__traceback__)))
+
+
+def run_in_processes(func, tasks: list, names: list, max_workers: int) -> list:
+    """Call func(*task) for each task in worker processes
+
+    Args:
+        func: function that returns a result dict, see run_filetype
+        tasks: tuples of arguments of func
+        names: name of each task (e.g. filetype), used for tasks whose worker process died
+        max_workers: number of worker processes
+
+    Returns:
+        list of results, same order as tasks
+    """
+    results = [None] * len(tasks)
+    broken = []
+    with _make_executor(max_workers=max_workers) as executor:
+        futures = {executor.submit(func, *task): ix for ix, task in enumerate(tasks)}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except BrokenProcessPool:
+                broken.append(futures[future])
+
+    # Tasks of a broken pool are run again, each in its own new worker process
+    for ix in sorted(broken):
+        tic = time.time()
+        try:
+            with _make_executor(max_workers=1) as executor:
+                results[ix] = executor.submit(func, *tasks[ix]).result()
+        except BrokenProcessPool as e:
+            results[ix] = _broken_result(name=names[ix], error=e, runtime=time.time() - tic)
+    return results
+
+
+def print_summary(results: list, total_runtime: datetime.timedelta) -> None:
+    """Print overview of successful and failed filetypes"""
+    print(f"\n\n\n{'=' * 40}\nRuntime for all filetypes: {total_runtime}")
+    print(f"Sum of runtimes of all filetypes: {sum(r['runtime'] for r in results):.1f}s")
+
+    print("\nSuccesful ppicos runs:")
+    [print(f"    OK:  {r['filetype']}  ({r['runtime']:.1f}s)") for r in results if r['ok']]
+
+    print("\nNOT succesful ppicos runs:")
+    for r in results:
+        if r['ok']:
+            continue
+        print(f"    NOT OK:  {r['filetype']}  ({r['runtime']:.1f}s)  {r['error']}")
+
+    failed = [r for r in results if not r['ok']]
+    if failed:
+        print(f"\n{'=' * 40}\nTRACEBACKS")
+        for r in failed:
+            print(f"\n--- {r['filetype']} ---\n{r['traceback']}")
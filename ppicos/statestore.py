@@ -0,0 +1,225 @@
+"""
+Store of already-processed daily files
+
+Each daily file that was created is recorded in a SQLite database (one
+database per filegroup and output folder), together with the run ID, the
+source files that contain data for the day, the number of records, the
+SHA-256 checksum of the ICOS CSV data and the SHA-256 checksums of the source
+files (to detect days whose source files were revised). Checking if a day was
+already processed is a lookup of the primary key, all days created in one run
+are recorded in one transaction.
+
+The text logfile (ppicos_<filegroup>_files-already-processed.log) is still
+written for operators and is imported when the database is created. Days can
+still be re-processed by deleting their lines from the text logfile: if the
+text logfile was changed outside ppicos, the database is synchronized with
+the text logfile (days that are no longer listed are removed from the database).
+
+The database is stored on local disk in the state folder (get_state_dir, environment
+variable PPICOS_STATE_DIR, default ppicos_state in the home folder), not in the output
+folder: the output folders are on an SMB share, where SQLite file locking is not
+reliable. The lock of the database (lock) is used by processes that run at the same
+time on this computer (e.g. backfill partitions), the text logfile in the output folder
+remains the shared record. If the database is lost, it is created again from the text
+logfile (without checksums). A filetype should be processed on one computer only.
+
+"""
+import contextlib
+import datetime
+import json
+import os
+import hashlib
+import sqlite3
+from pathlib import Path
+
+# Header of the text logfile
+LOGFILE_HEADER = [
+    "================================================",
+    "FILES ALREADY PROCESSED AND CREATED WITH ppicos",
+    "================================================",
+    "* Files listed here are not re-processed",
+    "* Delete files from list this enable re-processing with ppicos",
+    "------------------------------------------------",
+]
+
+# Separator between filename and creation time in the text logfile
+LOGFILE_SEPARATOR = '    created '
+
+# Seconds to wait if the database is locked by another process
+DB_TIMEOUT_SECONDS = 30
+
+# Local folder of the databases, can be set with the environment variable PPICOS_STATE_DIR
+ENV_STATE_DIR = 'PPICOS_STATE_DIR'
+STATE_DIR = Path.home() / 'ppicos_state'
+
+# File systems of network shares (/proc/mounts), SQLite locking is not reliable there
+NETWORK_FILESYSTEMS = {'cifs', 'smb3', 'smbfs', 'nfs', 'nfs4', 'afs', 'fuse.sshfs'}
+
+
+def get_state_dir() -> Path:
+    """Local folder of the databases"""
+    return Path(os.environ.get(ENV_STATE_DIR) or STATE_DIR)
+
+
+def get_dbfilepath(filegroup: str, outdir: Path) -> Path:
+    """Database of filegroup in the state folder, one database per output folder"""
+    outdir_hash = hashlib.sha1(str(Path(outdir).resolve()).encode('utf-8')).hexdigest()[:12]
+    return get_state_dir() / f"ppicos_{filegroup}_{outdir_hash}_files-already-processed.sqlite"
+
+
+def is_network_path(path: Path) -> bool:
+    """Check if path is on a network share (UNC path or CIFS/SMB/NFS mount)"""
+    if str(path).startswith(('//', '\\\\')):
+        return True
+    try:
+        with open('/proc/mounts') as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return False  # Not Linux
+    resolved = str(Path(path).resolve())
+    fstypes = [(len(mountpoint), fstype) for mountpoint, fstype in mounts
+               if resolved == mountpoint or resolved.startswith(mountpoint.rstrip('/') + '/')]
+    return bool(fstypes) and (max(fstypes)[1] in NETWORK_FILESYSTEMS)
+
+
+class ProcessedFilesStore:
+    """Names of daily files that were already created, stored in SQLite and in a text logfile"""
+
+    def __init__(self, dbfilepath: Path, logfilepath: Path):
+        self.dbfilepath = Path(dbfilepath)
+        self.logfilepath = Path(logfilepath)
+        self.dbfilepath.parent.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(self.dbfilepath, timeout=DB_TIMEOUT_SECONDS)
+        with self.con:
+            self.con.execute("CREATE TABLE IF NOT EXISTS processed ("
+                             "filename TEXT PRIMARY KEY, "
+                             "created TEXT, "
+                             "run_id TEXT, "
+                             "source_files TEXT, "
+                             "n_records INTEGER, "
+                             "sha256 TEXT, "
+                             "source_checksums TEXT)")
+            self.con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            # Databases of older versions have no checksums of source files
+            columns = {r[1] for r in self.con.execute("PRAGMA table_info(processed)")}
+            if 'source_checksums' not in columns:
+                self.con.execute("ALTER TABLE processed ADD COLUMN source_checksums TEXT")
+        self.n_synced = self._sync_with_logfile()
+
+    def close(self) -> None:
+        self.con.close()
+
+    def is_processed(self, filename: str) -> bool:
+        """Check if filename was already created"""
+        row = self.con.execute("SELECT 1 FROM processed WHERE filename = ?", (filename,)).fetchone()
+        return row is not None
+
+    def get_record(self, filename: str):
+        """Checksum of the ICOS CSV data and checksums of the source files (dict, None if
+        not known) of filename, None if filename was not created yet"""
+        row = self.con.execute("SELECT sha256, source_checksums FROM processed WHERE filename = ?",
+                               (filename,)).fetchone()
+        if row is None:
+            return None
+        return dict(sha256=row[0], source_checksums=json.loads(row[1]) if row[1] else None)
+
+    def set_source_checksums(self, source_checksums: dict) -> None:
+        """Store checksums of source files (dict per filename) for files that were already created"""
+        with self.con:
+            self.con.executemany("UPDATE processed SET source_checksums = ? WHERE filename = ?",
+                                 [(json.dumps(checksums, sort_keys=True), filename)
+                                  for filename, checksums in source_checksums.items()])
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Write lock of the database while files that are shared by several processes are
+        updated (e.g. the manifest of a month), other processes wait up to DB_TIMEOUT_SECONDS"""
+        with self.con:
+            self.con.execute("BEGIN IMMEDIATE")
+            yield
+
+    def __len__(self) -> int:
+        return self.con.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+
+    def add(self, records: list) -> None:
+        """Record created files in one transaction and append them to the text logfile
+
+        Args:
+            records: list of dicts with the keys filename, run_id, source_files
+                (list of filenames), n_records, sha256 and source_checksums (dict of
+                filenames and their checksums, None if not known)
+        """
+        if not records:
+            return
+        created = str(datetime.datetime.now())
+        with self.con:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO processed "
+                "(filename, created, run_id, source_files, n_records, sha256, source_checksums) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(r['filename'], created, r['run_id'], json.dumps(r['source_files']), r['n_records'], r['sha256'],
+                  json.dumps(r['source_checksums'], sort_keys=True) if r.get('source_checksums') else None)
+                 for r in records])
+
+            # The text logfile is written before the transaction is committed: if ppicos
+            # stops in between, the lines in the text logfile are imported in the next run
+            with open(self.logfilepath, 'a') as f:
+                for r in records:
+                    f.write(f"{r['filename']}{LOGFILE_SEPARATOR}{created}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._set_logfile_stat()
+
+    def _get_logfile_stat(self) -> str:
+        stat = os.stat(self.logfilepath)
+        return f"{stat.st_size}|{stat.st_mtime_ns}"
+
+    def _set_logfile_stat(self) -> None:
+        self.con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('logfile_stat', ?)",
+                         (self._get_logfile_stat(),))
+
+    def _sync_with_logfile(self) -> int:
+        """Synchronize database with text logfile if the text logfile was changed outside ppicos
+
+        Returns:
+            number of files that were added to or removed from the database
+        """
+        if not self.logfilepath.is_file():
+            # Create logfile if it does not exist yet (and was not created by another process)
+            try:
+                with open(self.logfilepath, 'x') as f:
+                    f.write('\n'.join(LOGFILE_HEADER) + '\n')
+            except FileExistsError:
+                pass
+        row = self.con.execute("SELECT value FROM meta WHERE key = 'logfile_stat'").fetchone()
+        if row and (row[0] == self._get_logfile_stat()):
+            return 0
+
+        with self.con:
+            # Write lock before reading, other processes (e.g. backfill partitions) wait until
+            # the database is synchronized and do not synchronize it again
+            self.con.execute("BEGIN IMMEDIATE")
+            row = self.con.execute("SELECT value FROM meta WHERE key = 'logfile_stat'").fetchone()
+            if row and (row[0] == self._get_logfile_stat()):
+                return 0
+            listed = read_logfile(logfilepath=self.logfilepath)
+            stored = {r[0] for r in self.con.execute("SELECT filename FROM processed")}
+            removed = stored - set(listed)
+            added = [(filename, created) for filename, created in listed.items() if filename not in stored]
+            self.con.executemany("DELETE FROM processed WHERE filename = ?", [(f,) for f in removed])
+            self.con.executemany("INSERT INTO processed (filename, created) VALUES (?, ?)", added)
+            self._set_logfile_stat()
+        return len(removed) + len(added)
+
+
+def read_logfile(logfilepath: Path) -> dict:
+    """Read filenames and creation times (None if not given) from text logfile"""
+    listed = {}
+    with open(logfilepath) as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if (not line.strip()) or (line in LOGFILE_HEADER):
+                continue
+            filename, _, created = line.partition(LOGFILE_SEPARATOR)
+            listed[filename.strip()] = created or None
+    return listed
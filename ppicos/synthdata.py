@@ -0,0 +1,209 @@
+"""
+Synthetic source files for the filetypes in filesettings.py
+
+Creates source files with the same structure as the files of each filetype,
+as described by its filesettings, e.g. to run ppicos or benchmark_stages.py
+without access to the file server:
+
+    filenames:      FILENAME_ID with the date of the file at FILENAME_POSITION_*,
+                    in monthly folders (e.g. 2018/08/CH-DAV_iDL_T1_35_1_TBL1_2018_08_17_0000.dat,
+                    VQAA77.201809030000 or DAV_Meteo_NABEL_180817.CSV)
+    header:         DATA_HEADER_ROWS and DATA_SKIP_ROWS, i.e. TOA5 header with file info,
+                    variable names, units and processing (quoted), header with a title
+                    row, units and an empty row (trailing separator, as in NABEL files)
+                    or one row with the variable names
+    data rows:      DATA_SEPARATOR, timestamp in DATA_TIMESTAMP_FORMAT in column
+                    DATA_TIMESTAMP_COL (columns before it contain a station ID), one
+                    record every DATA_FREQUENCY (1S to 10T), TOA5 files with RECORD column
+    variables:      variables that are renamed (DATA_RENAME_COLUMNS) or have a suffix
+                    that is removed (DATA_HEADER_REMOVE_SUFFIX_FROM_VARIABLE_NAMES), more
+                    variables up to n_columns with 1-5 decimals
+    missing data:   NA_VALUES of the readers (NAN, inf) and a gap of GAP_MINUTES in
+                    every third file
+
+There is one file per day with the data from midnight to midnight. Timestamps of
+filetypes with DATA_COMPLEMENT_WITH_PREVIOUS_DATE are 4 seconds after the full
+minute (as in 11_meteo_hut_prec files).
+
+Create files for all filetypes in start_ALL.py for the last 5 days (and today and the
+day before):
+
+    python synthdata.py OUTDIR [N_DAYS]
+
+Source files are created in OUTDIR/in/<filegroup>, filesettings for ppicos are
+returned by make_filetype (DIR_OUT_ICOS is OUTDIR/out/<filegroup>).
+
+"""
+import csv
+import datetime as dt
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import filesettings
+import readers
+import tools
+
+N_COLUMNS = 20  # Number of variables in each file (without timestamp, RECORD and station ID)
+NA_FRACTION = 0.01  # Fraction of values written as NAN
+INF_FRACTION = 0.001  # Fraction of values written as inf
+GAP_MINUTES = 30  # Missing records in every third file, starting at 05:00
+COMPLEMENT_OFFSET = pd.Timedelta(seconds=4)  # Timestamps after the full minute
+
+
+def get_filetypes() -> dict:
+    """Filesettings of all filetypes that are run with start_ALL.py"""
+    return filesettings.get_filetypes()
+
+
+def make_filename(filesettings: dict, date: dt.date) -> str:
+    """Filename for date, FILENAME_ID with date digits at FILENAME_POSITION_*
+
+    Characters of the wildcard that are not a date field are '_' between date
+    fields (e.g. 2018_08_17_0000) and '0' after the last date field.
+    """
+    prefix, _, suffix = filesettings['FILENAME_ID'].partition('*')
+    chars = list(prefix + ' ' * (filesettings['FILENAME_LENGTH'] - len(prefix) - len(suffix)) + suffix)
+    fields = [('YEAR', date.year), ('MONTH', date.month), ('DAY', date.day), ('HOUR', 0), ('MINUTE', 0)]
+    last_end = len(prefix)
+    for field, value in fields:
+        position = filesettings[f'FILENAME_POSITION_{field}']
+        if not position:
+            continue
+        start, end = position
+        chars[start:end] = f'{value:0{end - start}d}'[-(end - start):]
+        last_end = max(last_end, end)
+    return ''.join(chars[:last_end]).replace(' ', '_') + ''.join(chars[last_end:]).replace(' ', '0')
+
+
+def make_varnames(filesettings: dict, n_columns: int = N_COLUMNS) -> list:
+    """Variables that are renamed, followed by variables with suffix (if removed) or '_Avg'"""
+    renamed = list(filesettings['DATA_RENAME_COLUMNS'] or [])
+    suffixes = filesettings['DATA_HEADER_REMOVE_SUFFIX_FROM_VARIABLE_NAMES'] or ['_Avg']
+    others = [f'VAR_{ix}{suffixes[ix % len(suffixes)]}' for ix in range(max(n_columns - len(renamed), 0))]
+    return (renamed + others)[:max(n_columns, len(renamed))]
+
+
+def is_toa5(filesettings: dict) -> bool:
+    """TOA5 files from Campbell loggers, with variable names and units as header rows"""
+    return filesettings['DATA_HEADER_ROWS'] == [1, 2]
+
+
+def make_header(filesettings: dict, columns: list, units: list) -> list:
+    """Rows before the data: file info, variable names, units and processing or empty rows"""
+    sep = filesettings['DATA_SEPARATOR']
+    header_rows = filesettings['DATA_HEADER_ROWS']
+    quote = '"' if is_toa5(filesettings) else ''
+    trailing = sep if (not is_toa5(filesettings)) and (header_rows[0] > 0) else ''
+    lines = []
+    for ix in range(tools.get_first_data_row(filesettings=filesettings)):
+        if ix in header_rows:
+            row = [columns, units][header_rows.index(ix)]
+        elif ix < header_rows[0]:
+            row = ['TOA5', 'CR1000', 'CR1000', '1234', 'CR1000.Std.32', 'CPU:synthetic.CR1', '12345', 'TBL1'] \
+                if is_toa5(filesettings) else ['Synthetic data']
+        elif (len(header_rows) == 1) and (ix == header_rows[0] + 1):
+            row = units
+        else:
+            row = ['' if col in ('TIMESTAMP', 'RECORD') else ('Avg' if is_toa5(filesettings) else '')
+                   for col in columns]
+        lines.append(sep.join(f'{quote}{x}{quote}' for x in row) + trailing)
+    return lines
+
+
+def make_file(filepath: Path, filesettings: dict, start: pd.Timestamp, end: pd.Timestamp,
+              n_columns: int, rng, gap: tuple = None) -> None:
+    """Write one source file with records from start (included) to end (excluded)"""
+    timestamps = pd.date_range(start, end, freq=filesettings['DATA_FREQUENCY'], inclusive='left')
+    if gap:
+        timestamps = timestamps[(timestamps < gap[0]) | (timestamps >= gap[1])]
+    n = len(timestamps)
+    varnames = make_varnames(filesettings=filesettings, n_columns=n_columns)
+
+    data = {f'STATION_{ix}': ['DAV'] * n for ix in range(filesettings['DATA_TIMESTAMP_COL'])}
+    data['TIMESTAMP'] = timestamps.strftime(filesettings['DATA_TIMESTAMP_FORMAT'])
+    units = [''] * filesettings['DATA_TIMESTAMP_COL'] + ['TS']
+    if is_toa5(filesettings):
+        data['RECORD'] = np.arange(n)
+        units.append('RN')
+    for ix, varname in enumerate(varnames):
+        values = rng.normal(loc=10, scale=5, size=n).round(1 + ix % 5)
+        values[rng.random(n) < NA_FRACTION] = np.nan
+        values[rng.random(n) < INF_FRACTION] = np.inf
+        data[varname] = values
+        units.append('degC')
+    df = pd.DataFrame(data)
+    header = make_header(filesettings=filesettings, columns=list(df.columns), units=units)
+    if header[-1].endswith(filesettings['DATA_SEPARATOR']):
+        df[''] = ''  # Trailing separator in data rows, as in header rows
+
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(filepath, 'w', newline='') as f:
+        f.write('\n'.join(header) + '\n')
+        df.to_csv(f, sep=filesettings['DATA_SEPARATOR'], header=False, index=False, lineterminator='\n',
+                  na_rep=readers.NA_VALUES[0],
+                  quoting=csv.QUOTE_NONNUMERIC if is_toa5(filesettings) else csv.QUOTE_MINIMAL)
+
+
+def make_source_files(filesettings: dict, first_date: dt.date, last_date: dt.date, n_columns: int = N_COLUMNS,
+                      last_timestamp: dt.datetime = None, seed: int = 42) -> list:
+    """Write one file per day between first_date and last_date to DIR_SOURCE_FILES
+
+    Args:
+        last_timestamp: data of last_date end at this time (e.g. now for today's
+            file), if None the file of last_date contains the full day
+
+    Returns:
+        list of filepaths
+    """
+    rng = np.random.default_rng(seed)
+    freq = pd.Timedelta(filesettings['DATA_FREQUENCY'])
+    offset = COMPLEMENT_OFFSET if filesettings['DATA_COMPLEMENT_WITH_PREVIOUS_DATE'] else pd.Timedelta(0)
+    filepaths = []
+    for ix, date in enumerate(pd.date_range(first_date, last_date, freq='D')):
+        start = date + offset
+        end = date + pd.Timedelta(days=1) + offset
+        if (date.date() == last_date) and last_timestamp:
+            end = min(end, pd.Timestamp(last_timestamp).floor(freq) + offset)
+        gap = (date + pd.Timedelta(hours=5), date + pd.Timedelta(hours=5, minutes=GAP_MINUTES)) \
+            if ix % 3 == 1 else None
+        filepath = Path(filesettings['DIR_SOURCE_FILES']) / f'{date:%Y}' / f'{date:%m}' \
+            / make_filename(filesettings=filesettings, date=date.date())
+        make_file(filepath=filepath, filesettings=filesettings, start=start, end=end,
+                  n_columns=n_columns, rng=rng, gap=gap)
+        filepaths.append(filepath)
+    return filepaths
+
+
+def make_filetype(filesettings: dict, rootdir: Path, n_days: int, n_columns: int = N_COLUMNS,
+                  seed: int = 42) -> dict:
+    """Source files for the last n_days (search window of ppicos with max_age_days=n_days), today and
+    the day before the search window (needed for DATA_COMPLEMENT_WITH_PREVIOUS_DATE)
+
+    Returns:
+        filesettings with DIR_SOURCE_FILES rootdir/in/<filegroup> and DIR_OUT_ICOS rootdir/out/<filegroup>
+    """
+    filesettings = dict(filesettings)
+    filesettings['DIR_SOURCE_FILES'] = Path(rootdir) / 'in' / filesettings['FILE_FILEGROUP']
+    filesettings['DIR_OUT_ICOS'] = Path(rootdir) / 'out' / filesettings['FILE_FILEGROUP']
+    filesettings['DIR_OUT_ICOS'].mkdir(parents=True, exist_ok=True)
+    now = dt.datetime.now()
+    make_source_files(filesettings=filesettings, first_date=now.date() - dt.timedelta(days=n_days + 1),
+                      last_date=now.date(), n_columns=n_columns, last_timestamp=now, seed=seed)
+    return filesettings
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit(f"usage: python {Path(__file__).name} OUTDIR [N_DAYS]")
+    rootdir = Path(sys.argv[1])
+    n_days = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    for filetype, filesettings in get_filetypes().items():
+        filesettings = make_filetype(filesettings=filesettings, rootdir=rootdir, n_days=n_days)
+        print(f"{filetype:<28} {filesettings['DIR_SOURCE_FILES']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Fast parsing of fixed-width timestamps
+
+The timestamps in the source files have a fixed width, e.g. "201809030525"
+for the format "%Y%m%d%H%M". Instead of parsing each timestamp separately,
+all timestamps are converted to an array of characters and the date components
+are read from their fixed positions in one vectorized step.
+
+Only the directives %Y, %m, %d, %H, %M and %S are supported, all other characters
+in the format are treated as literal characters. ISO formats such as
+"%Y-%m-%d %H:%M:%S" are parsed with the (fast) ISO parser of pandas. For other
+formats, and for timestamps that do not have the expected width
+(e.g. "9.11.2018 23:12"), pandas is used. Timestamps that cannot be parsed
+are returned as NaT.
+
+"""
+import numpy as np
+import pandas as pd
+
+# Number of characters for each supported directive
+DIRECTIVE_WIDTHS = {'Y': 4, 'm': 2, 'd': 2, 'H': 2, 'M': 2, 'S': 2}
+
+# Formats that pandas parses with its own ISO 8601 parser
+ISO_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']
+
+
+def compile_format(timestamp_format: str):
+    """Get positions of date components and literal characters in fixed-width format
+
+    Returns:
+        dict with the width of the timestamp, the positions (start, end) of the
+        date components and the positions of literal characters, or None
+        if the format is not supported
+    """
+    components = {}
+    literals = []
+    pos = 0
+    ix = 0
+    while ix < len(timestamp_format):
+        char = timestamp_format[ix]
+        if char == '%':
+            if ix + 1 >= len(timestamp_format):
+                return None
+            directive = timestamp_format[ix + 1]
+            if (directive not in DIRECTIVE_WIDTHS) or (directive in components):
+                return None
+            width = DIRECTIVE_WIDTHS[directive]
+            components[directive] = (pos, pos + width)
+            pos += width
+            ix += 2
+        else:
+            literals.append((pos, char))
+            pos += 1
+            ix += 1
+    if not all(d in components for d in ['Y', 'm', 'd']):
+        return None
+    return dict(width=pos, components=components, literals=literals)
+
+
+def _parse_fixed_width(values: np.ndarray, is_str: np.ndarray, fmt: dict) -> tuple:
+    """Parse timestamps with fixed-width format
+
+    Returns:
+        datetime64[ns] array (NaT where parsing was not possible) and boolean array
+        that is True where parsing was possible
+    """
+    width = fmt['width']
+    n = len(values)
+
+    # Strings as matrix of characters (unicode code points), one row per timestamp,
+    # one additional character is kept to detect strings that are too long
+    chars = np.where(is_str, values, '').astype(f'U{width + 1}').view(np.uint32).reshape(n, width + 1)
+
+    # Strings are padded with zeros, i.e. last character must be zero and the one before not
+    ok = is_str & (chars[:, width] == 0) & (chars[:, width - 1] != 0)
+    for pos, char in fmt['literals']:
+        ok &= chars[:, pos] == ord(char)
+
+    # Date components from digits
+    parts = {}
+    for directive, (start, end) in fmt['components'].items():
+        value = np.zeros(n, dtype=np.int64)
+        for pos in range(start, end):
+            digit = chars[:, pos].astype(np.int64) - ord('0')
+            ok &= (digit >= 0) & (digit <= 9)
+            value = value * 10 + digit
+        parts[directive] = value
+
+    year = parts['Y']
+    month = parts['m']
+    day = parts['d']
+    hour = parts.get('H', np.zeros(n, dtype=np.int64))
+    minute = parts.get('M', np.zeros(n, dtype=np.int64))
+    second = parts.get('S', np.zeros(n, dtype=np.int64))
+    ok &= (year >= 1678) & (year <= 2261)  # Range of datetime64[ns]
+    ok &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    ok &= (hour <= 23) & (minute <= 59) & (second <= 59)
+
+    # Build datetime64 from components, invalid rows are replaced with a valid date first
+    year = np.where(ok, year, 1970)
+    month = np.where(ok, month, 1)
+    day = np.where(ok, day, 1)
+    months = (year - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (month - 1)
+    days = months.astype('datetime64[D]') + (day - 1)
+    ok &= days.astype('datetime64[M]') == months  # e.g. 31 April
+    seconds = hour * 3600 + minute * 60 + second
+    result = days.astype('datetime64[ns]') + (seconds * 1_000_000_000).astype('timedelta64[ns]')
+    result[~ok] = np.datetime64('NaT')
+    return result, ok
+
+
+def parse_timestamps(values, timestamp_format: str) -> pd.DatetimeIndex:
+    """Parse timestamps, values that cannot be parsed are NaT
+
+    Gives the same result as pd.to_datetime(values, format=timestamp_format, errors='coerce')
+    """
+    values = np.asarray(values, dtype=object)
+    fmt = compile_format(timestamp_format=timestamp_format)
+    if (fmt is None) or (timestamp_format in ISO_FORMATS):
+        return pd.DatetimeIndex(pd.to_datetime(values, format=timestamp_format, errors='coerce'))
+
+    is_str = pd.notna(values)
+    result, ok = _parse_fixed_width(values=values, is_str=is_str, fmt=fmt)
+
+    # Values that did not match the fixed width are parsed by pandas,
+    # pandas accepts e.g. days without leading zero
+    retry = ~ok & is_str
+    if retry.any():
+        result[retry] = pd.to_datetime(values[retry], format=timestamp_format, errors='coerce').values
+    return pd.DatetimeIndex(result)
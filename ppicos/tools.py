@@ -1,11 +1,20 @@
 import datetime as dt
+import fnmatch
 import hashlib
 import ntpath
 import os
+import re
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
+# Timestamps are grouped by day with integer day codes (days since 1970-01-01)
+NS_PER_DAY = 86_400 * 10 ** 9
+EPOCH_DATE = dt.date(1970, 1, 1)
+
 
 def set_search_window(max_age_days: int = 5) -> tuple[dt.date, dt.date]:
     """Set start and end date for file search"""
@@ -50,12 +59,12 @@ def make_run_id():
 
 
 def print_settings_dict(settings_dict, logger):
-    """ Prints the contents of a settings_dict in a more readable form. """
+    """ Prints the contents of a settings_dict in a more readable form, single settings at log level DEBUG """
 
     logger.log_info("\n\n-----------------------------------------------")
-    logger.log_info("FOUND SETTINGS FOR THIS RUN")
-    for d in settings_dict:
-        logger.log_info("{}: {}".format(d, settings_dict[d]))
+    logger.log_info("FOUND {} SETTINGS FOR THIS RUN".format(len(settings_dict)))
+    if logger.is_debug():
+        logger.log_debug("\n".join("{}: {}".format(d, settings_dict[d]) for d in settings_dict))
     logger.log_info("-----------------------------------------------")
     return None
 
@@ -82,22 +91,74 @@ def get_subdir_from_date(date, outpath):
     return outpath
 
 
+def get_day_codes(index: pd.DatetimeIndex) -> np.ndarray:
+    """Day of each timestamp as number of days since 1970-01-01 (int64)"""
+    return index.asi8 // NS_PER_DAY
+
+
+def day_code_to_date(day_code: int) -> dt.date:
+    return EPOCH_DATE + dt.timedelta(days=int(day_code))
+
+
+def get_day_bounds(index: pd.DatetimeIndex) -> dict:
+    """Row positions (start, end) of each day in a sorted timestamp index, keys are the dates"""
+    day_codes = get_day_codes(index=index)
+    unique_day_codes = np.unique(day_codes)
+    starts = np.searchsorted(day_codes, unique_day_codes, side='left')
+    ends = np.searchsorted(day_codes, unique_day_codes, side='right')
+    return {day_code_to_date(day_code=day_code): (int(start), int(end))
+            for day_code, start, end in zip(unique_day_codes, starts, ends)}
+
+
+# Timestamp formats that are built from integer components (number of digits),
+# other formats are generated with strftime
+NUMERIC_TIMESTAMP_FORMATS = {'%Y%m%d%H%M': 12, '%Y%m%d%H%M%S': 14}
+
+
+def format_timestamps(timestamps: pd.DatetimeIndex, fmt: str) -> np.ndarray:
+    """Timestamps as strings, the same as strftime (object array, NaN for missing timestamps)
+
+    The numeric formats in NUMERIC_TIMESTAMP_FORMATS are generated from the year, month,
+    day, hour, minute and second as integers, e.g. 2018-10-23 13:45:00 is 201810231345.
+    """
+    timestamps = pd.DatetimeIndex(timestamps)
+    n_digits = NUMERIC_TIMESTAMP_FORMATS.get(fmt)
+    if n_digits is None:
+        return timestamps.strftime(fmt).to_numpy(dtype=object)
+
+    is_nat = timestamps.isna()
+    dates = np.where(is_nat, 0, get_day_codes(index=timestamps)).astype('datetime64[D]')
+    months_since_epoch = dates.astype('datetime64[M]')
+    years = months_since_epoch.astype('datetime64[Y]').astype(np.int64) + 1970
+    months = months_since_epoch.astype(np.int64) % 12 + 1
+    days = (dates - months_since_epoch).astype(np.int64) + 1
+    seconds_of_day = (timestamps.asi8 % NS_PER_DAY) // 10 ** 9
+    number = (((years * 100 + months) * 100 + days) * 100 + seconds_of_day // 3600) * 100 \
+        + seconds_of_day // 60 % 60
+    if n_digits == 14:
+        number = number * 100 + seconds_of_day % 60
+    strings = number.astype(f'U{n_digits}').astype(object)
+    strings[is_nat] = np.nan
+    return strings
+
+
 def check_if_path_exists(path):
     if os.path.isdir(path):
         pass
     else:
-        os.makedirs(path)
+        os.makedirs(path, exist_ok=True)  # Can be created by another process in the meantime
 
     return None
 
 
-def hash_value_for_file(file_full_path):
+def hash_value_for_file(file_full_path) -> str:
+    """SHA-256 checksum (hex) of the file content, the file is read in blocks"""
     # https://tutorials.technology/tutorials/51-How-to-calculate-hash-of-big-files-with-python.html
 
     block_size = 2 ** 20
 
     with open(file_full_path, 'rb') as input_file:
-        sha1 = hashlib.sha1()
+        sha256 = hashlib.sha256()
 
         while True:
             # we use the read passing the size of the block to avoid heavy ram usage
@@ -105,9 +166,15 @@ def hash_value_for_file(file_full_path):
             if not data:
                 break  # if we don't have any more data to read, stop.
             # we partially calculate the hash
-            sha1.update(data)
+            sha256.update(data)
+
+    return sha256.hexdigest()
 
-    return sha1.digest()
+
+def get_first_data_row(filesettings: dict) -> int:
+    """Index of the first row with data in a source file (after header rows and skipped rows)"""
+    skiprows = filesettings['DATA_SKIP_ROWS'] if filesettings['DATA_SKIP_ROWS'] else []
+    return max(filesettings['DATA_HEADER_ROWS'] + skiprows) + 1
 
 
 def get_datetime_from_filename(filename: str, filesettings: dict):
@@ -130,3 +197,47 @@ def get_datetime_from_filename(filename: str, filesettings: dict):
     else:
         f_datetime = dt.datetime(f_year, f_month, f_day)
     return f_datetime
+
+
+def get_datetimes_from_filenames(filenames: list, filesettings: dict) -> pd.DatetimeIndex:
+    """Get datetimes from many filenames at once, same result as get_datetime_from_filename"""
+    filenames = pd.Series(filenames, dtype=object)
+
+    def _get_number(position):
+        return filenames.str.slice(position[0], position[1]).astype('int64')
+
+    # in case the year is only given as 2 digits (e.g. 18 instead of 2018), see get_datetime_from_filename
+    f_year = _get_number(filesettings['FILENAME_POSITION_YEAR'])
+    f_year = f_year.where(~f_year.between(10, 99), f_year + 2000)
+
+    parts = dict(year=f_year,
+                 month=_get_number(filesettings['FILENAME_POSITION_MONTH']),
+                 day=_get_number(filesettings['FILENAME_POSITION_DAY']))
+    if filesettings['FILENAME_POSITION_HOUR']:
+        parts['hour'] = _get_number(filesettings['FILENAME_POSITION_HOUR'])
+        parts['minute'] = _get_number(filesettings['FILENAME_POSITION_MINUTE'])
+    return pd.DatetimeIndex(pd.to_datetime(pd.DataFrame(parts)))
+
+
+def compile_filename_id(filename_id: str) -> re.Pattern:
+    """Compile filename pattern (e.g. 'CH-DAV_iDL_T1_35_1_TBL1_*.dat'), matches the same names as fnmatch.fnmatch"""
+    # fnmatch.fnmatch ignores case where the file system does (Windows)
+    flags = re.IGNORECASE if os.path.normcase('A') == 'a' else 0
+    return re.compile(fnmatch.translate(filename_id), flags)
+
+
+@contextmanager
+def atomic_filepath(filepath: Path):
+    """Temporary file in the same folder, renamed to filepath when it was written completely
+
+    Other programs (e.g. the transfer to ICOS) never see incomplete files. If writing
+    fails, the temporary file is deleted.
+    """
+    tmpfilepath = filepath.with_name(f"{filepath.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        yield tmpfilepath
+    except BaseException:
+        if tmpfilepath.is_file():
+            os.remove(tmpfilepath)
+        raise
+    os.replace(tmpfilepath, filepath)
@@ -0,0 +1,12 @@
+"""
+Databases of already-processed files (statestore.py) are created in the temporary folder of each test
+"""
+import pytest
+
+import statestore
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv(statestore.ENV_STATE_DIR, str(tmp_path / 'state'))
+    return tmp_path / 'state'
@@ -0,0 +1,74 @@
+"""
+Parsed files are only re-used if the source file did not change (size and modification
+time) and if they were parsed with the same data types. The cache is limited in size,
+the least recently used files are deleted first.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+import cache
+import filesettings
+
+
+def make_df(value: float) -> pd.DataFrame:
+    return pd.DataFrame({'VAR': [value]}, index=pd.DatetimeIndex(['2023-01-01 00:00:10'], name='TIMESTAMP'))
+
+
+def test_key_includes_dtypes(tmp_path):
+    filepath = tmp_path / 'source.dat'
+    filepath.write_text('TIMESTAMP,VAR\n2023-01-01 00:00:10,ERR\n')
+    parsed_cache = cache.ParsedFileCache(filesettings=filesettings.f_10_meteo(), cachedir=tmp_path / 'cache')
+    df = pd.DataFrame({'VAR': ['ERR']}, index=pd.DatetimeIndex(['2023-01-01 00:00:10'], name='TIMESTAMP'))
+    text_dtypes = dict(columns=['VAR'], dtypes={0: str, 1: str})
+    numeric_dtypes = dict(columns=['VAR'], dtypes={0: str, 1: np.float64})
+
+    parsed_cache.store(filepath=filepath, df=df, dtypes=text_dtypes)
+    assert parsed_cache.load(filepath=filepath, dtypes=numeric_dtypes) is None
+    assert parsed_cache.load(filepath=filepath, dtypes=None) is None
+    assert parsed_cache.load(filepath=filepath, dtypes=text_dtypes).equals(df)
+
+
+def test_changed_file_is_not_reused(tmp_path):
+    filepath = tmp_path / 'source.dat'
+    filepath.write_text('TIMESTAMP,VAR\n2023-01-01 00:00:10,1.0\n')
+    os.utime(filepath, ns=(1_000_000_000, 1_000_000_000))
+    parsed_cache = cache.ParsedFileCache(filesettings=filesettings.f_10_meteo(), cachedir=tmp_path / 'cache')
+    parsed_cache.store(filepath=filepath, df=make_df(1.0))
+    assert parsed_cache.load(filepath=filepath).equals(make_df(1.0))
+
+    # Same size, other modification time
+    filepath.write_text('TIMESTAMP,VAR\n2023-01-01 00:00:10,2.0\n')
+    os.utime(filepath, ns=(2_000_000_000, 2_000_000_000))
+    assert parsed_cache.load(filepath=filepath) is None
+
+    # Same modification time, other size
+    parsed_cache.store(filepath=filepath, df=make_df(2.0))
+    filepath.write_text('TIMESTAMP,VAR\n2023-01-01 00:00:10,20.0\n')
+    os.utime(filepath, ns=(2_000_000_000, 2_000_000_000))
+    assert parsed_cache.load(filepath=filepath) is None
+
+
+def test_evict_least_recently_used(tmp_path):
+    parsed_cache = cache.ParsedFileCache(filesettings=filesettings.f_10_meteo(), cachedir=tmp_path / 'cache')
+    filepaths = []
+    for n in range(3):
+        filepath = tmp_path / f'source_{n}.dat'
+        filepath.write_text(f'TIMESTAMP,VAR\n2023-01-01 00:00:10,{n}.0\n')
+        parsed_cache.store(filepath=filepath, df=make_df(float(n)))
+        cachefilepath = parsed_cache._cachefilepath(filepath=filepath)
+        os.utime(cachefilepath, (1000 * (n + 1), 1000 * (n + 1)))
+        filepaths.append(filepath)
+
+    # Loading marks the oldest file as recently used, the second file is now the oldest
+    assert parsed_cache.load(filepath=filepaths[0]) is not None
+    cachefiles = list((tmp_path / 'cache').iterdir())
+    parsed_cache.max_size_bytes = sum(f.stat().st_size for f in cachefiles) - 1
+    assert parsed_cache.evict() == 1
+    assert parsed_cache.load(filepath=filepaths[1]) is None
+    assert parsed_cache.load(filepath=filepaths[0]) is not None
+    assert parsed_cache.load(filepath=filepaths[2]) is not None
+
+    # Nothing is deleted if the cache is smaller than max size
+    assert parsed_cache.evict() == 0
@@ -0,0 +1,140 @@
+"""
+The fast ICOS CSV writer (icoscsv.IcosCsvWriter) must create files that are
+byte-identical to the files created with pandas:
+
+    df.to_csv(quoting=csv.QUOTE_NONNUMERIC, index=False, na_rep='NaN', lineterminator='\\r\\n')
+
+Run the tests after changes to icoscsv.py, compact.py or tools.format_timestamps or
+after updating pandas or numpy:
+
+    python -m pytest tests
+
+"""
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import compact
+import icoscsv
+import tools
+
+
+def to_csv_reference(df: pd.DataFrame, header: bool = True) -> bytes:
+    """ICOS CSV written by pandas, independent of icoscsv.to_csv_pandas"""
+    buf = io.StringIO()
+    df.to_csv(buf, quotechar='"', quoting=csv.QUOTE_NONNUMERIC, index=False, header=header,
+              na_rep='NaN', lineterminator='\r\n')
+    return buf.getvalue().encode('utf-8')
+
+
+def assert_same_as_pandas(df: pd.DataFrame, header: bool = True, bounds: list = None) -> None:
+    if bounds is None:
+        bounds = [(0, len(df))]
+    contents = icoscsv.IcosCsvWriter(header=header).serialize(df=df, bounds=bounds)
+    for (start, end), content in zip(bounds, contents):
+        assert content == to_csv_reference(df=df.iloc[start:end], header=header), \
+            f"records {start}-{end} are different"
+
+
+def make_edge_cases() -> pd.DataFrame:
+    floats = [0.0, -0.0, 1.0, -7.0, 100.0, 0.1, 0.05, 1.5, 2.5, 1234567.125, 1e-4, 9.9999e-05, 1e-5,
+              0.00010000000000000002, 5e-324, 999999999999999.0, 1e15, 1e16, 123456789012345.0,
+              0.1 + 0.2, 1 / 3, 2 ** 0.5, 1.7976931348623157e308, np.inf, -np.inf, np.nan]
+    n = len(floats)
+    timestamps = pd.date_range('2018-10-23 00:00:00', periods=n, freq='30min').to_series(index=range(n))
+    timestamps.iloc[[3, 7]] = pd.NaT
+    text = ['ok', 'say "hi"', 'a,b', 'µmol m-2 s-1', '', 'NaN', 'nan'] * 4
+    df = pd.DataFrame({
+        ('TIMESTAMP', 'TS'): timestamps.dt.strftime('%Y%m%d%H%M%S'),
+        ('FLOAT', 'units'): floats,
+        ('NEGATIVE', 'units'): [-x for x in floats],
+        ('FLOAT32', 'units'): np.clip(floats, -1e38, 1e38).astype(np.float32),
+        ('INT', 'units'): range(n),
+        ('BOOL', 'units'): [True, False] * (n // 2),
+        ('TEXT', 'Unnamed: 6_level_1'): (text[:n - 2] + [np.nan, None]),
+        ('_TIMESTAMP_OLD', ''): timestamps
+    })
+    df.columns = pd.MultiIndex.from_tuples(df.columns)
+    return df
+
+
+def make_dates_only() -> pd.DataFrame:
+    dates = pd.Series(pd.date_range('2018-10-01', periods=10, freq='D'))
+    dates.iloc[4] = pd.NaT
+    return pd.DataFrame({'VALUE': np.arange(10) * 0.25, 'DATE': dates})
+
+
+def make_random_floats() -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    n = 100000
+    bit_patterns = rng.integers(0, 2 ** 63, n, dtype=np.int64).view(np.float64)
+    scaled = rng.normal(size=n) * 10.0 ** rng.integers(-8, 18, n)
+    rounded = (rng.normal(size=n) * 10.0 ** rng.integers(-3, 10, n)).round(rng.integers(0, 12))
+    return pd.DataFrame({'BITS': bit_patterns, 'SCALED': scaled, 'ROUNDED': rounded})
+
+
+def make_10_meteo_day() -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    timestamps = pd.Series(pd.date_range('2018-10-23 00:00:10', periods=8640, freq='10S'))
+    df = pd.DataFrame({('TIMESTAMP', 'TS'): timestamps.dt.strftime('%Y%m%d%H%M%S'),
+                       ('RECORD', 'RN'): np.arange(8640, dtype=np.float64)})
+    for i in range(60):
+        values = rng.normal(loc=10, scale=5, size=8640).round(rng.integers(2, 6))
+        values[rng.random(8640) < 0.01] = np.nan
+        df[(f'VAR_{i}_Avg', 'degC')] = values
+    df[('_TIMESTAMP_OLD', '')] = timestamps
+    df.columns = pd.MultiIndex.from_tuples(df.columns)
+    return df
+
+
+@pytest.mark.parametrize('header', [True, False])
+def test_edge_cases(header):
+    assert_same_as_pandas(df=make_edge_cases(), header=header)
+
+
+def test_edge_cases_split_in_3_files():
+    df = make_edge_cases()
+    assert_same_as_pandas(df=df, bounds=[(0, 5), (5, 6), (6, len(df))])
+
+
+def test_dates_only():
+    assert_same_as_pandas(df=make_dates_only())
+
+
+def test_random_floats():
+    assert_same_as_pandas(df=make_random_floats())
+
+
+def test_10_meteo_day():
+    assert_same_as_pandas(df=make_10_meteo_day())
+
+
+def test_10_meteo_day_split_in_4_files():
+    assert_same_as_pandas(df=make_10_meteo_day(), bounds=[(0, 2160), (2160, 4320), (4320, 6480), (6480, 8640)])
+
+
+def test_check_conformance():
+    assert icoscsv.check_conformance(df=make_edge_cases())
+
+
+@pytest.mark.parametrize('make_df', [make_random_floats, make_10_meteo_day])
+def test_compact_dtypes(make_df):
+    """Data stored with compact data types and restored before writing give the same file"""
+    df = make_df()
+    writer = icoscsv.IcosCsvWriter()
+    assert writer.to_bytes(df=compact.restore_dtypes(df=compact.compact_dtypes(df=df))) == writer.to_bytes(df=df)
+
+
+@pytest.mark.parametrize('timestamps', [
+    pd.DatetimeIndex(np.random.default_rng(42).integers(pd.Timestamp.min.value, pd.Timestamp.max.value, 100000))
+    .insert(0, pd.NaT),
+    pd.date_range('2018-10-23 00:00:10', periods=8640, freq='10S')
+], ids=['random', '10_meteo day'])
+def test_format_timestamps(timestamps):
+    """ICOS timestamps formatted from integer components give the same text as strftime"""
+    for fmt in tools.NUMERIC_TIMESTAMP_FORMATS:
+        expected = pd.Series(timestamps).dt.strftime(fmt)
+        assert pd.Series(tools.format_timestamps(timestamps=timestamps, fmt=fmt), dtype=object).equals(expected)
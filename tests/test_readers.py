@@ -0,0 +1,44 @@
+"""
+Numeric columns are detected from the first file that is read (readers.infer_dtypes),
+all other columns are detected for each file. A column with text in the first file
+must still be numeric in the other files.
+"""
+import datetime as dt
+
+import numpy as np
+import pytest
+
+import filesettings
+import readers
+import synthdata
+from main import IcosFormat
+
+
+@pytest.mark.parametrize('backend', [
+    'pandas',
+    pytest.param('pyarrow', marks=pytest.mark.skipif(not readers.pacsv, reason='pyarrow is not installed'))
+])
+def test_text_value_in_first_file(tmp_path, backend):
+    settings = dict(filesettings.f_10_meteo())
+    settings['DIR_SOURCE_FILES'] = tmp_path / 'in'
+    settings['DIR_OUT_ICOS'] = tmp_path / 'out'
+    settings['DIR_OUT_ICOS'].mkdir()
+    settings['READ_BACKEND'] = backend
+    filepaths = synthdata.make_source_files(filesettings=settings, first_date=dt.date(2023, 1, 1),
+                                            last_date=dt.date(2023, 1, 3), n_columns=3)
+
+    # Text in column VAR_1_Avg of the first file only
+    lines = filepaths[0].read_text().split('\n')
+    values = lines[10].split(',')
+    values[3] = '"ERR"'
+    lines[10] = ','.join(values)
+    filepaths[0].write_text('\n'.join(lines))
+
+    icosformat = IcosFormat(filesettings=settings, max_age_days=5, use_cache=False)
+    file_dfs = icosformat._readfiles_parallel(filepaths=filepaths, section_name='[test]')
+    col = ('VAR_1_Avg', 'degC')
+    assert file_dfs[0][col].dtype == object
+    assert file_dfs[0][col].iloc[6] == 'ERR'
+    for df in file_dfs[1:]:
+        assert df[col].dtype == np.float64
+        assert df.dtypes.eq(np.float64).all()